@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 
+from celery.schedules import crontab
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -90,6 +92,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock at BEGIN so concurrent withdrawals queue up on
+            # the busy timeout instead of failing when upgrading a read lock.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -131,6 +139,9 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 STATICFILES_DIRS = [
     BASE_DIR / 'static/dist',  # Arquivos compilados (produção)
     BASE_DIR / 'static/src',   # Arquivos fonte (desenvolvimento)
@@ -159,8 +170,20 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'inventory.tasks.check_alerts',
         'schedule': 1800.0,  # 30 minutes in seconds
     },
+    'create-audit-partitions-daily': {
+        'task': 'inventory.tasks.create_audit_partitions',
+        'schedule': 86400.0,
+    },
+    'rebuild-movement-rollups-nightly': {
+        'task': 'inventory.tasks.rebuild_movement_rollups',
+        'schedule': crontab(hour=3, minute=0),
+    },
 }
 
+# Label sheets: processes used to render uncached QR codes (None = CPU count).
+# The pool is started on first use and shared by the requests of a web process.
+LABEL_SHEET_WORKERS = None
+
 # Django Rest Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -170,8 +193,42 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'inventory.pagination.StandardPageNumberPagination',
+    'PAGE_SIZE': 50,
 }
 
+# Upper bound for the ?page_size= query parameter on paginated endpoints
+API_MAX_PAGE_SIZE = 500
+
+# Hand committed audit events to the Celery worker instead of inserting them
+# in the web process. Falls back to a direct insert if the broker is down.
+# Either way audit events are written after the commit, on a best-effort basis.
+AUDIT_LOG_ASYNC = False
+
+# Evaluate the alerts of the reagents touched by a stock change in the Celery
+# worker instead of right after the commit. Falls back to inline if the broker is down.
+ALERT_EVALUATION_ASYNC = False
+
+# Number of reagent id ranges the periodic alert scan is split into, each
+# evaluated by its own task; at least the worker pool's concurrency.
+ALERT_SCAN_SHARDS = 8
+
+# Days (counting today) the nightly movement rollup rebuild recomputes; the
+# rollups are kept current on every movement write, so this only repairs
+# drift. None rebuilds the whole history.
+MOVEMENT_ROLLUP_REBUILD_DAYS = 35
+
+# Report jobs (POST /api/v1/reports/jobs/) write their files to this
+# directory under MEDIA_ROOT; an identical request within REPORT_JOB_TTL
+# seconds reuses the previous job.
+REPORT_JOB_DIR = 'reports'
+REPORT_JOB_TTL = 3600
+
+# Full months of audit log kept in the database (besides the current one);
+# older months are moved to AUDIT_ARCHIVE_DIR by `manage.py archive_audit_log`.
+AUDIT_LOG_RETENTION_MONTHS = 24
+AUDIT_ARCHIVE_DIR = BASE_DIR / 'audit_archive'
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
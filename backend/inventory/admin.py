@@ -10,29 +10,39 @@ class UserAdmin(admin.ModelAdmin):
 @admin.register(Reagent)
 class ReagentAdmin(admin.ModelAdmin):
     list_display = ('name', 'sku', 'category', 'supplier', 'min_stock_level')
+    list_select_related = ('category', 'supplier')
     list_filter = ('category', 'supplier')
     search_fields = ('name', 'sku')
 
 @admin.register(StockLot)
 class StockLotAdmin(admin.ModelAdmin):
     list_display = ('reagent', 'lot_number', 'location', 'current_quantity', 'expiry_date')
+    list_select_related = ('reagent', 'location')
     list_filter = ('location', 'expiry_date')
     search_fields = ('reagent__name', 'lot_number')
 
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
     list_display = ('name', 'reagent', 'alert_type', 'threshold_value', 'is_active')
+    list_select_related = ('reagent',)
     list_filter = ('alert_type', 'is_active')
     search_fields = ('name', 'reagent__name')
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ('user', 'message', 'is_read', 'created_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('alert', 'lot')
     list_filter = ('is_read', 'user')
     search_fields = ('message',)
 
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'user', 'timestamp')
+    list_select_related = ('stock_lot__reagent', 'user')
+    list_filter = ('move_type',)
+
 # Register other models with default admin
 admin.site.register(Category)
 admin.site.register(Supplier)
 admin.site.register(Location)
-admin.site.register(StockMovement)
\ No newline at end of file
@@ -0,0 +1,204 @@
+import datetime
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from inventory.models import Alert, Notification, StockLot
+from inventory.utils import CommitBatch
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BATCH_SIZE = 1000
+UNREAD_COUNT_KEY = 'notifications:unread:{user_id}'
+# Date (ISO) of the last periodic expiry scan; without it the next scan
+# checks every lot inside the alert windows.
+EXPIRY_SCAN_KEY = 'alerts:expiry-scan:last-date'
+
+
+def _low_stock_message(reagent_name, total_quantity, threshold):
+    return (
+        f"Alerta de estoque baixo para {reagent_name}. "
+        f"Quantidade atual: {total_quantity}, Limite: {threshold}."
+    )
+
+
+def _expiry_message(reagent_name, lot_number, expiry_date):
+    return (
+        f"Alerta de validade para {reagent_name} (Lote: {lot_number}). "
+        f"Vence em: {expiry_date.strftime('%d/%m/%Y')}."
+    )
+
+
+def evaluate_alerts(reagent_ids=None, today=None, alert_types=None, expiry_since=None):
+    """
+    Evaluates the active alerts (of `reagent_ids` and `alert_types`, or all)
+    with a fixed number of queries: one for the alerts with their reagent's
+    stock total, one for the lots inside the widest expiry window, one for the
+    recipients, then a bulk upsert of the notifications.
+
+    Each notification is keyed by (alert, lot, condition, period), where the
+    period of a low-stock condition is the day it was found and that of an
+    expiring lot is its expiry date. A key a user already has, read or not,
+    only gets its message refreshed, so repeated evaluations do not pile up
+    notifications.
+
+    With `expiry_since`, expiry alerts only consider lots whose window
+    (expiry date minus the alert's days) opened after that date.
+
+    Returns counts of the alerts evaluated, the ones triggered and the
+    notifications upserted.
+    """
+    today = today or timezone.localdate()
+    alerts = Alert.objects.filter(is_active=True)
+    if reagent_ids is not None:
+        alerts = alerts.filter(reagent_id__in=reagent_ids)
+    if alert_types is not None:
+        alerts = alerts.filter(alert_type__in=alert_types)
+    # The stock summary already holds the per-reagent total, so the low-stock
+    # check is a join instead of a Sum per alert.
+    rows = list(alerts.values_list(
+        'id', 'reagent_id', 'reagent__name', 'alert_type', 'threshold_value',
+        'reagent__stock_summary__total_quantity',
+    ))
+
+    messages = defaultdict(list)
+    expiry_alerts = []
+    for alert_id, reagent_id, reagent_name, alert_type, threshold, total_quantity in rows:
+        if alert_type == 'low_stock':
+            total_quantity = total_quantity if total_quantity is not None else Decimal(0)
+            if total_quantity < threshold:
+                messages[alert_id].append((
+                    Notification.make_dedupe_key(alert_id, alert_type, today), None,
+                    _low_stock_message(reagent_name, total_quantity, threshold),
+                ))
+        elif alert_type == 'expiry_date':
+            window = datetime.timedelta(days=int(threshold))
+            # Lots expiring in (after, until] are in the window and were not already in it at expiry_since.
+            after = expiry_since + window if expiry_since else None
+            expiry_alerts.append((alert_id, reagent_id, reagent_name, after, today + window))
+
+    if expiry_alerts:
+        lots = StockLot.objects.filter(
+            reagent_id__in={alert[1] for alert in expiry_alerts},
+            current_quantity__gt=0,
+            expiry_date__lte=max(alert[4] for alert in expiry_alerts),
+        )
+        if expiry_since:
+            lots = lots.filter(expiry_date__gt=min(alert[3] for alert in expiry_alerts))
+        lots_by_reagent = defaultdict(list)
+        for lot_id, reagent_id, lot_number, expiry_date in lots.order_by('expiry_date', 'id').values_list(
+            'id', 'reagent_id', 'lot_number', 'expiry_date'
+        ):
+            lots_by_reagent[reagent_id].append((lot_id, lot_number, expiry_date))
+        for alert_id, reagent_id, reagent_name, after, until in expiry_alerts:
+            for lot_id, lot_number, expiry_date in lots_by_reagent[reagent_id]:
+                if expiry_date <= until and (after is None or expiry_date > after):
+                    messages[alert_id].append((
+                        Notification.make_dedupe_key(alert_id, 'expiry_date', expiry_date, lot_id), lot_id,
+                        _expiry_message(reagent_name, lot_number, expiry_date),
+                    ))
+
+    notifications = []
+    if messages:
+        recipients = defaultdict(list)
+        for alert_id, user_id in Alert.users_to_notify.through.objects.filter(
+            alert_id__in=messages
+        ).values_list('alert_id', 'user_id'):
+            recipients[alert_id].append(user_id)
+        notifications = [
+            Notification(user_id=user_id, alert_id=alert_id, lot_id=lot_id, dedupe_key=key, message=message)
+            for alert_id, alert_messages in messages.items()
+            for key, lot_id, message in alert_messages
+            for user_id in recipients[alert_id]
+        ]
+        Notification.objects.bulk_create(
+            notifications, batch_size=NOTIFICATION_BATCH_SIZE, update_conflicts=True,
+            unique_fields=['dedupe_key', 'user'], update_fields=['message'],
+        )
+        invalidate_unread_counts({notification.user_id for notification in notifications})
+
+    return {'alerts': len(rows), 'triggered': len(messages), 'notifications': len(notifications)}
+
+
+def get_unread_count(user_id):
+    """
+    The user's unread notification count, counted through
+    notification_user_unread_idx on a cache miss and cached until one of the
+    user's notifications changes.
+    """
+    return cache.get_or_set(
+        UNREAD_COUNT_KEY.format(user_id=user_id),
+        lambda: Notification.objects.filter(user_id=user_id, is_read=False).count(),
+        timeout=None,
+    )
+
+
+def invalidate_unread_counts(user_ids, using=None):
+    """Drops the cached unread counts of `user_ids` once the current transaction commits."""
+    keys = [UNREAD_COUNT_KEY.format(user_id=user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys), using=using)
+
+
+def last_expiry_scan():
+    """The date of the last completed expiry scan, or None if there is none."""
+    last_scan = cache.get(EXPIRY_SCAN_KEY)
+    return datetime.date.fromisoformat(last_scan) if last_scan else None
+
+
+def record_expiry_scan(today):
+    cache.set(EXPIRY_SCAN_KEY, today.isoformat(), timeout=None)
+
+
+def alert_reagent_ids(alert_types=None):
+    """The ids of the reagents with active alerts (of `alert_types`, or any), in order."""
+    alerts = Alert.objects.filter(is_active=True)
+    if alert_types is not None:
+        alerts = alerts.filter(alert_type__in=alert_types)
+    return list(alerts.order_by('reagent_id').values_list('reagent_id', flat=True).distinct())
+
+
+def partition_reagent_ids(reagent_ids, shards):
+    """
+    Splits the sorted `reagent_ids` into at most `shards` contiguous id
+    ranges of near-equal size, so each chunk's alert and lot queries read
+    one range of the reagent_id indexes.
+    """
+    size, extra = divmod(len(reagent_ids), shards)
+    chunks = []
+    start = 0
+    for shard in range(min(shards, len(reagent_ids))):
+        end = start + size + (shard < extra)
+        chunks.append(reagent_ids[start:end])
+        start = end
+    return chunks
+
+
+def _evaluate_reagent_alerts_after_commit(reagent_ids):
+    reagent_ids = sorted(set(reagent_ids))
+    if getattr(settings, 'ALERT_EVALUATION_ASYNC', False):
+        from inventory.tasks import evaluate_reagent_alerts  # tasks imports this module
+        try:
+            evaluate_reagent_alerts.apply_async(args=[reagent_ids], retry=False)
+            return
+        except Exception:
+            logger.warning("Could not queue alert evaluation, running it inline.", exc_info=True)
+    try:
+        evaluate_alerts(reagent_ids=reagent_ids)
+    except Exception:
+        # The stock change is already committed; the next change or scan retries.
+        logger.exception("Alert evaluation failed for reagents %s", reagent_ids)
+
+
+def queue_alert_evaluation(reagent_ids, using=None):
+    """
+    Re-evaluates the alerts of `reagent_ids` once the current transaction
+    commits, in the Celery worker when ALERT_EVALUATION_ASYNC is set. The
+    reagents touched by one transaction are evaluated together.
+    """
+    CommitBatch.add('alert_evaluation_batch', _evaluate_reagent_alerts_after_commit, reagent_ids, using=using)
@@ -0,0 +1,150 @@
+import datetime
+import hashlib
+import json
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncQuarter, TruncWeek
+from django.utils import timezone
+
+from inventory.models import DailyMovementRollup
+
+CONSUMPTION_ANALYTICS_KEY = 'analytics:consumption:{version}:{params_hash}'
+CONSUMPTION_ANALYTICS_TIMEOUT = 600  # seconds
+CONSUMPTION_DEFAULT_DAYS = 180
+CONSUMPTION_DEFAULT_TOP = 10
+CONSUMPTION_MAX_TOP = 50
+CONSUMPTION_MAX_DAYS = 3660
+
+# Bucket -> (expression truncating the rollup date, label of a bucket start).
+CONSUMPTION_BUCKETS = {
+    'day': (F('date'), lambda start: start.isoformat()),
+    'week': (TruncWeek('date'), lambda start: start.isoformat()),
+    'month': (TruncMonth('date'), lambda start: start.strftime('%Y-%m')),
+    'quarter': (TruncQuarter('date'), lambda start: f'{start.year}-Q{(start.month - 1) // 3 + 1}'),
+}
+# Grouping -> (id, name) lookups on DailyMovementRollup.
+CONSUMPTION_GROUPS = {
+    'reagent': ('reagent_id', 'reagent__name'),
+    'category': ('reagent__category_id', 'reagent__category__name'),
+    'location': ('location_id', 'location__name'),
+    'user': ('user_id', 'user__username'),
+}
+
+
+def _date(name, value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} should be in YYYY-MM-DD format.")
+
+
+def normalize_consumption_params(params):
+    """
+    Validates the query parameters of the consumption analytics endpoint and
+    returns them with their defaults filled in. Raises ValueError.
+    """
+    bucket = params.get('bucket') or 'month'
+    if bucket not in CONSUMPTION_BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(CONSUMPTION_BUCKETS)}.")
+    group_by = params.get('group_by') or None
+    if group_by is not None and group_by not in CONSUMPTION_GROUPS:
+        raise ValueError(f"group_by must be one of: {', '.join(CONSUMPTION_GROUPS)}.")
+    try:
+        top = int(params.get('top') or CONSUMPTION_DEFAULT_TOP)
+    except ValueError:
+        raise ValueError("top must be an integer.")
+    if not 1 <= top <= CONSUMPTION_MAX_TOP:
+        raise ValueError(f"top must be between 1 and {CONSUMPTION_MAX_TOP}.")
+
+    end_date = _date('end_date', params['end_date']) if params.get('end_date') else timezone.localdate()
+    if params.get('start_date'):
+        start_date = _date('start_date', params['start_date'])
+    else:
+        start_date = end_date - datetime.timedelta(days=CONSUMPTION_DEFAULT_DAYS)
+    if start_date > end_date:
+        raise ValueError("start_date must not be after end_date.")
+    if (end_date - start_date).days > CONSUMPTION_MAX_DAYS:
+        raise ValueError(f"The period can span at most {CONSUMPTION_MAX_DAYS} days.")
+
+    return {
+        'start_date': start_date, 'end_date': end_date, 'bucket': bucket,
+        'group_by': group_by, 'top': top if group_by else None,
+    }
+
+
+def get_consumption_analytics(start_date, end_date, bucket='month', group_by=None, top=CONSUMPTION_DEFAULT_TOP):
+    """
+    Withdrawn quantity and value from `start_date` to `end_date` (inclusive)
+    per `bucket`, in one grouped query over the daily rollup. Only buckets
+    with consumption are listed.
+
+    With `group_by`, the `top` groups by quantity over the whole period get a
+    series each and the remaining groups are summed into `others`.
+    """
+    truncate, label = CONSUMPTION_BUCKETS[bucket]
+    group_fields = CONSUMPTION_GROUPS[group_by] if group_by else ()
+    rows = DailyMovementRollup.objects.filter(
+        move_type='Retirada', date__gte=start_date, date__lte=end_date
+    ).annotate(bucket=truncate).values('bucket', *group_fields).annotate(
+        total_quantity=Sum('quantity'), total_value=Sum('value')
+    ).order_by('bucket')
+
+    buckets = []
+    totals = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    groups = {}
+    for row in rows:
+        start = row['bucket']
+        if isinstance(start, datetime.datetime):
+            start = start.date()
+        if not buckets or buckets[-1] != start:
+            buckets.append(start)
+        totals[start][0] += row['total_quantity']
+        totals[start][1] += row['total_value']
+        if group_by:
+            group_id, name = row[group_fields[0]], row[group_fields[1]]
+            group = groups.setdefault(group_id, {'id': group_id, 'name': name, 'buckets': {}})
+            group['buckets'][start] = (row['total_quantity'], row['total_value'])
+
+    def series(entries, **fields):
+        quantities = [sum((entry.get(start, (0, 0))[0] for entry in entries), Decimal(0)) for start in buckets]
+        values = [sum((entry.get(start, (0, 0))[1] for entry in entries), Decimal(0)) for start in buckets]
+        return {
+            **fields,
+            'total_quantity': float(sum(quantities, Decimal(0))),
+            'total_value': float(sum(values, Decimal(0))),
+            'quantities': [float(quantity) for quantity in quantities],
+            'values': [float(value) for value in values],
+        }
+
+    data = {
+        'start_date': start_date, 'end_date': end_date, 'bucket': bucket, 'group_by': group_by,
+        'labels': [label(start) for start in buckets],
+        'total': series([{start: tuple(totals[start]) for start in buckets}]),
+        'series': [],
+        'others': None,
+    }
+    if group_by:
+        ranked = sorted(
+            groups.values(),
+            key=lambda group: (-sum(quantity for quantity, value in group['buckets'].values()), group['name'] or ''),
+        )
+        data['series'] = [series([group['buckets']], id=group['id'], name=group['name']) for group in ranked[:top]]
+        if len(ranked) > top:
+            data['others'] = series([group['buckets'] for group in ranked[top:]], groups=len(ranked) - top)
+    return data
+
+
+def get_cached_consumption_analytics(params):
+    """
+    get_consumption_analytics for normalized `params`, cached by a hash of the
+    parameters under the dashboard version, which every stock write bumps.
+    """
+    from inventory.services import get_dashboard_version  # services imports this module
+    params_hash = hashlib.sha256(
+        json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+    key = CONSUMPTION_ANALYTICS_KEY.format(version=get_dashboard_version(), params_hash=params_hash)
+    return cache.get_or_set(key, lambda: get_consumption_analytics(**params), timeout=CONSUMPTION_ANALYTICS_TIMEOUT)
@@ -0,0 +1,182 @@
+import datetime
+import gzip
+import json
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+
+from inventory.models import AuditLog
+from inventory.partitions import month_bounds
+from inventory.utils import CustomJsonEncoder
+
+ARCHIVE_FIELDS = ('id', 'timestamp', 'user_id', 'action', 'object_type', 'object_id', 'details')
+ARCHIVE_CHUNK_SIZE = 2000
+
+# auditlog-2025-01.jsonl.gz, auditlog-2025-01.part2.columns.json.gz, ...
+ARCHIVE_NAME_RE = re.compile(r'^auditlog-(\d{4})-(\d{2})(?:\.part(\d+))?\.(jsonl|columns\.json)\.gz$')
+ARCHIVE_SUFFIXES = {'jsonl': 'jsonl', 'columnar': 'columns.json'}
+
+
+class AuditArchiveError(Exception):
+    pass
+
+
+def _write_jsonl(archive, rows, chunk_size):
+    count = 0
+    for row in rows:
+        archive.write(json.dumps(row, cls=CustomJsonEncoder) + '\n')
+        count += 1
+    return count
+
+
+def _write_columnar(archive, rows, chunk_size):
+    """
+    One line per row group of `chunk_size` rows, holding a list of values per
+    column. Values of one column sit next to each other, which compresses
+    better than JSONL and lets readers skip a whole group by its time range.
+    """
+    def flush(group):
+        archive.write(json.dumps({
+            'rows': len(group['id']),
+            'min_timestamp': group['timestamp'][0],
+            'max_timestamp': group['timestamp'][-1],
+            'columns': group,
+        }, cls=CustomJsonEncoder) + '\n')
+
+    count = 0
+    group = {field: [] for field in ARCHIVE_FIELDS}
+    for row in rows:
+        for field in ARCHIVE_FIELDS:
+            group[field].append(row[field])
+        count += 1
+        if len(group['id']) == chunk_size:
+            flush(group)
+            group = {field: [] for field in ARCHIVE_FIELDS}
+    if group['id']:
+        flush(group)
+    return count
+
+
+ARCHIVE_WRITERS = {'jsonl': _write_jsonl, 'columnar': _write_columnar}
+
+
+def _read_archive(path, start=None, end=None):
+    """Yields the rows of one archive file as dicts, with `timestamp` still an ISO string."""
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        if '.jsonl.gz' in path.name:
+            for line in archive:
+                yield json.loads(line)
+            return
+        for line in archive:
+            group = json.loads(line)
+            # ISO timestamps in UTC compare correctly as strings.
+            if (start and group['max_timestamp'] < start) or (end and group['min_timestamp'] >= end):
+                continue
+            columns = group['columns']
+            for values in zip(*(columns[field] for field in ARCHIVE_FIELDS)):
+                yield dict(zip(ARCHIVE_FIELDS, values))
+
+
+def list_archive_files(archive_dir=None, month=None):
+    """Returns [(month, path)] of the archive files, oldest month first."""
+    directory = Path(archive_dir or settings.AUDIT_ARCHIVE_DIR)
+    if not directory.is_dir():
+        return []
+    files = []
+    for path in directory.iterdir():
+        match = ARCHIVE_NAME_RE.match(path.name)
+        if not match:
+            continue
+        file_month = datetime.date(int(match[1]), int(match[2]), 1)
+        if month is None or file_month == month:
+            files.append((file_month, int(match[3] or 1), path))
+    return [(file_month, path) for file_month, part, path in sorted(files)]
+
+
+def archived_ids(month, archive_dir=None):
+    return {row['id'] for file_month, path in list_archive_files(archive_dir, month) for row in _read_archive(path)}
+
+
+def archive_audit_month(month, archive_dir=None, archive_format='jsonl', chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Streams the audit rows of a month (UTC) into a compressed archive file, in
+    timestamp order, and returns how many rows were written. Rows already in
+    an earlier archive of the month (a run interrupted while deleting) are
+    skipped and new ones go to an extra part file. The file only gets its
+    final name once written and read back with the expected row count.
+    """
+    directory = Path(archive_dir or settings.AUDIT_ARCHIVE_DIR)
+    existing = list_archive_files(directory, month)
+    skip_ids = archived_ids(month, directory) if existing else set()
+
+    start, end = month_bounds(month)
+    rows = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by(
+        'timestamp', 'id'
+    ).values(*ARCHIVE_FIELDS).iterator(chunk_size=chunk_size)
+    if skip_ids:
+        rows = (row for row in rows if row['id'] not in skip_ids)
+
+    part = f'.part{len(existing) + 1}' if existing else ''
+    path = directory / f'auditlog-{month:%Y-%m}{part}.{ARCHIVE_SUFFIXES[archive_format]}.gz'
+    directory.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.partial')
+    with gzip.open(partial, 'wt', encoding='utf-8') as archive:
+        count = ARCHIVE_WRITERS[archive_format](archive, rows, chunk_size)
+    if not count:
+        partial.unlink()
+        return 0
+
+    written = sum(1 for row in _read_archive(partial))
+    if written != count:
+        partial.unlink()
+        raise AuditArchiveError(f"{path.name}: wrote {count} rows but read back {written}.")
+    os.replace(partial, path)
+    return count
+
+
+def verify_audit_month_archived(month, archive_dir=None):
+    """
+    Checks that every row of the month still in the database is in the
+    month's archive files. Returns the number of rows checked.
+    """
+    archived = archived_ids(month, archive_dir)
+    start, end = month_bounds(month)
+    in_database = 0
+    missing = 0
+    for row_id in AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end).values_list(
+        'id', flat=True
+    ).iterator(chunk_size=ARCHIVE_CHUNK_SIZE):
+        in_database += 1
+        missing += row_id not in archived
+    if missing:
+        raise AuditArchiveError(f"{month:%Y-%m}: {missing} of {in_database} rows are not in the archive.")
+    return in_database
+
+
+def iter_archived_audit_events(start=None, end=None, archive_dir=None, **filters):
+    """
+    Lazily scans the archives for rows with start <= timestamp < end (aware
+    datetimes, either may be None) whose fields equal `filters`, e.g.
+    object_type=5, object_id=12. Only the files of the months in the range are
+    opened, one row group at a time. Rows come out month by month, in
+    timestamp order within each file.
+    """
+    utc = datetime.timezone.utc
+    start_iso = start.astimezone(utc).isoformat() if start else None
+    end_iso = end.astimezone(utc).isoformat() if end else None
+    first_month = datetime.date(start.astimezone(utc).year, start.astimezone(utc).month, 1) if start else None
+
+    for month, path in list_archive_files(archive_dir):
+        if first_month and month < first_month:
+            continue
+        if end and month_bounds(month)[0] >= end:
+            break
+        for row in _read_archive(path, start_iso, end_iso):
+            timestamp = datetime.datetime.fromisoformat(row['timestamp'])
+            if (start and timestamp < start) or (end and timestamp >= end):
+                continue
+            if all(row.get(field) == value for field, value in filters.items()):
+                row['timestamp'] = timestamp
+                yield row
@@ -0,0 +1,124 @@
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.utils import timezone
+
+from inventory.models import AuditLog
+from inventory.utils import CommitBatch, CustomJsonEncoder
+
+logger = logging.getLogger(__name__)
+
+AUDIT_WRITE_ATTEMPTS = 5
+AUDIT_WRITE_BACKOFF = 0.05  # seconds, scaled by attempt and jittered
+
+
+def record_audit_event(action, details, user=None, instance=None, using=None):
+    """
+    Queues an audit event (an AuditLog action code) for the current
+    transaction, about `instance` if given. The events of a transaction are
+    inserted with one bulk_create after it commits (or handed to Celery when
+    AUDIT_LOG_ASYNC is set), so audit writes add no latency or lock time to
+    the transaction itself. Outside a transaction the event is written
+    immediately.
+
+    Delivery is best effort: the events live in memory between the commit
+    and the insert, so a process that dies in between loses them, and a
+    failed insert leaves only the error log entry (see write_audit_events).
+    """
+    event = AuditLog(user=user, action=action, details=details, timestamp=timezone.now())
+    if instance is not None:
+        event.object_type = AuditLog.object_type_for(type(instance))
+        event.object_id = instance.pk
+    CommitBatch.add('audit_batch', lambda events: write_audit_events(events, using=using), [event], using=using)
+
+
+def serialize_audit_events(events):
+    return [
+        {
+            'user_id': event.user_id,
+            'action': event.action,
+            'object_type': event.object_type,
+            'object_id': event.object_id,
+            'timestamp': event.timestamp.isoformat(),
+            # Round-trip through the model's encoder so the payload is plain JSON.
+            'details': json.loads(json.dumps(event.details, cls=CustomJsonEncoder)),
+        }
+        for event in events
+    ]
+
+
+def deserialize_audit_events(payload):
+    return [
+        AuditLog(
+            user_id=item['user_id'],
+            action=item['action'],
+            object_type=item.get('object_type'),
+            object_id=item.get('object_id'),
+            timestamp=item['timestamp'],
+            details=item['details'],
+        )
+        for item in payload
+    ]
+
+
+def _queue_audit_events(events):
+    from inventory.tasks import write_audit_log_events  # tasks imports services, which imports this module
+    try:
+        write_audit_log_events.apply_async(args=[serialize_audit_events(events)], retry=False)
+        return True
+    except Exception:
+        logger.warning("Could not queue %s audit events.", len(events), exc_info=True)
+        return False
+
+
+def _insert_audit_events(events, using=None):
+    """
+    Inserts the events with one bulk_create, retried with backoff while the
+    table is locked by another writer. Each attempt runs in its own atomic
+    block, so a failed one leaves an enclosing transaction usable.
+    """
+    for attempt in range(1, AUDIT_WRITE_ATTEMPTS + 1):
+        try:
+            with transaction.atomic(using=using):
+                AuditLog.objects.using(using).bulk_create(events)
+            return
+        except OperationalError:
+            if attempt == AUDIT_WRITE_ATTEMPTS:
+                raise
+            time.sleep(AUDIT_WRITE_BACKOFF * attempt * (1 + random.random()))
+
+
+def write_audit_events(events, using=None):
+    """
+    Persists committed audit events: through the Celery queue when
+    AUDIT_LOG_ASYNC is enabled and the broker is reachable, otherwise with a
+    direct bulk_create, retried while the table is locked. Events still
+    blocked after the retries are handed to the worker, whose task keeps
+    retrying; only if that fails too (or the insert fails otherwise) are they
+    logged in full, so they can be replayed from the error log.
+    """
+    queued_first = getattr(settings, 'AUDIT_LOG_ASYNC', False)
+    if queued_first and _queue_audit_events(events):
+        return
+
+    try:
+        _insert_audit_events(events, using=using)
+    except OperationalError:
+        if not queued_first and _queue_audit_events(events):
+            logger.warning("Audit table still locked, %s events queued for the worker.", len(events))
+            return
+        _log_lost_events(events)
+    except Exception:
+        _log_lost_events(events)
+
+
+def _log_lost_events(events):
+    # Called from an except block, so the traceback is logged too.
+    logger.exception(
+        "Failed to write %s audit events: %s",
+        len(events), json.dumps(serialize_audit_events(events)),
+    )
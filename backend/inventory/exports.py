@@ -0,0 +1,186 @@
+import csv
+import json
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from rest_framework import renderers
+
+from inventory.utils import CustomJsonEncoder
+
+EXPORT_CHUNK_SIZE = 2000
+# Rows written to the XLSX sheet between two flushes of the zip stream.
+XLSX_FLUSH_ROWS = 500
+
+
+def queryset_columns(queryset):
+    """The keys of the dicts a .values() queryset yields, in order."""
+    query = queryset.query
+    if query.selected:
+        # Set when values() names annotations; keeps the order given there.
+        return list(query.selected)
+    return [*query.extra_select, *query.values_select, *query.annotation_select]
+
+
+class _Echo:
+    """File-like object whose write() returns what was written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([row[column] for column in columns])
+
+
+def iter_jsonl(columns, rows):
+    for row in rows:
+        yield json.dumps({column: row[column] for column in columns}, cls=CustomJsonEncoder) + '\n'
+
+
+class _ZipStream:
+    """
+    Unseekable sink for zipfile: written bytes are kept until drained, so the
+    archive is sent while it is built. zipfile then writes sizes and CRCs in
+    data descriptors after each member instead of seeking back.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Relatório" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def iter_xlsx(columns, rows):
+    """
+    Streams a single-sheet XLSX workbook: the fixed parts, then the sheet XML
+    written row by row into the zip, flushed every XLSX_FLUSH_ROWS rows.
+    Strings are stored inline, so no shared-strings table has to be built
+    before the sheet.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row(columns)
+            ).encode('utf-8'))
+            yield stream.drain()
+            for count, row in enumerate(rows, start=1):
+                sheet.write(_xlsx_row(row[column] for column in columns).encode('utf-8'))
+                if count % XLSX_FLUSH_ROWS == 0:
+                    yield stream.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield stream.drain()
+
+
+class _ExportRenderer(renderers.BaseRenderer):
+    """
+    Lets content negotiation accept ?format=csv|xlsx|jsonl; the export views
+    return a StreamingHttpResponse themselves, so nothing is rendered here.
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class CSVRenderer(_ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+
+class XLSXRenderer(_ExportRenderer):
+    media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    format = 'xlsx'
+
+
+class JSONLinesRenderer(_ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
+    charset = 'utf-8'
+
+
+EXPORT_RENDERERS = [CSVRenderer, XLSXRenderer, JSONLinesRenderer]
+EXPORT_WRITERS = {'csv': iter_csv, 'xlsx': iter_xlsx, 'jsonl': iter_jsonl}
+
+
+def export_response(renderer, rows, columns, filename):
+    """
+    Streams `rows` (dicts, typically a .values() queryset's iterator) in the
+    format of `renderer`, one of EXPORT_RENDERERS.
+    """
+    content_type = f'{renderer.media_type}; charset={renderer.charset}' if renderer.charset else renderer.media_type
+    response = StreamingHttpResponse(EXPORT_WRITERS[renderer.format](columns, rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{renderer.format}"'
+    return response
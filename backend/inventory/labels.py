@@ -0,0 +1,306 @@
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from PIL import Image, ImageDraw, ImageFont
+
+from inventory.models import StockLot
+from inventory.utils import qr_code_cache_key, render_qr_code_png
+
+# A4 at 150 dpi, 3 x 8 labels per page.
+PAGE_WIDTH_PX, PAGE_HEIGHT_PX = 1240, 1754
+PAGE_WIDTH_PT, PAGE_HEIGHT_PT = 595.28, 841.89
+PAGE_MARGIN_PX = 30
+LABEL_COLUMNS, LABEL_ROWS = 3, 8
+LABELS_PER_PAGE = LABEL_COLUMNS * LABEL_ROWS
+LABEL_WIDTH_PX = (PAGE_WIDTH_PX - 2 * PAGE_MARGIN_PX) // LABEL_COLUMNS
+LABEL_HEIGHT_PX = (PAGE_HEIGHT_PX - 2 * PAGE_MARGIN_PX) // LABEL_ROWS
+LABEL_PADDING_PX = 10
+LABEL_QR_SIZE_PX = LABEL_HEIGHT_PX - 2 * LABEL_PADDING_PX
+
+# Below this many uncached QR codes, forking workers costs more than it saves.
+MIN_PARALLEL_RENDERS = 32
+
+
+def get_label_sheet_workers():
+    return getattr(settings, 'LABEL_SHEET_WORKERS', None) or os.cpu_count() or 1
+
+
+class _SharedPool:
+    def __init__(self, workers):
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.users = 0
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _retire(shared):
+    # Called with _pool_lock held, once `shared` is no longer the current pool.
+    if shared.users == 0:
+        shared.executor.shutdown(wait=False, cancel_futures=True)
+
+
+@contextmanager
+def label_sheet_pool(workers=None):
+    """
+    Lends the process pool shared by every label sheet rendered in this
+    process, so requests do not fork workers of their own. It is started on
+    first use; asking for a different number of workers replaces it, and a
+    replaced pool is shut down once its last user gives it back.
+    """
+    global _pool
+    workers = workers or get_label_sheet_workers()
+    with _pool_lock:
+        if _pool is None or _pool.workers != workers:
+            previous, _pool = _pool, _SharedPool(workers)
+            if previous is not None:
+                _retire(previous)
+        shared = _pool
+        shared.users += 1
+    try:
+        yield shared.executor
+    finally:
+        with _pool_lock:
+            shared.users -= 1
+            if shared is not _pool:
+                _retire(shared)
+
+
+def _discard_label_sheet_pool(executor):
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.executor is executor:
+            previous, _pool = _pool, None
+            _retire(previous)
+
+
+def get_lots_for_labels(ids=None, reagent_id=None, location_id=None):
+    """
+    Selects the stock lots to print, by explicit ids and/or reagent/location filters.
+    """
+    if not ids and not reagent_id and not location_id:
+        raise ValueError("Provide lot ids or a reagent/location filter.")
+
+    lots = StockLot.objects.select_related('reagent')
+    if ids:
+        lots = lots.filter(pk__in=ids)
+    if reagent_id:
+        lots = lots.filter(reagent_id=reagent_id)
+    if location_id:
+        lots = lots.filter(location_id=location_id)
+    return lots.order_by('reagent__name', 'lot_number')
+
+
+def _render_in_pool(executor, payloads, workers):
+    """
+    Renders `payloads` across `executor`, in order. If the pool breaks, the
+    rest is rendered in this process and the next sheet starts a fresh pool.
+    """
+    done = 0
+    try:
+        rendered = executor.map(render_qr_code_png, payloads, chunksize=max(1, len(payloads) // (workers * 4)))
+        try:
+            for png in rendered:
+                yield png
+                done += 1
+        finally:
+            # Cancels what a dropped download still had queued.
+            rendered.close()
+    except BrokenProcessPool:
+        _discard_label_sheet_pool(executor)
+        yield from map(render_qr_code_png, payloads[done:])
+
+
+def _cached_or_rendered(payloads, keys, cached, rendered):
+    for payload, key in zip(payloads, keys):
+        png = cached.get(key)
+        if png is None:
+            png = next(rendered)
+            cache.set(key, png, timeout=None)
+        yield png
+
+
+def render_qr_codes(payloads, workers=None, min_parallel=MIN_PARALLEL_RENDERS):
+    """
+    Yields the PNG bytes for each payload, in order.
+
+    Cached images are reused; the remaining ones are rendered across the
+    shared process pool when there are enough of them, and written back to
+    the cache.
+    """
+    payloads = list(payloads)
+    workers = workers or get_label_sheet_workers()
+    keys = [qr_code_cache_key(payload) for payload in payloads]
+    cached = cache.get_many(keys)
+    missing = [payload for payload, key in zip(payloads, keys) if key not in cached]
+
+    if workers > 1 and len(missing) >= min_parallel:
+        with label_sheet_pool(workers) as executor:
+            yield from _cached_or_rendered(payloads, keys, cached, _render_in_pool(executor, missing, workers))
+    else:
+        yield from _cached_or_rendered(payloads, keys, cached, map(render_qr_code_png, missing))
+
+
+def _draw_label(page, draw, font, position, lot, png):
+    column, row = position % LABEL_COLUMNS, position // LABEL_COLUMNS
+    left = PAGE_MARGIN_PX + column * LABEL_WIDTH_PX
+    top = PAGE_MARGIN_PX + row * LABEL_HEIGHT_PX
+
+    draw.rectangle(
+        [left, top, left + LABEL_WIDTH_PX - 1, top + LABEL_HEIGHT_PX - 1],
+        outline=192,
+    )
+    qr_image = Image.open(BytesIO(png)).convert('L').resize(
+        (LABEL_QR_SIZE_PX, LABEL_QR_SIZE_PX), Image.NEAREST
+    )
+    page.paste(qr_image, (left + LABEL_PADDING_PX, top + LABEL_PADDING_PX))
+
+    text_left = left + LABEL_QR_SIZE_PX + 2 * LABEL_PADDING_PX
+    lines = [
+        lot.reagent.name[:24],
+        f'Lote: {lot.lot_number}'[:24],
+        f'Validade: {lot.expiry_date.strftime("%d/%m/%Y")}',
+        f'ID: {lot.pk}',
+    ]
+    for index, line in enumerate(lines):
+        draw.text((text_left, top + 2 * LABEL_PADDING_PX + index * 20), line, fill=0, font=font)
+
+
+def iter_label_sheet_pages(lots, workers=None):
+    """
+    Yields one grayscale PIL image per sheet of labels.
+    """
+    lots = list(lots)
+    pngs = render_qr_codes([lot.qr_code_data for lot in lots], workers=workers)
+    font = ImageFont.load_default()
+
+    for start in range(0, len(lots), LABELS_PER_PAGE):
+        page = Image.new('L', (PAGE_WIDTH_PX, PAGE_HEIGHT_PX), 255)
+        draw = ImageDraw.Draw(page)
+        for position, lot in enumerate(lots[start:start + LABELS_PER_PAGE]):
+            _draw_label(page, draw, font, position, lot, next(pngs))
+        yield page
+
+
+def count_label_sheet_pages(lot_count):
+    return max(1, -(-lot_count // LABELS_PER_PAGE))
+
+
+class _PdfStream:
+    """
+    Minimal PDF writer that emits each page as soon as it is drawn and writes
+    the page tree and cross-reference table at the end.
+    """
+    CATALOG, PAGES = 1, 2
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+
+    def emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def obj(self, number, body):
+        self.offsets[number] = self.offset
+        return self.emit(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    def stream_obj(self, number, header, data):
+        return self.obj(number, b'<< %s /Length %d >>\nstream\n' % (header, len(data)) + data + b'\nendstream')
+
+
+def iter_label_sheet_pdf(pages):
+    """
+    Streams `pages` (grayscale PIL images) as a multi-page PDF.
+    """
+    pdf = _PdfStream()
+    yield pdf.emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    kids = []
+    number = pdf.PAGES + 1
+    for page in pages:
+        image_number, content_number, page_number = number, number + 1, number + 2
+        number += 3
+
+        yield pdf.stream_obj(
+            image_number,
+            b'/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray '
+            b'/BitsPerComponent 8 /Filter /FlateDecode' % page.size,
+            zlib.compress(page.tobytes()),
+        )
+        yield pdf.stream_obj(
+            content_number, b'',
+            b'q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q' % (PAGE_WIDTH_PT, PAGE_HEIGHT_PT),
+        )
+        yield pdf.obj(
+            page_number,
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] '
+            b'/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>'
+            % (pdf.PAGES, PAGE_WIDTH_PT, PAGE_HEIGHT_PT, image_number, content_number),
+        )
+        kids.append(page_number)
+
+    yield pdf.obj(
+        pdf.PAGES,
+        b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % kid for kid in kids), len(kids)),
+    )
+    yield pdf.obj(pdf.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % pdf.PAGES)
+
+    xref_offset = pdf.offset
+    xref = [b'xref\n0 %d\n' % number, b'0000000000 65535 f \n']
+    xref += [b'%010d 00000 n \n' % pdf.offsets[obj_number] for obj_number in range(1, number)]
+    yield pdf.emit(b''.join(xref))
+    yield pdf.emit(
+        b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (number, pdf.CATALOG, xref_offset)
+    )
+
+
+def render_label_sheet_png(lots, page=1, workers=None):
+    """
+    Renders a single sheet (1-based `page`) of the label sheet as PNG bytes.
+    """
+    lots = list(lots)
+    if page < 1 or page > count_label_sheet_pages(len(lots)):
+        raise ValueError("Page out of range.")
+    start = (page - 1) * LABELS_PER_PAGE
+    sheet = next(iter_label_sheet_pages(lots[start:start + LABELS_PER_PAGE], workers=workers))
+    buffer = BytesIO()
+    sheet.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def benchmark_qr_rendering(payloads, workers=None):
+    """
+    Renders `payloads` without any caching, serially and through the shared
+    process pool, and returns the throughput (lots/sec) of each path.
+    """
+    payloads = list(payloads)
+    workers = workers or get_label_sheet_workers()
+
+    start = time.perf_counter()
+    for payload in payloads:
+        render_qr_code_png(payload)
+    serial_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunksize = max(1, len(payloads) // (workers * 4))
+    with label_sheet_pool(workers) as executor:
+        list(executor.map(render_qr_code_png, payloads, chunksize=chunksize))
+    parallel_elapsed = time.perf_counter() - start
+
+    return {
+        'lots': len(payloads),
+        'workers': workers,
+        'serial_lots_per_sec': len(payloads) / serial_elapsed if serial_elapsed else 0.0,
+        'parallel_lots_per_sec': len(payloads) / parallel_elapsed if parallel_elapsed else 0.0,
+    }
@@ -0,0 +1,99 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min
+
+from inventory.archive import (
+    ARCHIVE_CHUNK_SIZE, ARCHIVE_WRITERS, AuditArchiveError, archive_audit_month, verify_audit_month_archived,
+)
+from inventory.models import AuditLog
+from inventory.partitions import (
+    add_months, drop_audit_partition, ensure_audit_partitions, is_audit_log_partitioned, list_audit_partitions,
+    month_bounds, month_start,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move os meses do log de auditoria anteriores ao corte para arquivos compactados (.jsonl.gz ou "
+        "colunar), confere as contagens e remove as linhas arquivadas (no PostgreSQL, descartando a partição do mês)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-months', type=int, default=settings.AUDIT_LOG_RETENTION_MONTHS,
+            help="Meses completos mantidos na tabela, além do mês corrente."
+        )
+        parser.add_argument('--before', help="Arquiva os meses anteriores a este (AAAA-MM), em vez da retenção.")
+        parser.add_argument('--archive-dir', default=settings.AUDIT_ARCHIVE_DIR)
+        parser.add_argument('--format', choices=sorted(ARCHIVE_WRITERS), default='jsonl')
+        parser.add_argument(
+            '--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE,
+            help="Linhas lidas por vez do banco (e linhas por grupo no formato colunar)."
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help="Linhas removidas por transação.")
+        parser.add_argument('--dry-run', action='store_true', help="Só lista os meses que seriam arquivados.")
+
+    def get_cutoff(self, options):
+        if options['before']:
+            try:
+                return month_start(datetime.datetime.strptime(options['before'], '%Y-%m').date())
+            except ValueError:
+                raise CommandError("--before must be a month in YYYY-MM format.")
+        if options['retention_months'] < 1:
+            raise CommandError("--retention-months must be at least 1.")
+        return add_months(month_start(datetime.datetime.now(datetime.timezone.utc).date()), -options['retention_months'])
+
+    def delete_in_batches(self, month, batch_size):
+        start, end = month_bounds(month)
+        rows = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        deleted = 0
+        while True:
+            # Short transactions keep the table writable while a large month is removed.
+            with transaction.atomic():
+                ids = list(rows.values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    return deleted
+                deleted += AuditLog.objects.filter(id__in=ids).delete()[0]
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--chunk-size and --batch-size must be positive.")
+        cutoff = self.get_cutoff(options)
+
+        partitioned = is_audit_log_partitioned()
+        if partitioned:
+            ensure_audit_partitions()
+            months = [month for month, name in list_audit_partitions() if month < cutoff]
+        else:
+            months = []
+            oldest = AuditLog.objects.filter(timestamp__lt=month_bounds(cutoff)[0]).aggregate(
+                oldest=Min('timestamp')
+            )['oldest']
+            if oldest is not None:
+                month = month_start(oldest.astimezone(datetime.timezone.utc))
+                while month < cutoff:
+                    months.append(month)
+                    month = add_months(month, 1)
+
+        for month in months:
+            if options['dry_run']:
+                self.stdout.write(f"{month:%Y-%m}: would be archived to {options['archive_dir']}")
+                continue
+            try:
+                count = archive_audit_month(month, options['archive_dir'], options['format'], options['chunk_size'])
+                checked = verify_audit_month_archived(month, options['archive_dir'])
+            except AuditArchiveError as e:
+                raise CommandError(f"{e} Nothing was deleted for this month.")
+
+            if partitioned:
+                with transaction.atomic():
+                    drop_audit_partition(month)
+                deleted = checked
+            else:
+                deleted = self.delete_in_batches(month, options['batch_size'])
+            self.stdout.write(f"{month:%Y-%m}: {count} rows archived, {deleted} rows removed")
+
+        self.stdout.write(self.style.SUCCESS(f"Audit log archived before {cutoff:%Y-%m} ({len(months)} months)."))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.labels import (
+    benchmark_qr_rendering, get_label_sheet_workers, get_lots_for_labels,
+    iter_label_sheet_pages, iter_label_sheet_pdf, render_label_sheet_png,
+)
+
+
+class Command(BaseCommand):
+    help = "Gera uma folha de etiquetas (PDF ou PNG) para lotes de estoque."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', nargs='+', type=int, help="IDs dos lotes.")
+        parser.add_argument('--reagent', type=int, help="Filtra os lotes por reagente.")
+        parser.add_argument('--location', type=int, help="Filtra os lotes por localização.")
+        parser.add_argument('--output', '-o', help="Arquivo de saída (.pdf ou .png).")
+        parser.add_argument('--format', choices=['pdf', 'png'], default='pdf')
+        parser.add_argument('--page', type=int, default=1, help="Página a renderizar no formato PNG.")
+        parser.add_argument('--workers', type=int, help="Processos usados para renderizar os QR codes.")
+        parser.add_argument(
+            '--benchmark', action='store_true',
+            help="Compara lotes/s da renderização serial com o pool de processos, sem cache.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            lots = list(get_lots_for_labels(
+                ids=options['ids'],
+                reagent_id=options['reagent'],
+                location_id=options['location'],
+            ))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if not lots:
+            raise CommandError("No stock lots match the selection.")
+
+        workers = options['workers'] or get_label_sheet_workers()
+
+        if options['benchmark']:
+            result = benchmark_qr_rendering([lot.qr_code_data for lot in lots], workers=workers)
+            self.stdout.write(
+                f"{result['lots']} lots: serial {result['serial_lots_per_sec']:.1f} lots/s, "
+                f"pool ({result['workers']} workers) {result['parallel_lots_per_sec']:.1f} lots/s"
+            )
+
+        if not options['output']:
+            return
+
+        if options['format'] == 'png':
+            try:
+                chunks = [render_label_sheet_png(lots, page=options['page'], workers=workers)]
+            except ValueError as e:
+                raise CommandError(str(e))
+        else:
+            chunks = iter_label_sheet_pdf(iter_label_sheet_pages(lots, workers=workers))
+
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Label sheet for {len(lots)} lots written to {options['output']}"))
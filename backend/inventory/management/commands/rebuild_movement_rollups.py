@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import DailyMovementRollup
+
+
+class Command(BaseCommand):
+    help = "Reconstrói os totais diários de movimentações a partir das movimentações."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Reconstrói só a partir deste dia (AAAA-MM-DD), em vez de todo o histórico.")
+
+    def handle(self, *args, **options):
+        start = None
+        if options['since']:
+            try:
+                start = datetime.date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a date in YYYY-MM-DD format.")
+        rows = DailyMovementRollup.rebuild(start=start)
+        self.stdout.write(self.style.SUCCESS(f"Movement rollups rebuilt ({rows} rows)."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory.models import ReagentStockSummary
+
+
+class Command(BaseCommand):
+    help = "Reconstrói a tabela de totais de estoque por reagente a partir dos lotes."
+
+    def handle(self, *args, **options):
+        fixed = ReagentStockSummary.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Stock summaries reconciled ({fixed} rows created or corrected)."))
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_alter_auditlog_details_alert_notification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['timestamp', 'id'], name='auditlog_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read'], name='notification_user_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requisition',
+            index=models.Index(fields=['status', 'request_date'], name='requisition_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requisition',
+            index=models.Index(fields=['request_date', 'id'], name='requisition_request_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(condition=models.Q(('current_quantity__gt', 0)), fields=['reagent', 'expiry_date'], name='stocklot_fefo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(condition=models.Q(('current_quantity__gt', 0)), fields=['expiry_date'], name='stocklot_in_stock_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['move_type', 'timestamp'], name='movement_type_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['timestamp', 'id'], name='movement_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_stock_summaries(apps, schema_editor):
+    StockLot = apps.get_model('inventory', 'StockLot')
+    ReagentStockSummary = apps.get_model('inventory', 'ReagentStockSummary')
+    in_stock = models.Q(current_quantity__gt=0)
+    rows = StockLot.objects.order_by().values('reagent_id').annotate(
+        total_quantity=models.Sum('current_quantity'),
+        total_value=models.Sum(models.F('current_quantity') * models.F('purchase_price'), filter=in_stock),
+        earliest_expiry=models.Min('expiry_date', filter=in_stock),
+        lot_count=models.Count('id', filter=in_stock),
+    )
+    ReagentStockSummary.objects.bulk_create([
+        ReagentStockSummary(
+            reagent_id=row['reagent_id'],
+            total_quantity=row['total_quantity'] or 0,
+            total_value=row['total_value'] or 0,
+            earliest_expiry=row['earliest_expiry'],
+            lot_count=row['lot_count'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReagentStockSummary',
+            fields=[
+                ('reagent', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_summary', serialize=False, to='inventory.reagent')),
+                ('total_quantity', models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=14)),
+                ('total_value', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('earliest_expiry', models.DateField(blank=True, null=True)),
+                ('lot_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(build_stock_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,118 @@
+from django.db import migrations, models
+
+# Codes as defined on AuditLog when this migration was written.
+CREATE, UPDATE, DELETE, STATUS_CHANGE, STOCK_WITHDRAWAL, BULK_REQUISITION_ACTION = range(1, 7)
+OBJECT_TYPES = {
+    'USER': 1, 'CATEGORY': 2, 'SUPPLIER': 3, 'LOCATION': 4, 'REAGENT': 5,
+    'STOCKLOT': 6, 'STOCKMOVEMENT': 7, 'ATTACHMENT': 8, 'REQUISITION': 9,
+}
+OPERATIONS = {'CREATE': CREATE, 'UPDATE': UPDATE, 'DELETE': DELETE}
+BATCH_SIZE = 2000
+
+
+def _compact_values(data):
+    # Old rows copied the whole instance __dict__, including caches and the password hash.
+    return {
+        name: value for name, value in (data or {}).items()
+        if not name.startswith('_') and name not in ('id', 'password')
+    }
+
+
+def _compact(row):
+    """
+    Converts a row written with the old string actions. Returns False for the
+    per-movement detail rows, which duplicated the generic CREATE row.
+    """
+    details = row.details if isinstance(row.details, dict) else {}
+    legacy = row.legacy_action
+    if legacy == 'CREATE_STOCK_MOVEMENT':
+        return False
+    if legacy == 'UPDATE_REQUISITION_STATUS':
+        row.action = STATUS_CHANGE
+        row.object_type = OBJECT_TYPES['REQUISITION']
+        row.object_id = details.get('id')
+        row.details = {'status': [details.get('old_status'), details.get('new_status')]}
+    elif legacy == 'STOCK_WITHDRAWAL':
+        row.action = STOCK_WITHDRAWAL
+        row.details = {name: value for name, value in details.items() if name not in ('model', 'user')}
+    elif legacy == 'BULK_REQUISITION_ACTION':
+        row.action = BULK_REQUISITION_ACTION
+        row.details = {name: value for name, value in details.items() if name not in ('model', 'user')}
+    else:
+        operation, _, model = legacy.partition('_')
+        if operation in OPERATIONS and model in OBJECT_TYPES:
+            row.action = OPERATIONS[operation]
+            row.object_type = OBJECT_TYPES[model]
+            row.object_id = details.get('id')
+            # Old updates stored every field, so they stay full snapshots.
+            row.details = _compact_values(details.get('data'))
+        else:
+            row.action = UPDATE
+            row.details = {'legacy_action': legacy, **details}
+    return True
+
+
+def compact_audit_rows(apps, schema_editor):
+    AuditLog = apps.get_model('inventory', 'AuditLog')
+    changed, duplicates = [], []
+    for row in AuditLog.objects.order_by('id').iterator(chunk_size=BATCH_SIZE):
+        if _compact(row):
+            changed.append(row)
+        else:
+            duplicates.append(row.pk)
+        if len(changed) >= BATCH_SIZE:
+            AuditLog.objects.bulk_update(changed, ['action', 'object_type', 'object_id', 'details'])
+            changed = []
+        if len(duplicates) >= BATCH_SIZE:
+            AuditLog.objects.filter(pk__in=duplicates).delete()
+            duplicates = []
+    AuditLog.objects.bulk_update(changed, ['action', 'object_type', 'object_id', 'details'])
+    AuditLog.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_auditlog_event_timestamp'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='auditlog',
+            old_name='action',
+            new_name='legacy_action',
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='action',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'CREATE'), (2, 'UPDATE'), (3, 'DELETE'), (4, 'STATUS_CHANGE'), (5, 'STOCK_WITHDRAWAL'), (6, 'BULK_REQUISITION_ACTION')], default=2),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='object_type',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(1, 'User'), (2, 'Category'), (3, 'Supplier'), (4, 'Location'), (5, 'Reagent'), (6, 'StockLot'), (7, 'StockMovement'), (8, 'Attachment'), (9, 'Requisition')], null=True),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='object_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(compact_audit_rows, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='auditlog',
+            name='legacy_action',
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['object_type', 'object_id', 'timestamp'], name='auditlog_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['action', 'timestamp'], name='auditlog_action_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['user', 'timestamp'], name='auditlog_user_idx'),
+        ),
+    ]
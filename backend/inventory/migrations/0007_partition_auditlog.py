@@ -0,0 +1,75 @@
+import datetime
+
+from django.db import migrations
+
+from inventory.partitions import (
+    AUDIT_LOG_TABLE, DEFAULT_PARTITION, add_months, create_audit_partition, ensure_audit_partitions, month_start,
+)
+
+UNPARTITIONED_TABLE = f'{AUDIT_LOG_TABLE}_unpartitioned'
+
+
+def partition_audit_log(apps, schema_editor):
+    """
+    Rebuilds inventory_auditlog as a table range-partitioned by month on
+    `timestamp` and copies the existing rows over. PostgreSQL only; other
+    databases keep the plain table.
+
+    PostgreSQL requires the partition key in every unique constraint, so the
+    primary key becomes (id, timestamp); ids still come from one identity
+    sequence and stay unique.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    quote = connection.ops.quote_name
+    table, old_table = quote(AUDIT_LOG_TABLE), quote(UNPARTITIONED_TABLE)
+    user_table = quote(apps.get_model('inventory', 'User')._meta.db_table)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+        cursor.execute(
+            f"CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY) "
+            f'PARTITION BY RANGE ("timestamp")'
+        )
+        cursor.execute(f"CREATE TABLE {quote(DEFAULT_PARTITION)} PARTITION OF {table} DEFAULT")
+        cursor.execute(f'SELECT min("timestamp") FROM {old_table}')
+        oldest = cursor.fetchone()[0]
+
+    if oldest is not None:
+        # Past months; ensure_audit_partitions covers the current one onwards.
+        month = month_start(oldest.astimezone(datetime.timezone.utc))
+        current = month_start(datetime.datetime.now(datetime.timezone.utc))
+        while month < current:
+            create_audit_partition(month, connection)
+            month = add_months(month, 1)
+    ensure_audit_partitions(connection=connection)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {old_table}")
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(max(id), 0) + 1, false) FROM {table}",
+            [AUDIT_LOG_TABLE],
+        )
+        # Dropping the old table frees its constraint and index names for the new one.
+        cursor.execute(f"DROP TABLE {old_table}")
+        cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, "timestamp")')
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {quote(AUDIT_LOG_TABLE + '_user_id_fk')} "
+            f"FOREIGN KEY (user_id) REFERENCES {user_table} (id) DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute(f'CREATE INDEX auditlog_user_idx ON {table} (user_id, "timestamp")')
+        cursor.execute(f'CREATE INDEX auditlog_timestamp_idx ON {table} ("timestamp", id)')
+        cursor.execute(f'CREATE INDEX auditlog_object_idx ON {table} (object_type, object_id, "timestamp")')
+        cursor.execute(f'CREATE INDEX auditlog_action_idx ON {table} (action, "timestamp")')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_compact_auditlog'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_audit_log, migrations.RunPython.noop),
+    ]
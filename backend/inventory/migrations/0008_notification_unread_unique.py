@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:33
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_unread_notifications(apps, schema_editor):
+    # get_or_create did not prevent concurrent duplicates; keep the oldest of each.
+    Notification = apps.get_model('inventory', 'Notification')
+    duplicates = Notification.objects.filter(is_read=False).values('user', 'alert', 'message').annotate(
+        keep=Min('id'), copies=Count('id')
+    ).filter(copies__gt=1)
+    for group in duplicates.iterator():
+        Notification.objects.filter(
+            is_read=False, user=group['user'], alert=group['alert'], message=group['message']
+        ).exclude(pk=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_partition_auditlog'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_unread_notifications, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_read', False)), fields=('alert', 'user', 'message'), name='notification_unread_unique'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+import django.db.models.deletion
+
+
+def set_legacy_dedupe_keys(apps, schema_editor):
+    # Older notifications only have a free-text message; each keeps a key of its own.
+    Notification = apps.get_model('inventory', 'Notification')
+    Notification.objects.update(dedupe_key=Concat(Value('legacy:'), Cast('id', CharField())))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_notification_unread_unique'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='notification',
+            name='notification_unread_unique',
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='lot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='inventory.stocklot'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='dedupe_key',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_legacy_dedupe_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('dedupe_key', 'user'), name='notification_dedupe_unique'),
+        ),
+    ]
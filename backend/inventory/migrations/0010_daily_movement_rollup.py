@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def build_movement_rollups(apps, schema_editor):
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    DailyMovementRollup = apps.get_model('inventory', 'DailyMovementRollup')
+    negative = models.Q(quantity__lt=0)
+    rows = StockMovement.objects.order_by().values(
+        'user_id', 'move_type', date=TruncDate('timestamp'),
+        reagent_id=models.F('stock_lot__reagent_id'), location_id=models.F('stock_lot__location_id'),
+    ).annotate(
+        total_quantity=models.Sum('quantity'),
+        total_value=models.Sum(models.F('quantity') * models.F('stock_lot__purchase_price')),
+        total_movement_count=models.Count('id'),
+        total_negative_quantity=models.Sum('quantity', filter=negative, default=0),
+        total_negative_count=models.Count('id', filter=negative),
+    )
+    DailyMovementRollup.objects.bulk_create([
+        DailyMovementRollup(**{name.removeprefix('total_'): value for name, value in row.items()})
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_notification_dedupe_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMovementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('move_type', models.CharField(choices=[('Entrada', 'Entrada'), ('Retirada', 'Retirada'), ('Ajuste', 'Ajuste'), ('Descarte', 'Descarte')], max_length=20)),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('value', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('movement_count', models.IntegerField(default=0)),
+                ('negative_quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('negative_count', models.IntegerField(default=0)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.location')),
+                ('reagent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.reagent')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['move_type', 'date'], name='movement_rollup_type_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'reagent', 'user', 'location', 'move_type'), name='movement_rollup_unique')],
+            },
+        ),
+        migrations.RunPython(build_movement_rollups, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,77 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction, connections, router
+from django.db.models.functions import TruncDate
 from django.conf import settings
-from inventory.utils import CustomJsonEncoder, generate_qr_code_image # Import generate_qr_code_image
+from django.utils import timezone
+from inventory.utils import CustomJsonEncoder, get_qr_code_image
 
-class User(AbstractUser):
+class FieldTrackingMixin:
+    """
+    Remembers the concrete field values an instance was loaded (or last saved)
+    with, so save/delete signal receivers can tell what changed without
+    re-reading the row. Deferred fields are not tracked.
+    """
+
+    def field_values(self):
+        # Read from __dict__ so deferred fields are skipped instead of loaded.
+        return {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance.field_values()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers have run against the previous snapshot by now.
+        self._loaded_values = self.field_values()
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_values = self.field_values()
+
+    def get_loaded_value(self, attname, default=None):
+        return getattr(self, '_loaded_values', {}).get(attname, default)
+
+    def get_changed_fields(self):
+        """
+        Returns {attname: (old, new)} for the fields whose value differs from
+        the snapshot. An instance that was never loaded or saved reports all
+        of its fields, with None as the old value.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        current = self.field_values()
+        if loaded is None:
+            return {name: (None, value) for name, value in current.items()}
+        return {
+            name: (loaded[name], value)
+            for name, value in current.items()
+            if name in loaded and loaded[name] != value
+        }
+
+class User(FieldTrackingMixin, AbstractUser):
     ROLE_CHOICES = (
         ('Analista', 'Analista'),
         ('Convidado', 'Convidado'),
     )
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='Convidado')
 
-class Category(models.Model):
+class Category(FieldTrackingMixin, models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
 
     def __str__(self):
         return self.name
 
-class Supplier(models.Model):
+class Supplier(FieldTrackingMixin, models.Model):
     name = models.CharField(max_length=200)
     contact_person = models.CharField(max_length=200, blank=True, null=True)
     email = models.EmailField(blank=True, null=True)
@@ -26,14 +80,14 @@ class Supplier(models.Model):
     def __str__(self):
         return self.name
 
-class Location(models.Model):
+class Location(FieldTrackingMixin, models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
 
     def __str__(self):
         return self.name
 
-class Reagent(models.Model):
+class Reagent(FieldTrackingMixin, models.Model):
     name = models.CharField(max_length=255)
     sku = models.CharField(max_length=100, unique=True)
     category = models.ForeignKey(Category, on_delete=models.PROTECT)
@@ -45,7 +99,7 @@ class Reagent(models.Model):
     def __str__(self):
         return self.name
 
-class StockLot(models.Model):
+class StockLot(FieldTrackingMixin, models.Model):
     reagent = models.ForeignKey(Reagent, on_delete=models.CASCADE)
     lot_number = models.CharField(max_length=100)
     location = models.ForeignKey(Location, on_delete=models.PROTECT)
@@ -57,15 +111,133 @@ class StockLot(models.Model):
 
     class Meta:
         unique_together = ('reagent', 'lot_number')
+        indexes = [
+            # FEFO selection: lots of a reagent still in stock, by expiry date.
+            models.Index(
+                fields=['reagent', 'expiry_date'],
+                condition=models.Q(current_quantity__gt=0),
+                name='stocklot_fefo_idx',
+            ),
+            # Expiry reports, dashboard and alerts: in-stock lots by expiry window.
+            models.Index(
+                fields=['expiry_date'],
+                condition=models.Q(current_quantity__gt=0),
+                name='stocklot_in_stock_expiry_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.reagent.name} - Lote: {self.lot_number}'
 
-    def get_qr_code_image(self):
+    def save(self, *args, **kwargs):
+        loaded_reagent_id = self.get_loaded_value('reagent_id')
+        # Keep the reagent's stock summary in the same transaction as the lot write.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            ReagentStockSummary.refresh(self.reagent_id)
+            if loaded_reagent_id is not None and loaded_reagent_id != self.reagent_id:
+                ReagentStockSummary.refresh(loaded_reagent_id, create=False)
+
+    @property
+    def qr_code_data(self):
         # For simplicity, encode the lot ID. In a real app, this might be a URL to the lot's detail page.
-        return generate_qr_code_image(str(self.id))
+        return str(self.id)
+
+    def get_qr_code_image(self):
+        return get_qr_code_image(self.qr_code_data)
+
+class ReagentStockSummary(models.Model):
+    """
+    Denormalized stock totals per reagent, rewritten whenever one of its lots is
+    saved or deleted. `reconcile_stock_summaries` rebuilds the whole table.
+    """
+    reagent = models.OneToOneField(Reagent, on_delete=models.CASCADE, primary_key=True, related_name='stock_summary')
+    # Sum of current_quantity over all lots, as used by the low-stock checks.
+    total_quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0, db_index=True)
+    # Value and counts only consider lots still in stock (current_quantity > 0).
+    total_value = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    earliest_expiry = models.DateField(null=True, blank=True)
+    lot_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
-class StockMovement(models.Model):
+    def __str__(self):
+        return f'Estoque de {self.reagent_id}: {self.total_quantity}'
+
+    @staticmethod
+    def aggregates():
+        in_stock = models.Q(current_quantity__gt=0)
+        return {
+            'total_quantity': models.Sum('current_quantity'),
+            'total_value': models.Sum(models.F('current_quantity') * models.F('purchase_price'), filter=in_stock),
+            'earliest_expiry': models.Min('expiry_date', filter=in_stock),
+            'lot_count': models.Count('id', filter=in_stock),
+        }
+
+    @classmethod
+    def values_from(cls, totals):
+        return {
+            'total_quantity': totals['total_quantity'] or 0,
+            'total_value': totals['total_value'] or 0,
+            'earliest_expiry': totals['earliest_expiry'],
+            'lot_count': totals['lot_count'],
+        }
+
+    @classmethod
+    def refresh(cls, reagent_id, create=True):
+        """
+        Recomputes the summary of one reagent from its lots. The summary row
+        is locked (and created first, unless create=False, used by batched
+        writes and while a reagent is being deleted) before the lots are
+        summed, so writers to different lots of the reagent take turns and
+        each total includes the changes committed before it.
+        """
+        summaries = cls.objects.select_for_update().filter(reagent_id=reagent_id)
+        # No savepoint: the lock only needs a transaction, and callers are normally already in one.
+        with transaction.atomic(savepoint=False):
+            if create:
+                summaries.get_or_create(reagent_id=reagent_id)
+            elif not list(summaries.values_list('pk', flat=True)):
+                return
+            totals = StockLot.objects.filter(reagent_id=reagent_id).aggregate(**cls.aggregates())
+            summaries.update(updated_at=timezone.now(), **cls.values_from(totals))
+
+    @classmethod
+    def rebuild(cls, reagent_ids=None):
+        """
+        Recomputes every summary (or those of `reagent_ids`) with one grouped
+        query and fixes the rows that drifted. Returns the number of rows
+        created or corrected.
+        """
+        empty = cls.values_from({'total_quantity': None, 'total_value': None, 'earliest_expiry': None, 'lot_count': 0})
+        lots = StockLot.objects.order_by()
+        summaries = cls.objects.select_for_update()
+        if reagent_ids is not None:
+            lots = lots.filter(reagent_id__in=reagent_ids)
+            summaries = summaries.filter(reagent_id__in=reagent_ids)
+        with transaction.atomic():
+            computed = {
+                row['reagent_id']: cls.values_from(row)
+                for row in lots.values('reagent_id').annotate(**cls.aggregates())
+            }
+            existing = {summary.reagent_id: summary for summary in summaries}
+
+            created, stale = [], []
+            for reagent_id, values in computed.items():
+                if reagent_id not in existing:
+                    created.append(cls(reagent_id=reagent_id, **values))
+            for reagent_id, summary in existing.items():
+                values = computed.get(reagent_id, empty)
+                if any(getattr(summary, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(summary, field, value)
+                    summary.updated_at = timezone.now()
+                    stale.append(summary)
+
+            cls.objects.bulk_create(created)
+            cls.objects.bulk_update(stale, list(empty) + ['updated_at'])
+        return len(created) + len(stale)
+
+class StockMovement(FieldTrackingMixin, models.Model):
     MOVE_TYPE_CHOICES = (
         ('Entrada', 'Entrada'),
         ('Retirada', 'Retirada'),
@@ -79,10 +251,162 @@ class StockMovement(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Consumption/waste reports and dashboard series filter by type and period.
+            models.Index(fields=['move_type', 'timestamp'], name='movement_type_timestamp_idx'),
+            # Cursor pagination of the movement history.
+            models.Index(fields=['timestamp', 'id'], name='movement_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f'{self.move_type} de {self.quantity} no {self.stock_lot}'
 
-class Attachment(models.Model):
+class DailyMovementRollup(models.Model):
+    """
+    Movement totals per day, reagent, user, location and type, which the
+    consumption and waste reports read instead of the movements. Movement
+    writes add their deltas in their own transaction;
+    `rebuild_movement_rollups` (also run nightly) recomputes the table.
+    """
+    date = models.DateField()
+    reagent = models.ForeignKey(Reagent, on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='+')
+    move_type = models.CharField(max_length=20, choices=StockMovement.MOVE_TYPE_CHOICES)
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Quantity times the lot's purchase price.
+    value = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    movement_count = models.IntegerField(default=0)
+    # The part of quantity/movement_count from negative movements; the waste
+    # report only counts adjustments that reduced stock.
+    negative_quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    negative_count = models.IntegerField(default=0)
+
+    KEY_FIELDS = ('date', 'reagent_id', 'user_id', 'location_id', 'move_type')
+    TOTAL_FIELDS = ('quantity', 'value', 'movement_count', 'negative_quantity', 'negative_count')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'reagent', 'user', 'location', 'move_type'], name='movement_rollup_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['move_type', 'date'], name='movement_rollup_type_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.move_type} de {self.quantity} em {self.date}'
+
+    @staticmethod
+    def entry(movement, lot, sign=1):
+        """The delta of `movement` (in `lot`); sign=-1 takes it back out."""
+        return (
+            timezone.localdate(movement.timestamp), lot.reagent_id, movement.user_id, lot.location_id,
+            movement.move_type, Decimal(str(movement.quantity)), Decimal(str(lot.purchase_price)), sign,
+        )
+
+    @classmethod
+    def apply(cls, entries, using=None):
+        """
+        Adds the `entries` (see entry()) to their rows with a single
+        INSERT ... ON CONFLICT DO UPDATE, so concurrent writers to the same
+        row add up instead of overwriting each other. Rows left without
+        movements are deleted.
+        """
+        totals = defaultdict(lambda: [Decimal(0), Decimal(0), 0, Decimal(0), 0])
+        for day, reagent_id, user_id, location_id, move_type, quantity, price, sign in entries:
+            row = totals[(day, reagent_id, user_id, location_id, move_type)]
+            row[0] += sign * quantity
+            row[1] += sign * quantity * price
+            row[2] += sign
+            if quantity < 0:
+                row[3] += sign * quantity
+                row[4] += sign
+        if not totals:
+            return
+
+        using = using or router.db_for_write(cls)
+        connection = connections[using]
+        fields = {field.attname: field for field in cls._meta.concrete_fields}
+        table = connection.ops.quote_name(cls._meta.db_table)
+        keys = [connection.ops.quote_name(fields[name].column) for name in cls.KEY_FIELDS]
+        columns = [connection.ops.quote_name(fields[name].column) for name in cls.TOTAL_FIELDS]
+        params = []
+        for key, row in totals.items():
+            for name, value in zip(cls.KEY_FIELDS + cls.TOTAL_FIELDS, key + tuple(row)):
+                params.append(fields[name].get_db_prep_value(value, connection))
+        placeholders = ', '.join(['(' + ', '.join(['%s'] * (len(keys) + len(columns))) + ')'] * len(totals))
+        updates = ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in columns)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(keys + columns)}) VALUES {placeholders} '
+                f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates}',
+                params,
+            )
+        if any(row[2] < 0 for row in totals.values()):
+            cls.objects.using(using).filter(
+                date__in={key[0] for key in totals}, movement_count__lte=0
+            ).delete()
+
+    @staticmethod
+    def aggregates():
+        negative = models.Q(quantity__lt=0)
+        return {
+            'quantity': models.Sum('quantity'),
+            'value': models.Sum(models.F('quantity') * models.F('stock_lot__purchase_price')),
+            'movement_count': models.Count('id'),
+            'negative_quantity': models.Sum('quantity', filter=negative, default=0),
+            'negative_count': models.Count('id', filter=negative),
+        }
+
+    @classmethod
+    def rebuild(cls, start=None, end=None):
+        """
+        Recomputes the rows of the days from `start` to `end` (inclusive,
+        open-ended when None) with one grouped query over the movements.
+        Returns the number of rows written.
+
+        Writers add their deltas in the transaction that writes the movement,
+        so the table is locked against them for the whole rebuild: a writer
+        that already added its delta commits before the movements are read,
+        and one that has not waits and adds it to the rebuilt rows.
+        """
+        movements = StockMovement.objects.order_by()
+        rollups = cls.objects.all()
+        if start is not None:
+            movements = movements.filter(timestamp__gte=day_start(start))
+            rollups = rollups.filter(date__gte=start)
+        if end is not None:
+            movements = movements.filter(timestamp__lt=day_start(end + datetime.timedelta(days=1)))
+            rollups = rollups.filter(date__lte=end)
+        connection = connections[router.db_for_write(cls)]
+        with transaction.atomic(using=connection.alias):
+            if connection.vendor == 'postgresql':
+                # Conflicts with the ROW EXCLUSIVE lock apply() takes, not with readers.
+                # SQLite already runs one write transaction at a time.
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'LOCK TABLE {connection.ops.quote_name(cls._meta.db_table)} IN SHARE ROW EXCLUSIVE MODE'
+                    )
+            rollups.delete()
+            rows = movements.values(
+                'user_id', 'move_type', date=TruncDate('timestamp'),
+                reagent_id=models.F('stock_lot__reagent_id'), location_id=models.F('stock_lot__location_id'),
+            # Prefixed, as annotations named after movement fields would shadow them.
+            ).annotate(**{f'total_{name}': aggregate for name, aggregate in cls.aggregates().items()})
+            created = cls.objects.bulk_create(
+                [cls(**{name.removeprefix('total_'): value for name, value in row.items()}) for row in rows],
+                batch_size=1000,
+            )
+        return len(created)
+
+def day_start(day):
+    """The aware datetime at which `day` starts in the current time zone."""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+class Attachment(FieldTrackingMixin, models.Model):
     reagent = models.ForeignKey(Reagent, on_delete=models.CASCADE, related_name='attachments')
     file = models.FileField(upload_to='attachments/')
     description = models.CharField(max_length=255)
@@ -92,15 +416,60 @@ class Attachment(models.Model):
         return f'Anexo para {self.reagent.name} - {self.description}'
 
 class AuditLog(models.Model):
+    # Actions and object types are stored as small integer codes. The codes
+    # are persisted (and archived), so never renumber or reuse one.
+    CREATE = 1
+    UPDATE = 2
+    DELETE = 3
+    STATUS_CHANGE = 4
+    STOCK_WITHDRAWAL = 5
+    BULK_REQUISITION_ACTION = 6
+    ACTION_CHOICES = (
+        (CREATE, 'CREATE'),
+        (UPDATE, 'UPDATE'),
+        (DELETE, 'DELETE'),
+        (STATUS_CHANGE, 'STATUS_CHANGE'),
+        (STOCK_WITHDRAWAL, 'STOCK_WITHDRAWAL'),
+        (BULK_REQUISITION_ACTION, 'BULK_REQUISITION_ACTION'),
+    )
+    OBJECT_TYPE_CHOICES = (
+        (1, 'User'),
+        (2, 'Category'),
+        (3, 'Supplier'),
+        (4, 'Location'),
+        (5, 'Reagent'),
+        (6, 'StockLot'),
+        (7, 'StockMovement'),
+        (8, 'Attachment'),
+        (9, 'Requisition'),
+    )
+    OBJECT_TYPE_CODES = {name: code for code, name in OBJECT_TYPE_CHOICES}
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
-    action = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    action = models.PositiveSmallIntegerField(choices=ACTION_CHOICES)
+    object_type = models.PositiveSmallIntegerField(choices=OBJECT_TYPE_CHOICES, null=True, blank=True)
+    object_id = models.BigIntegerField(null=True, blank=True)
+    # Set when the event is recorded, not when the deferred insert runs.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    # Field values for CREATE/DELETE, {field: [old, new]} for updates.
     details = models.JSONField(blank=True, null=True, encoder=CustomJsonEncoder)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='auditlog_timestamp_idx'),
+            models.Index(fields=['object_type', 'object_id', 'timestamp'], name='auditlog_object_idx'),
+            models.Index(fields=['action', 'timestamp'], name='auditlog_action_idx'),
+            models.Index(fields=['user', 'timestamp'], name='auditlog_user_idx'),
+        ]
+
+    @classmethod
+    def object_type_for(cls, model):
+        return cls.OBJECT_TYPE_CODES.get(model._meta.object_name)
+
     def __str__(self):
-        return f'{self.user} - {self.action} em {self.timestamp}'
+        return f'{self.user} - {self.get_action_display()} em {self.timestamp}'
 
-class Requisition(models.Model):
+class Requisition(FieldTrackingMixin, models.Model):
     STATUS_CHOICES = (
         ('Pendente', 'Pendente'),
         ('Aprovada', 'Aprovada'),
@@ -114,6 +483,12 @@ class Requisition(models.Model):
     request_date = models.DateTimeField(auto_now_add=True)
     approval_date = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'request_date'], name='requisition_status_idx'),
+            models.Index(fields=['request_date', 'id'], name='requisition_request_date_idx'),
+        ]
+
     def __str__(self):
         return f'Requisição de {self.reagent.name} por {self.requester.username}'
 
@@ -134,11 +509,35 @@ class Alert(models.Model):
         return f"Alerta '{self.name}' para {self.reagent.name}"
 
 class Notification(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    # Indexed through notification_user_unread_idx, whose leading column is user.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications', db_index=False)
     alert = models.ForeignKey(Alert, on_delete=models.CASCADE, related_name='notifications')
+    # The lot an expiry notification is about; empty for low stock.
+    lot = models.ForeignKey(StockLot, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    # See make_dedupe_key. A user gets one notification per key.
+    dedupe_key = models.CharField(max_length=100)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_read'], name='notification_user_unread_idx'),
+        ]
+        constraints = [
+            # The conflict target of the alert evaluation's upsert. Led by the
+            # key so it does not compete with notification_user_unread_idx.
+            models.UniqueConstraint(fields=['dedupe_key', 'user'], name='notification_dedupe_unique'),
+        ]
+
+    @staticmethod
+    def make_dedupe_key(alert_id, condition, period, lot_id=None):
+        """
+        The identity of what a notification reports: the alert, the lot (if
+        any), the condition (an alert type) and the period it belongs to, e.g.
+        '12:-:low_stock:2025-03-01' or '7:40:expiry_date:2025-06-30'.
+        """
+        return f"{alert_id}:{lot_id or '-'}:{condition}:{period.isoformat()}"
+
     def __str__(self):
         return f"Notificação para {self.user.username}: {self.message[:50]}"
@@ -0,0 +1,32 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class MaxPageSizeMixin:
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.API_MAX_PAGE_SIZE
+
+
+class StandardPageNumberPagination(MaxPageSizeMixin, PageNumberPagination):
+    """
+    Page-number pagination for catalog tables (reagents, lots, categories...).
+    """
+
+
+class TimestampCursorPagination(MaxPageSizeMixin, CursorPagination):
+    """
+    Keyset pagination for append-only history tables, newest first. Each page is
+    an indexed range scan on `timestamp`, so cost does not grow with history.
+    """
+    ordering = ('-timestamp', '-id')
+
+
+class RequestDateCursorPagination(TimestampCursorPagination):
+    ordering = ('-request_date', '-id')
+
+
+class CreatedAtCursorPagination(TimestampCursorPagination):
+    ordering = ('-created_at', '-id')
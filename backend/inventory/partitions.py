@@ -0,0 +1,106 @@
+"""
+Monthly range partitioning of the audit log table on PostgreSQL.
+
+The table is partitioned by `timestamp` (see migration 0007). Each calendar
+month (UTC) gets its own partition named `inventory_auditlog_pYYYY_MM`, plus a
+default partition that only catches rows for months nobody created a
+partition for. Partitions must exist before their month starts: a month whose
+rows already landed in the default partition can no longer be split out, so
+`ensure_audit_partitions` runs daily and creates a few months ahead.
+
+Everything here is a no-op on databases without table partitioning.
+"""
+import datetime
+import re
+
+from django.db import connection as default_connection
+
+AUDIT_LOG_TABLE = 'inventory_auditlog'
+DEFAULT_PARTITION = f'{AUDIT_LOG_TABLE}_default'
+PARTITION_NAME_RE = re.compile(rf'^{AUDIT_LOG_TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{AUDIT_LOG_TABLE}_p{month:%Y_%m}'
+
+
+def month_bounds(month):
+    """The [start, end) UTC datetimes covered by the month's partition."""
+    start = datetime.datetime.combine(month, datetime.time.min, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime.combine(add_months(month, 1), datetime.time.min, tzinfo=datetime.timezone.utc)
+    return start, end
+
+
+def is_audit_log_partitioned(connection=default_connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [AUDIT_LOG_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def create_audit_partition(month, connection=default_connection):
+    start, end = month_bounds(month)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {quote(partition_name(month))} PARTITION OF {quote(AUDIT_LOG_TABLE)} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+
+
+def list_audit_partitions(connection=default_connection):
+    """Returns [(month, partition name)] of the monthly partitions, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass",
+            [AUDIT_LOG_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions.append((datetime.date(int(match[1]), int(match[2]), 1), name))
+    return sorted(partitions)
+
+
+def ensure_audit_partitions(months_ahead=3, today=None, connection=default_connection):
+    """
+    Creates the partitions for the current month and the next `months_ahead`.
+    Returns the names of the partitions that were missing.
+    """
+    if not is_audit_log_partitioned(connection):
+        return []
+    current = month_start(today or datetime.datetime.now(datetime.timezone.utc).date())
+    existing = {month for month, name in list_audit_partitions(connection)}
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            create_audit_partition(month, connection)
+            created.append(partition_name(month))
+    return created
+
+
+def drop_audit_partition(month, connection=default_connection):
+    """Detaches and drops a month's partition, discarding its rows."""
+    quote = connection.ops.quote_name
+    name = quote(partition_name(month))
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {quote(AUDIT_LOG_TABLE)} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
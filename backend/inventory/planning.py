@@ -0,0 +1,150 @@
+import datetime
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from inventory.models import Requisition, StockLot
+from inventory.services import get_dashboard_version
+
+# Lots expiring within this many days after the last demand are reported when
+# the simulation leaves stock in them.
+DEFAULT_HORIZON_DAYS = 90
+MAX_HORIZON_DAYS = 3660
+# Largest quantity a demand can ask for, as Requisition.quantity (max_digits=10, decimal_places=2).
+MAX_DEMAND_QUANTITY = Decimal('99999999.99')
+PLAN_CACHE_TIMEOUT = 60 * 60
+
+# Quantities have two decimal places; the planner works in integer hundredths.
+_CENTS = Decimal('0.01')
+
+
+def _to_cents(quantity):
+    return int(Decimal(str(quantity)).quantize(_CENTS) * 100)
+
+
+def _from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+class FefoPlanner:
+    """
+    A reagent's in-stock lots held as parallel arrays sorted by expiry date,
+    for simulating FEFO allocation without touching the database.
+
+    Build it with `for_reagent`, which caches the snapshot (lots and pending
+    requisitions) until the next stock or requisition write, then call
+    `simulate` as often as needed.
+    """
+
+    def __init__(self, reagent_id, lots, pending=()):
+        self.reagent_id = reagent_id
+        # lots: (id, lot_number, expiry_date, quantity) sorted by expiry date.
+        self.lot_ids = [lot[0] for lot in lots]
+        self.lot_numbers = [lot[1] for lot in lots]
+        self.expiry_dates = [lot[2] for lot in lots]
+        self.expiry_ordinals = [lot[2].toordinal() for lot in lots]
+        self.quantities = [_to_cents(lot[3]) for lot in lots]
+        self.available_cents = sum(self.quantities)
+        # pending: (requisition_id, quantity) in request order.
+        self.pending = [(requisition_id, _to_cents(quantity)) for requisition_id, quantity in pending]
+
+    @classmethod
+    def load(cls, reagent_id):
+        lots = StockLot.objects.filter(reagent_id=reagent_id, current_quantity__gt=0).order_by(
+            'expiry_date', 'id'
+        ).values_list('id', 'lot_number', 'expiry_date', 'current_quantity')
+        pending = Requisition.objects.filter(reagent_id=reagent_id, status='Pendente').order_by(
+            'request_date', 'id'
+        ).values_list('id', 'quantity')
+        return cls(reagent_id, list(lots), list(pending))
+
+    @classmethod
+    def for_reagent(cls, reagent_id):
+        # The dashboard version changes on commit of every lot, movement and
+        # requisition write, so it doubles as the snapshot's validity token.
+        key = f'fefo-plan:{reagent_id}:{get_dashboard_version()}'
+        planner = cache.get(key)
+        if planner is None:
+            planner = cls.load(reagent_id)
+            cache.set(key, planner, timeout=PLAN_CACHE_TIMEOUT)
+        return planner
+
+    @property
+    def available(self):
+        return _from_cents(self.available_cents)
+
+    def simulate(self, demands=None, include_pending=True, as_of=None, horizon_days=DEFAULT_HORIZON_DAYS):
+        """
+        Allocates a queue of demands against the lots in FEFO order.
+
+        `demands` is a list of dicts with `quantity` and optionally `id` and
+        `needed_by` (a date). Pending requisitions are queued first, needed
+        `as_of` (default today). Lots are drawn the way perform_withdrawal
+        draws them, every lot with stock in expiry order; an allocation from a
+        lot expiring on or before the demand's date is flagged `expired`.
+        Returns the allocation and shortfall of each demand and the lots left
+        with stock that expire within `horizon_days` of the last demand date.
+        """
+        as_of = as_of or timezone.localdate()
+        queue = []
+        if include_pending:
+            queue += [
+                {'id': requisition_id, 'source': 'requisition', 'cents': cents, 'needed_by': as_of}
+                for requisition_id, cents in self.pending
+            ]
+        for demand in demands or []:
+            queue.append({
+                'id': demand.get('id'),
+                'source': 'simulation',
+                'cents': _to_cents(demand['quantity']),
+                'needed_by': demand.get('needed_by') or as_of,
+            })
+
+        remaining = list(self.quantities)
+        first_nonempty = 0
+        results = []
+        for demand in queue:
+            needed_by = demand['needed_by'].toordinal()
+            index = first_nonempty
+            needed = demand['cents']
+            allocations = []
+            while needed > 0 and index < len(remaining):
+                if remaining[index] > 0:
+                    taken = min(remaining[index], needed)
+                    remaining[index] -= taken
+                    needed -= taken
+                    allocations.append({'lot_id': self.lot_ids[index], 'lot_number': self.lot_numbers[index],
+                                        'quantity': _from_cents(taken),
+                                        'expired': self.expiry_ordinals[index] <= needed_by})
+                index += 1
+            while first_nonempty < len(remaining) and remaining[first_nonempty] == 0:
+                first_nonempty += 1
+
+            results.append({
+                'id': demand['id'],
+                'source': demand['source'],
+                'quantity': _from_cents(demand['cents']),
+                'needed_by': demand['needed_by'],
+                'allocations': allocations,
+                'shortfall': _from_cents(needed),
+            })
+
+        last_date = max([as_of] + [demand['needed_by'] for demand in queue])
+        horizon = (last_date + datetime.timedelta(days=horizon_days)).toordinal()
+        expiring_unused = [
+            {'lot_id': self.lot_ids[i], 'lot_number': self.lot_numbers[i], 'expiry_date': self.expiry_dates[i],
+             'quantity': _from_cents(remaining[i])}
+            for i in range(bisect_right(self.expiry_ordinals, horizon))
+            if remaining[i] > 0
+        ]
+
+        return {
+            'reagent': self.reagent_id,
+            'available': self.available,
+            'demands': results,
+            'total_shortfall': sum((result['shortfall'] for result in results), Decimal(0)),
+            'remaining': _from_cents(sum(remaining)),
+            'expiring_unused': expiring_unused,
+        }
@@ -0,0 +1,197 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from celery import states
+from celery.result import AsyncResult
+from celery.utils import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+
+from inventory.exports import EXPORT_CHUNK_SIZE, EXPORT_RENDERERS, EXPORT_WRITERS, queryset_columns
+from inventory.services import (
+    consumption_by_user_queryset, waste_loss_queryset, stock_value_queryset, expiry_report_queryset,
+)
+
+logger = logging.getLogger(__name__)
+
+REPORT_JOB_KEY = 'report-jobs:{spec_hash}'
+
+
+def _date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('true', 'false'):
+        return str(value).lower() == 'true'
+    raise ValueError(value)
+
+
+# Report name -> (queryset function, {param: (parser, required)}). Parameters
+# are those of the matching report endpoint; stock-value only runs grouped,
+# the ungrouped total being a single number.
+REPORT_JOB_TYPES = {
+    'consumption-by-user': (consumption_by_user_queryset, {
+        'start_date': (_date, True), 'end_date': (_date, True), 'user_id': (int, False), 'reagent_id': (int, False),
+    }),
+    'waste-loss': (waste_loss_queryset, {
+        'start_date': (_date, True), 'end_date': (_date, True), 'reagent_id': (int, False),
+    }),
+    'stock-value': (stock_value_queryset, {
+        'group_by': (str, True),
+    }),
+    'expiry': (expiry_report_queryset, {
+        'days_until_expiry': (int, False), 'expired': (_boolean, False),
+    }),
+}
+REPORT_JOB_FORMATS = {renderer.format: renderer for renderer in EXPORT_RENDERERS}
+
+
+def normalize_report_spec(data):
+    """
+    Validates a job request ({"report", "params", "format"}) and returns it
+    in canonical form, with parameters in their JSON representation, so
+    equal requests produce equal specs. Raises ValueError.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("The report spec must be an object.")
+    report = data.get('report')
+    if report not in REPORT_JOB_TYPES:
+        raise ValueError(f"report must be one of: {', '.join(REPORT_JOB_TYPES)}.")
+    export_format = data.get('format', 'csv')
+    if export_format not in REPORT_JOB_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(REPORT_JOB_FORMATS)}.")
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        raise ValueError("params must be an object.")
+
+    allowed = REPORT_JOB_TYPES[report][1]
+    unknown = set(params) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {report}: {', '.join(sorted(unknown))}.")
+    normalized = {}
+    for name, (parse, required) in allowed.items():
+        value = params.get(name)
+        if value is None or value == '':
+            if required:
+                raise ValueError(f"{name} is required for {report}.")
+            continue
+        try:
+            value = parse(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for {name}: {value!r}.")
+        normalized[name] = value.isoformat() if isinstance(value, datetime.date) else value
+
+    if report == 'stock-value':
+        # Raises the ValueError of an invalid group_by right away.
+        stock_value_queryset(normalized['group_by'])
+    return {'report': report, 'params': normalized, 'format': export_format}
+
+
+def report_spec_hash(spec):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def report_queryset(spec):
+    queryset_function, allowed = REPORT_JOB_TYPES[spec['report']]
+    params = {
+        name: _date(value) if allowed[name][0] is _date else value
+        for name, value in spec['params'].items()
+    }
+    return queryset_function(**params)
+
+
+def report_job_dir():
+    return Path(settings.MEDIA_ROOT) / settings.REPORT_JOB_DIR
+
+
+def write_report_file(spec, job_id):
+    """
+    Streams the report of `spec` into REPORT_JOB_DIR under MEDIA_ROOT and
+    returns the job's result metadata. The file only gets its final name
+    once completely written.
+    """
+    renderer = REPORT_JOB_FORMATS[spec['format']]
+    queryset = report_queryset(spec)
+    row_count = 0
+
+    def rows():
+        nonlocal row_count
+        for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            row_count += 1
+            yield row
+
+    directory = report_job_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{spec["report"]}-{job_id}.{renderer.format}'
+    partial = path.with_name(path.name + '.partial')
+    with open(partial, 'wb') as report_file:
+        for chunk in EXPORT_WRITERS[renderer.format](queryset_columns(queryset), rows()):
+            report_file.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    os.replace(partial, path)
+    return {
+        'file': str(path.relative_to(settings.MEDIA_ROOT)),
+        'content_type': renderer.media_type,
+        'rows': row_count,
+        'size': path.stat().st_size,
+        'spec': spec,
+        'generated_at': timezone.now().isoformat(),
+    }
+
+
+def start_report_job(spec):
+    """
+    Queues the generate_report task for a normalized `spec` and returns
+    (job_id, reused). A job for an identical spec started within
+    REPORT_JOB_TTL seconds is reused, unless it failed or its file is gone.
+
+    The job's result row is created as PENDING before the task is queued, so
+    a job id is known to the status endpoint from the start.
+    """
+    key = REPORT_JOB_KEY.format(spec_hash=report_spec_hash(spec))
+    job_id = cache.get(key)
+    if job_id:
+        result = AsyncResult(job_id)
+        if result.state not in states.PROPAGATE_STATES and (
+            result.state != states.SUCCESS or report_file_path(result.result)
+        ):
+            return job_id, True
+
+    from inventory.tasks import generate_report  # tasks imports this module
+    job_id = uuid()
+    TaskResult.objects.get_or_create(task_id=job_id, defaults={'task_name': generate_report.name, 'status': states.PENDING})
+    try:
+        generate_report.apply_async(args=[spec], task_id=job_id, retry=False)
+    except Exception:
+        logger.warning("Could not queue the report job, generating it inline.", exc_info=True)
+        generate_report.apply(args=[spec], task_id=job_id)
+    cache.set(key, job_id, timeout=settings.REPORT_JOB_TTL)
+    return job_id, False
+
+
+def get_report_job(job_id):
+    """Returns the AsyncResult of a report job, or None if there is no such job."""
+    # Without result_extended the backend does not keep task names, so a
+    # finished job is recognized by its result.
+    if not TaskResult.objects.filter(task_id=job_id).exists():
+        return None
+    result = AsyncResult(job_id)
+    if result.state == states.SUCCESS and not (isinstance(result.result, dict) and 'spec' in result.result):
+        return None
+    return result
+
+
+def report_file_path(result):
+    """The absolute path of a finished job's file, or None if it no longer exists."""
+    if not isinstance(result, dict) or 'file' not in result:
+        return None
+    path = Path(settings.MEDIA_ROOT) / result['file']
+    return path if path.is_file() else None
@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Reagent, StockLot, StockMovement, Category, Supplier, Location, Attachment, AuditLog, Requisition, User
+from rest_framework.reverse import reverse
+from django.db import transaction
+from .models import Reagent, StockLot, StockMovement, Category, Supplier, Location, Attachment, AuditLog, Requisition, User, Notification
 
 class ReagentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,25 +10,43 @@ class ReagentSerializer(serializers.ModelSerializer):
 
 class StockLotSerializer(serializers.ModelSerializer):
     qr_code_image = serializers.SerializerMethodField()
+    qr_code_url = serializers.SerializerMethodField()
 
     class Meta:
         model = StockLot
         fields = [
             'id', 'reagent', 'lot_number', 'location', 'expiry_date',
             'purchase_price', 'initial_quantity', 'current_quantity',
-            'entry_date', 'qr_code_image'
+            'entry_date', 'qr_code_image', 'qr_code_url'
         ]
 
+    def __init__(self, *args, **kwargs):
+        # The inline base64 image is several KB per lot; list views leave it out
+        # unless asked for and clients fetch `qr_code_url` instead.
+        include_qr = kwargs.pop('include_qr', True)
+        super().__init__(*args, **kwargs)
+        if not include_qr:
+            self.fields.pop('qr_code_image')
+
     def get_qr_code_image(self, obj):
         return obj.get_qr_code_image()
 
+    def get_qr_code_url(self, obj):
+        request = self.context.get('request')
+        if request is None:
+            return None
+        return reverse('stocklot-qr-png', kwargs={'pk': obj.pk}, request=request)
+
 class StockMovementSerializer(serializers.ModelSerializer):
     class Meta:
         model = StockMovement
         fields = ('id', 'stock_lot', 'user', 'quantity', 'move_type', 'timestamp', 'notes')
 
+    @transaction.atomic
     def create(self, validated_data):
-        stock_lot = validated_data.get('stock_lot')
+        # Re-read the lot under a row lock so concurrent movements cannot lose updates.
+        stock_lot = StockLot.objects.select_for_update().get(pk=validated_data['stock_lot'].pk)
+        validated_data['stock_lot'] = stock_lot
         quantity = validated_data.get('quantity')
         move_type = validated_data.get('move_type')
 
@@ -93,10 +113,19 @@ class AttachmentSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class AuditLogSerializer(serializers.ModelSerializer):
+    action_name = serializers.CharField(source='get_action_display', read_only=True)
+    object_type_name = serializers.CharField(source='get_object_type_display', read_only=True)
+
     class Meta:
         model = AuditLog
         fields = '__all__'
 
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ('id', 'alert', 'lot', 'message', 'is_read', 'created_at')
+        read_only_fields = fields
+
 class RequisitionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Requisition
@@ -1,67 +1,175 @@
-from django.db.models import Sum, F, Q
-from inventory.models import StockLot, Reagent, Requisition, User, StockMovement
-from django.db import transaction
+from django.db.models import Sum, F, Q, Count, Case, When
+from inventory.models import (
+    StockLot, Reagent, Requisition, User, StockMovement, ReagentStockSummary, AuditLog, DailyMovementRollup, day_start,
+)
+from inventory.audit import record_audit_event
+from inventory.alerts import queue_alert_evaluation
+from inventory.analytics import get_consumption_analytics
+from django.db import transaction, OperationalError
 from decimal import Decimal
+from contextlib import contextmanager
+from functools import wraps
 import datetime
+import random
+import time
+import logging
+import uuid
+from django.core.cache import cache
 from django.utils import timezone
 
-def get_lots_for_withdrawal(reagent_obj: Reagent, quantity_needed: float):
-    """
-    Applies FEFO (First-Expire, First-Out) logic to select stock lots for withdrawal.
-    Returns a list of (StockLot, quantity_to_withdraw) tuples.
+logger = logging.getLogger(__name__)
+
+WITHDRAWAL_RETRY_ATTEMPTS = 5
+WITHDRAWAL_RETRY_BACKOFF = 0.05  # seconds, scaled by attempt and jittered
+REQUISITION_BULK_ACTIONS = ('approve', 'reject')
+REQUISITION_BULK_MAX_ITEMS = 500
+DASHBOARD_EXPIRY_WINDOW_DAYS = 90
+DASHBOARD_CONSUMPTION_DAYS = 180
+DASHBOARD_VERSION_KEY = 'dashboard:version'
+DASHBOARD_SUMMARY_KEY = 'dashboard:summary'
+DASHBOARD_REFRESH_LOCK_KEY = 'dashboard:refresh-lock'
+DASHBOARD_REFRESH_LOCK_TIMEOUT = 60
+
+def retry_on_conflict(func):
     """
-    quantity_needed = Decimal(str(quantity_needed)) # Convert to Decimal
+    Runs `func` in its own transaction and retries it when the database reports
+    a lock or serialization conflict (SQLite "database is locked", PostgreSQL
+    serialization failures and deadlocks all surface as OperationalError).
 
-    # Get all available lots for the reagent, ordered by expiry date (FEFO)
-    available_lots = StockLot.objects.filter(
-        reagent=reagent_obj,
-        current_quantity__gt=0
-    ).order_by('expiry_date')
+    Nested calls run once inside the caller's transaction: only the outermost
+    transaction can be safely replayed.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if transaction.get_connection().in_atomic_block:
+            return func(*args, **kwargs)
+        for attempt in range(1, WITHDRAWAL_RETRY_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError:
+                if attempt == WITHDRAWAL_RETRY_ATTEMPTS:
+                    raise
+                logger.info("Conflict in %s, retrying (attempt %s).", func.__name__, attempt)
+                time.sleep(WITHDRAWAL_RETRY_BACKOFF * attempt * (1 + random.random()))
+    return wrapper
 
-    selected_lots_info = []
-    remaining_quantity = quantity_needed
+def allocate_fefo(lots, quantity_needed):
+    """
+    FEFO allocation over lots already sorted by expiry date, done in memory.
+    Returns (allocations, remaining): a list of (StockLot, quantity_to_withdraw)
+    tuples and the quantity that could not be covered. The lots are not modified.
+    """
+    allocations = []
+    remaining_quantity = Decimal(str(quantity_needed))
 
-    for lot in available_lots:
+    for lot in lots:
         if remaining_quantity <= 0:
             break
+        if lot.current_quantity <= 0:
+            continue
 
         if lot.current_quantity >= remaining_quantity:
             # This lot can cover the remaining quantity
-            selected_lots_info.append((lot, remaining_quantity))
+            allocations.append((lot, remaining_quantity))
             remaining_quantity = Decimal(0)
         else:
             # This lot is fully depleted
-            selected_lots_info.append((lot, lot.current_quantity))
+            allocations.append((lot, lot.current_quantity))
             remaining_quantity -= lot.current_quantity
 
+    return allocations, remaining_quantity
+
+def get_lots_for_withdrawal(reagent_obj: Reagent, quantity_needed: float, lock=False):
+    """
+    Applies FEFO (First-Expire, First-Out) logic to select stock lots for withdrawal.
+    Returns a list of (StockLot, quantity_to_withdraw) tuples.
+
+    With lock=True the candidate lots are locked (SELECT ... FOR UPDATE) until the
+    surrounding transaction ends, so the quantities read stay valid for the update.
+    """
+    quantity_needed = Decimal(str(quantity_needed)) # Convert to Decimal
+
+    # Get all available lots for the reagent, ordered by expiry date (FEFO)
+    available_lots = StockLot.objects.filter(
+        reagent=reagent_obj,
+        current_quantity__gt=0
+    ).order_by('expiry_date')
+    if lock:
+        available_lots = available_lots.select_for_update()
+
+    selected_lots_info, remaining_quantity = allocate_fefo(available_lots, quantity_needed)
+
     if remaining_quantity > 0:
         # Not enough stock to cover the withdrawal
         raise ValueError(f"Not enough stock for {reagent_obj.name}. Needed {quantity_needed}, available {quantity_needed - remaining_quantity}.")
 
     return selected_lots_info
 
-@transaction.atomic
-def perform_withdrawal(reagent_obj: Reagent, quantity_needed: float, user):
+def _withdraw_in_memory(allocations, user, notes=''):
     """
-    Performs a withdrawal operation, applying FEFO logic and updating stock quantities.
+    Applies FEFO allocations to the in-memory lots and returns the unsaved
+    'Retirada' movements; the caller persists both in bulk.
     """
-    selected_lots_info = get_lots_for_withdrawal(reagent_obj, quantity_needed)
-    
-    total_withdrawn = 0
-    for lot, qty_to_withdraw in selected_lots_info:
+    movements = []
+    for lot, qty_to_withdraw in allocations:
         lot.current_quantity -= qty_to_withdraw
-        lot.save()
-        total_withdrawn += qty_to_withdraw
-        # Here you would also create a StockMovement record
-        StockMovement.objects.create(stock_lot=lot, user=user, quantity=qty_to_withdraw, move_type='Retirada')
+        movements.append(StockMovement(
+            stock_lot=lot, user=user, quantity=qty_to_withdraw, move_type='Retirada', notes=notes
+        ))
+    return movements
+
+def _movement_audit_details(movements):
+    return [
+        {'lot_number': movement.stock_lot.lot_number, 'quantity': movement.quantity, 'movement_id': movement.pk}
+        for movement in movements
+    ]
+
+@retry_on_conflict
+def perform_withdrawal(reagent_obj: Reagent, quantity_needed: float, user, notes=''):
+    """
+    Performs a withdrawal operation, applying FEFO logic and updating stock quantities.
+    Safe under concurrent withdrawals: the lots are locked before they are read.
+
+    The writes are batched so the query count does not grow with the number of
+    lots: one UPDATE ... CASE for the lots, one INSERT for the movements and a
+    single audit record for the whole withdrawal. Bulk writes bypass the model
+    signals, so the stock summary, movement rollup and dashboard version are
+    updated here.
+    """
+    selected_lots_info = get_lots_for_withdrawal(reagent_obj, quantity_needed, lock=True)
+    movements = _withdraw_in_memory(selected_lots_info, user, notes)
+    total_withdrawn = sum((movement.quantity for movement in movements), Decimal(0))
+
+    StockLot.objects.bulk_update([lot for lot, qty in selected_lots_info], ['current_quantity'])
+    StockMovement.objects.bulk_create(movements)
+    # Saving the lots created the summary row, so a plain UPDATE is enough.
+    ReagentStockSummary.refresh(reagent_obj.pk, create=False)
+    DailyMovementRollup.apply(DailyMovementRollup.entry(movement, movement.stock_lot) for movement in movements)
+
+    record_audit_event(user=user, action=AuditLog.STOCK_WITHDRAWAL, instance=reagent_obj, details={
+        'quantity': total_withdrawn,
+        'notes': notes,
+        'lots': _movement_audit_details(movements),
+    })
+    # bulk_update/bulk_create send no signals, so the follow-ups are queued here.
+    queue_alert_evaluation([reagent_obj.pk])
+    transaction.on_commit(bump_dashboard_version)
 
     return total_withdrawn
 
-@transaction.atomic
+@retry_on_conflict
 def approve_requisition(requisition_obj: Requisition, approver_user: User):
     """
     Approves a requisition, updates its status, and performs the stock withdrawal.
     """
+    # Re-read the status under a row lock so two approvers cannot both withdraw.
+    locked_status = Requisition.objects.select_for_update().filter(
+        pk=requisition_obj.pk
+    ).values_list('status', flat=True).first()
+    if locked_status is not None:
+        requisition_obj.status = locked_status
+
     if requisition_obj.status != 'Pendente':
         raise ValueError("Requisition is not in 'Pendente' status.")
 
@@ -80,73 +188,207 @@ def approve_requisition(requisition_obj: Requisition, approver_user: User):
 
     return True
 
-def get_consumption_by_user_report(start_date, end_date, user_id=None, reagent_id=None):
+@retry_on_conflict
+def bulk_process_requisitions(requisition_ids, action, user):
     """
-    Generates a report on reagent consumption by user within a specified period.
+    Approves or rejects many requisitions in one transaction.
+
+    All requisitions are locked and read in one query and, for approvals, the
+    in-stock lots of every reagent involved in another; FEFO allocation then
+    runs in memory, oldest request first, and the writes go out in bulk. A
+    requisition that is not pending or lacks stock is reported and skipped
+    without failing the others.
+
+    Returns one result dict per id, in the order given.
     """
-    movements = StockMovement.objects.filter(
-        move_type='Retirada',
-        timestamp__range=(start_date, end_date)
+    if action not in REQUISITION_BULK_ACTIONS:
+        raise ValueError(f"action must be one of: {', '.join(REQUISITION_BULK_ACTIONS)}.")
+    requisition_ids = list(dict.fromkeys(requisition_ids))
+    if not requisition_ids:
+        raise ValueError("No requisition ids given.")
+    if len(requisition_ids) > REQUISITION_BULK_MAX_ITEMS:
+        raise ValueError(f"At most {REQUISITION_BULK_MAX_ITEMS} requisitions can be processed at once.")
+
+    requisitions = list(
+        Requisition.objects.select_for_update(of=('self',))
+        .select_related('reagent')
+        .filter(pk__in=requisition_ids)
+        .order_by('request_date', 'id')
     )
+    pending = [requisition for requisition in requisitions if requisition.status == 'Pendente']
+    results = {
+        requisition.pk: {'id': requisition.pk, 'success': False, 'status': requisition.status,
+                         'detail': "Requisition is not in 'Pendente' status."}
+        for requisition in requisitions
+    }
+
+    lots_by_reagent = {}
+    if action == 'approve' and pending:
+        lots = StockLot.objects.select_for_update().filter(
+            reagent_id__in={requisition.reagent_id for requisition in pending},
+            current_quantity__gt=0
+        ).order_by('reagent_id', 'expiry_date')
+        for lot in lots:
+            lots_by_reagent.setdefault(lot.reagent_id, []).append(lot)
+
+    now = timezone.now()
+    processed, touched_lots, movements = [], {}, []
+    for requisition in pending:
+        if action == 'approve':
+            allocations, remaining = allocate_fefo(lots_by_reagent.get(requisition.reagent_id, []), requisition.quantity)
+            if remaining > 0:
+                results[requisition.pk]['detail'] = (
+                    f"Not enough stock for {requisition.reagent.name}. Needed {requisition.quantity}, "
+                    f"available {requisition.quantity - remaining}."
+                )
+                continue
+            movements += _withdraw_in_memory(allocations, user, notes=f'Requisição #{requisition.pk}')
+            touched_lots.update((lot.pk, lot) for lot, qty in allocations)
+            requisition.status = 'Aprovada'
+        else:
+            requisition.status = 'Rejeitada'
+        requisition.approver = user
+        requisition.approval_date = now
+        processed.append(requisition)
+        results[requisition.pk] = {'id': requisition.pk, 'success': True, 'status': requisition.status, 'detail': None}
+
+    if touched_lots:
+        StockLot.objects.bulk_update(list(touched_lots.values()), ['current_quantity'])
+        StockMovement.objects.bulk_create(movements)
+        touched_reagent_ids = {lot.reagent_id for lot in touched_lots.values()}
+        ReagentStockSummary.rebuild(reagent_ids=touched_reagent_ids)
+        DailyMovementRollup.apply(DailyMovementRollup.entry(movement, movement.stock_lot) for movement in movements)
+        queue_alert_evaluation(touched_reagent_ids)
+    if processed:
+        Requisition.objects.bulk_update(processed, ['status', 'approver', 'approval_date'])
+        record_audit_event(user=user, action=AuditLog.BULK_REQUISITION_ACTION, details={
+            'action': action,
+            'requisitions': [
+                {'id': requisition.pk, 'reagent_id': requisition.reagent_id, 'quantity': requisition.quantity,
+                 'status': requisition.status}
+                for requisition in processed
+            ],
+            'lots': _movement_audit_details(movements),
+        })
+        transaction.on_commit(bump_dashboard_version)
+
+    return [
+        results.get(requisition_id, {'id': requisition_id, 'success': False, 'status': None, 'detail': 'Not found.'})
+        for requisition_id in requisition_ids
+    ]
+
+def _reads_rollup(start_date, end_date, movements):
+    """
+    Whether a report over `start_date`..`end_date` can read
+    DailyMovementRollup: both bounds must be whole days. The movement range
+    ends at end_date's midnight, so the days read are start_date to the day
+    before end_date, unless a movement sits on that very instant.
+    """
+    if isinstance(start_date, datetime.datetime) or isinstance(end_date, datetime.datetime):
+        return False
+    if not (isinstance(start_date, datetime.date) and isinstance(end_date, datetime.date)):
+        return False
+    return not movements.filter(timestamp=day_start(end_date)).exists()
+
+def consumption_by_user_queryset(start_date, end_date, user_id=None, reagent_id=None):
+    """
+    Withdrawn quantity per user and reagent within a specified period, as a
+    .values() queryset. Whole-day periods are read from the daily rollup.
+    """
+    movements = StockMovement.objects.filter(move_type='Retirada')
+    if _reads_rollup(start_date, end_date, movements):
+        rollups = DailyMovementRollup.objects.filter(
+            move_type='Retirada', date__gte=start_date, date__lt=end_date
+        )
+        if user_id:
+            rollups = rollups.filter(user_id=user_id)
+        if reagent_id:
+            rollups = rollups.filter(reagent_id=reagent_id)
+        return rollups.annotate(stock_lot__reagent__name=F('reagent__name')).values(
+            'user__username', 'stock_lot__reagent__name'
+        ).annotate(total_quantity=Sum('quantity')).order_by('user__username', 'stock_lot__reagent__name')
+
+    movements = movements.filter(timestamp__range=(start_date, end_date))
 
     if user_id:
         movements = movements.filter(user_id=user_id)
     if reagent_id:
         movements = movements.filter(stock_lot__reagent_id=reagent_id)
 
-    report_data = movements.values(
+    return movements.values(
         'user__username', 'stock_lot__reagent__name'
     ).annotate(total_quantity=Sum('quantity')).order_by('user__username', 'stock_lot__reagent__name')
 
-    return list(report_data)
+def get_consumption_by_user_report(start_date, end_date, user_id=None, reagent_id=None):
+    """
+    Generates a report on reagent consumption by user within a specified period.
+    """
+    return list(consumption_by_user_queryset(start_date, end_date, user_id=user_id, reagent_id=reagent_id))
 
-def get_waste_loss_report(start_date, end_date, reagent_id=None):
+def waste_loss_queryset(start_date, end_date, reagent_id=None):
     """
-    Generates a report on reagent waste and loss within a specified period.
+    Discarded and negatively adjusted quantity per reagent and movement type
+    within a specified period, as a .values() queryset. Whole-day periods are
+    read from the daily rollup.
     """
     movements = StockMovement.objects.filter(
-        timestamp__range=(start_date, end_date)
-    ).filter(
         Q(move_type='Descarte') | (Q(move_type='Ajuste') & Q(quantity__lt=0))
     )
+    if _reads_rollup(start_date, end_date, movements):
+        rollups = DailyMovementRollup.objects.filter(date__gte=start_date, date__lt=end_date).filter(
+            Q(move_type='Descarte') | Q(move_type='Ajuste', negative_count__gt=0)
+        )
+        if reagent_id:
+            rollups = rollups.filter(reagent_id=reagent_id)
+        return rollups.annotate(stock_lot__reagent__name=F('reagent__name')).values(
+            'stock_lot__reagent__name', 'move_type'
+        ).annotate(total_quantity=Sum(
+            Case(When(move_type='Ajuste', then='negative_quantity'), default='quantity')
+        )).order_by('stock_lot__reagent__name', 'move_type')
+
+    movements = movements.filter(timestamp__range=(start_date, end_date))
 
     if reagent_id:
         movements = movements.filter(stock_lot__reagent_id=reagent_id)
 
-    report_data = movements.values(
+    return movements.values(
         'stock_lot__reagent__name', 'move_type'
     ).annotate(total_quantity=Sum('quantity')).order_by('stock_lot__reagent__name', 'move_type')
 
-    return list(report_data)
+def get_waste_loss_report(start_date, end_date, reagent_id=None):
+    """
+    Generates a report on reagent waste and loss within a specified period.
+    """
+    return list(waste_loss_queryset(start_date, end_date, reagent_id=reagent_id))
 
-def get_stock_value_report(group_by=None):
+def stock_value_queryset(group_by):
     """
-    Calculates the total value of all stock lots, optionally grouped by category or location.
+    Value of the lots in stock per category or location, as a .values()
+    queryset.
     """
-    if group_by not in [None, 'category', 'location']:
+    if group_by not in ['category', 'location']:
         raise ValueError("Invalid group_by parameter. Must be 'category', 'location', or None.")
 
-    stock_value_query = StockLot.objects.filter(current_quantity__gt=0)
+    field = 'reagent__category__name' if group_by == 'category' else 'location__name'
+    return StockLot.objects.filter(current_quantity__gt=0).values(
+        field
+    ).annotate(total_value=Sum(F('current_quantity') * F('purchase_price'))).order_by(field)
 
-    if group_by == 'category':
-        report_data = stock_value_query.values(
-            'reagent__category__name'
-        ).annotate(total_value=Sum(F('current_quantity') * F('purchase_price'))).order_by('reagent__category__name')
-    elif group_by == 'location':
-        report_data = stock_value_query.values(
-            'location__name'
-        ).annotate(total_value=Sum(F('current_quantity') * F('purchase_price'))).order_by('location__name')
-    else:
-        total_value = stock_value_query.aggregate(
-            total_value=Sum(F('current_quantity') * F('purchase_price'))
-        )['total_value'] or Decimal(0)
-        return {'total_value': total_value}
+def get_stock_value_report(group_by=None):
+    """
+    Calculates the total value of all stock lots, optionally grouped by category or location.
+    """
+    if group_by is not None:
+        return list(stock_value_queryset(group_by))
 
-    return list(report_data)
+    total_value = StockLot.objects.filter(current_quantity__gt=0).aggregate(
+        total_value=Sum(F('current_quantity') * F('purchase_price'))
+    )['total_value'] or Decimal(0)
+    return {'total_value': total_value}
 
-def get_expiry_report(days_until_expiry=None, expired=False):
+def expiry_report_queryset(days_until_expiry=None, expired=False):
     """
-    Generates a report of reagents with upcoming or past expiry dates.
+    Lots in stock with upcoming or past expiry dates, as a .values() queryset.
     """
     today = timezone.now().date()
     
@@ -161,11 +403,15 @@ def get_expiry_report(days_until_expiry=None, expired=False):
         # If no parameters, return all lots with future expiry dates
         lots = lots.filter(expiry_date__gte=today)
 
-    report_data = lots.values(
+    return lots.values(
         'reagent__name', 'lot_number', 'expiry_date', 'current_quantity', 'location__name'
     ).order_by('expiry_date', 'reagent__name')
 
-    return list(report_data)
+def get_expiry_report(days_until_expiry=None, expired=False):
+    """
+    Generates a report of reagents with upcoming or past expiry dates.
+    """
+    return list(expiry_report_queryset(days_until_expiry=days_until_expiry, expired=expired))
 
 def calculate_total_stock_value():
     """
@@ -173,4 +419,135 @@ def calculate_total_stock_value():
     """
     return StockLot.objects.filter(current_quantity__gt=0).aggregate(
         total=Sum(F('current_quantity') * F('purchase_price'))
-    ).get('total') or Decimal(0)
\ No newline at end of file
+    ).get('total') or Decimal(0)
+
+@contextmanager
+def _timed(timings, section):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[section] = round((time.perf_counter() - start) * 1000, 2)
+
+def get_dashboard_summary():
+    """
+    Computes the dashboard payload in a fixed number of queries. Returns the
+    data and the time spent on each section, in milliseconds.
+    """
+    timings = {}
+    today = timezone.localdate()
+    expiry_horizon = today + datetime.timedelta(days=DASHBOARD_EXPIRY_WINDOW_DAYS)
+
+    with _timed(timings, 'stock'):
+        # Total value and the expiry pie chart in a single pass over in-stock lots.
+        stock = StockLot.objects.filter(current_quantity__gt=0).aggregate(
+            total_value=Sum(F('current_quantity') * F('purchase_price')),
+            expired=Count('id', filter=Q(expiry_date__lt=today)),
+            expiring_soon=Count('id', filter=Q(expiry_date__gte=today, expiry_date__lte=expiry_horizon)),
+            valid=Count('id', filter=Q(expiry_date__gt=expiry_horizon)),
+        )
+
+    with _timed(timings, 'low_stock'):
+        low_stock_items = Reagent.objects.filter(min_stock_level__gt=0).filter(
+            Q(stock_summary__total_quantity__lt=F('min_stock_level')) | Q(stock_summary__isnull=True)
+        ).values('name', 'sku', 'min_stock_level', current_total_stock=F('stock_summary__total_quantity'))
+        low_stock_items_data = [
+            {'name': item['name'], 'sku': item['sku'], 'current_stock': item['current_total_stock'] or 0, 'min_stock': item['min_stock_level']}
+            for item in low_stock_items
+        ]
+
+    with _timed(timings, 'expiring_soon'):
+        expiring_soon_items = StockLot.objects.filter(
+            expiry_date__lte=expiry_horizon,
+            expiry_date__gte=today,
+            current_quantity__gt=0
+        ).values('reagent__name', 'lot_number', 'expiry_date', 'current_quantity')
+        expiring_soon_items_data = [
+            {'reagent': item['reagent__name'], 'lot_number': item['lot_number'], 'expiry_date': item['expiry_date'], 'quantity': item['current_quantity']}
+            for item in expiring_soon_items
+        ]
+
+    with _timed(timings, 'consumption'):
+        consumption = get_consumption_analytics(
+            today - datetime.timedelta(days=DASHBOARD_CONSUMPTION_DAYS), today, bucket='month'
+        )
+
+    data = {
+        'total_stock_value': stock['total_value'] or Decimal(0),
+        'low_stock_items': low_stock_items_data,
+        'expiring_soon_items': expiring_soon_items_data,
+        'consumption_data': {
+            'labels': consumption['labels'],
+            'values': consumption['total']['quantities'],
+        },
+        'expiry_data': {
+            'labels': ['Vencidos', 'Vencem em 90 dias', 'Válidos'],
+            'values': [stock['expired'], stock['expiring_soon'], stock['valid']],
+        },
+    }
+    return data, timings
+
+def get_dashboard_version():
+    # A random token rather than a counter: if the cache loses the key, the new
+    # version can never match an entry computed before the eviction.
+    return cache.get_or_set(DASHBOARD_VERSION_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+def bump_dashboard_version():
+    """
+    Marks the cached dashboard as stale. Called on commit of writes to lots,
+    movements, requisitions and reagents.
+    """
+    cache.set(DASHBOARD_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+def refresh_dashboard_summary_cache():
+    """
+    Recomputes the dashboard and stores it under the version read beforehand,
+    so a write that lands mid-computation still leaves the entry stale.
+    """
+    version = get_dashboard_version()
+    data, timings = get_dashboard_summary()
+    cache.set(DASHBOARD_SUMMARY_KEY, {
+        'version': version,
+        'date': timezone.localdate(),
+        'data': data,
+        'timings': timings,
+    }, timeout=None)
+    cache.delete(DASHBOARD_REFRESH_LOCK_KEY)
+    return data, timings
+
+def _schedule_dashboard_refresh():
+    """
+    Queues a background refresh unless one is already pending. Returns False
+    when the broker is unreachable, so the caller can refresh inline instead.
+    """
+    if not cache.add(DASHBOARD_REFRESH_LOCK_KEY, True, timeout=DASHBOARD_REFRESH_LOCK_TIMEOUT):
+        return True  # A refresh is already queued or running.
+    from inventory.tasks import refresh_dashboard_summary  # tasks imports this module
+    try:
+        refresh_dashboard_summary.apply_async(retry=False)
+    except Exception:
+        logger.warning("Could not queue the dashboard refresh, computing it inline.", exc_info=True)
+        cache.delete(DASHBOARD_REFRESH_LOCK_KEY)
+        return False
+    return True
+
+def get_cached_dashboard_summary():
+    """
+    Stale-while-revalidate access to the dashboard summary. Returns
+    (data, timings, cache_state) where cache_state is 'hit', 'stale' or 'miss'.
+
+    Only a cold cache computes on the request path; a stale entry is served as
+    is while a Celery task recomputes it.
+    """
+    entry = cache.get(DASHBOARD_SUMMARY_KEY)
+    if entry is None:
+        data, timings = refresh_dashboard_summary_cache()
+        return data, timings, 'miss'
+
+    if entry['version'] == get_dashboard_version() and entry['date'] == timezone.localdate():
+        return entry['data'], entry['timings'], 'hit'
+
+    if not _schedule_dashboard_refresh():
+        data, timings = refresh_dashboard_summary_cache()
+        return data, timings, 'miss'
+    return entry['data'], entry['timings'], 'stale'
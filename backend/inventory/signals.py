@@ -1,12 +1,25 @@
-import json
-from django.db.models.signals import post_save, post_delete
+from types import SimpleNamespace
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
+from django.db import transaction
 from django.contrib.auth import get_user_model
-from .models import Category, Supplier, Location, Reagent, StockLot, StockMovement, Attachment, Requisition, AuditLog
-from .utils import CustomJsonEncoder # Import the custom encoder
+from .models import Category, Supplier, Location, Reagent, StockLot, StockMovement, Attachment, Requisition, ReagentStockSummary, AuditLog, Alert, Notification, DailyMovementRollup
+from .utils import get_qr_code_png
+from .services import bump_dashboard_version
+from .audit import record_audit_event
+from .alerts import queue_alert_evaluation, invalidate_unread_counts
 
 User = get_user_model()
 
+# Never copied into audit entries.
+AUDIT_EXCLUDED_FIELDS = {'password'}
+# Fields that decide which DailyMovementRollup row a movement counts in, and with what.
+ROLLUP_MOVEMENT_FIELDS = {'stock_lot_id', 'user_id', 'move_type', 'quantity', 'timestamp'}
+ROLLUP_LOT_FIELDS = {'reagent_id', 'location_id', 'purchase_price'}
+
+def _audit_values(values):
+    return {name: value for name, value in values.items() if name not in AUDIT_EXCLUDED_FIELDS}
+
 @receiver(post_save, sender=Category)
 @receiver(post_save, sender=Supplier)
 @receiver(post_save, sender=Location)
@@ -17,20 +30,23 @@ User = get_user_model()
 @receiver(post_save, sender=Requisition)
 @receiver(post_save, sender=User)
 def log_model_save(sender, instance, created, **kwargs):
-    action = 'CREATE' if created else 'UPDATE'
-    
-    # Sanitize instance data for JSON serialization
-    instance_data = instance.__dict__.copy()
-    if '_state' in instance_data:
-        del instance_data['_state']
-    
-    details = {
-        'model': sender.__name__,
-        'id': instance.pk,
-        'data': instance_data
-    }
+    """
+    One audit row per save: the field values on create, otherwise only the
+    fields that changed since the instance was loaded. The model and id live
+    in the row's own columns, not in `details`.
+    """
+    if created:
+        action = AuditLog.CREATE
+        details = _audit_values(instance.field_values())
+        details.pop(sender._meta.pk.attname, None)
+    else:
+        changes = _audit_values(instance.get_changed_fields())
+        if not changes:
+            return
+        action = AuditLog.STATUS_CHANGE if 'status' in changes else AuditLog.UPDATE
+        details = {name: [old, new] for name, (old, new) in changes.items()}
     user = None # Placeholder
-    AuditLog.objects.create(user=user, action=f'{action}_{sender.__name__.upper()}', details=details)
+    record_audit_event(user=user, action=action, details=details, instance=instance)
 
 @receiver(post_delete, sender=Category)
 @receiver(post_delete, sender=Supplier)
@@ -42,73 +58,124 @@ def log_model_save(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=Requisition)
 @receiver(post_delete, sender=User)
 def log_model_delete(sender, instance, **kwargs):
-    action = 'DELETE'
-    
-    # Sanitize instance data for JSON serialization
-    instance_data = instance.__dict__.copy()
-    if '_state' in instance_data:
-        del instance_data['_state']
-
-    details = {
-        'model': sender.__name__,
-        'id': instance.pk,
-        'data': instance_data
-    }
+    details = _audit_values(instance.field_values())
+    details.pop(sender._meta.pk.attname, None)
     user = None # Placeholder
-    AuditLog.objects.create(user=user, action=f'{action}_{sender.__name__.upper()}', details=details)
+    record_audit_event(user=user, action=AuditLog.DELETE, details=details, instance=instance)
 
-# Additional signals for critical actions
-from django.db.models.signals import m2m_changed
-from django.dispatch import receiver
-from .models import Requisition
+@receiver(post_save, sender=StockLot)
+def precompute_stock_lot_qr_code(sender, instance, created, **kwargs):
+    """
+    Render the lot's QR code once at creation so list serialization only hits the cache.
+    """
+    if created:
+        get_qr_code_png(instance.qr_code_data)
 
-@receiver(post_save, sender=Requisition)
-def log_requisition_status_change(sender, instance, created, **kwargs):
+@receiver(post_delete, sender=StockLot)
+def update_reagent_stock_summary(sender, instance, **kwargs):
     """
-    Log when a requisition status changes.
+    Saves go through StockLot.save; deletes (including cascades) land here.
     """
-    if not created:  # Only for updates
-        # Check if status has changed by comparing with database value
-        try:
-            old_instance = Requisition.objects.get(pk=instance.pk)
-            if old_instance.status != instance.status:
-                details = {
-                    'model': 'Requisition',
-                    'id': instance.pk,
-                    'old_status': old_instance.status,
-                    'new_status': instance.status,
-                    'reagent': instance.reagent.name if instance.reagent else None,
-                    'requester': instance.requester.username if instance.requester else None,
-                    'approver': instance.approver.username if instance.approver else None
-                }
-                user = None  # Placeholder for now
-                AuditLog.objects.create(
-                    user=user, 
-                    action='UPDATE_REQUISITION_STATUS', 
-                    details=details
-                )
-        except Requisition.DoesNotExist:
-            pass  # Object was just created, no status change to log
+    ReagentStockSummary.refresh(instance.reagent_id, create=False)
+
+def _movement_lot(movement, lot_id=None):
+    if lot_id is None and StockMovement.stock_lot.is_cached(movement):
+        return movement.stock_lot
+    return StockLot.objects.filter(pk=lot_id or movement.stock_lot_id).first()
 
 @receiver(post_save, sender=StockMovement)
-def log_stock_movement_details(sender, instance, created, **kwargs):
+def update_movement_rollup(sender, instance, created, using, **kwargs):
     """
-    Log detailed information about stock movements.
+    Adds the movement to its daily rollup row in the same transaction; an
+    edit first takes the movement's previous values back out.
     """
-    if created:
-        details = {
-            'model': 'StockMovement',
-            'id': instance.pk,
-            'reagent': instance.stock_lot.reagent.name if instance.stock_lot and instance.stock_lot.reagent else None,
-            'lot_number': instance.stock_lot.lot_number if instance.stock_lot else None,
-            'quantity': float(instance.quantity) if instance.quantity else None,
-            'move_type': instance.move_type,
-            'user': instance.user.username if instance.user else None,
-            'notes': instance.notes
-        }
-        user = None  # Placeholder for now
-        AuditLog.objects.create(
-            user=user, 
-            action='CREATE_STOCK_MOVEMENT', 
-            details=details
-        )
\ No newline at end of file
+    entries = []
+    if not created:
+        if not ROLLUP_MOVEMENT_FIELDS & set(instance.get_changed_fields()):
+            return
+        previous = SimpleNamespace(**{name: instance.get_loaded_value(name) for name in ROLLUP_MOVEMENT_FIELDS})
+        previous_lot = _movement_lot(instance, previous.stock_lot_id) if previous.timestamp else None
+        if previous_lot is not None:
+            entries.append(DailyMovementRollup.entry(previous, previous_lot, sign=-1))
+    lot = _movement_lot(instance)
+    if lot is not None:
+        entries.append(DailyMovementRollup.entry(instance, lot))
+    DailyMovementRollup.apply(entries, using=using)
+
+@receiver(post_delete, sender=StockMovement)
+def remove_from_movement_rollup(sender, instance, using, **kwargs):
+    # During a lot's cascade delete its movements go first, so the lot is still readable.
+    lot = _movement_lot(instance)
+    if lot is not None:
+        DailyMovementRollup.apply([DailyMovementRollup.entry(instance, lot, sign=-1)], using=using)
+
+@receiver(post_save, sender=StockLot)
+def move_lot_rollups(sender, instance, created, using, **kwargs):
+    """
+    A lot moved to another reagent or location, or repriced, carries its
+    movements' rollup totals along.
+    """
+    if created or not ROLLUP_LOT_FIELDS & set(instance.get_changed_fields()):
+        return
+    previous_lot = SimpleNamespace(**{name: instance.get_loaded_value(name) for name in ROLLUP_LOT_FIELDS})
+    if None in vars(previous_lot).values():
+        return
+    entries = []
+    for movement in instance.stockmovement_set.all():
+        entries.append(DailyMovementRollup.entry(movement, previous_lot, sign=-1))
+        entries.append(DailyMovementRollup.entry(movement, instance))
+    DailyMovementRollup.apply(entries, using=using)
+
+@receiver(post_save, sender=Reagent)
+@receiver(post_save, sender=StockLot)
+@receiver(post_save, sender=StockMovement)
+@receiver(post_save, sender=Requisition)
+@receiver(post_delete, sender=Reagent)
+@receiver(post_delete, sender=StockLot)
+@receiver(post_delete, sender=StockMovement)
+@receiver(post_delete, sender=Requisition)
+def invalidate_dashboard_summary(sender, **kwargs):
+    # Only after commit, so a refresh cannot cache data from an uncommitted write.
+    transaction.on_commit(bump_dashboard_version)
+
+@receiver(post_save, sender=StockLot)
+@receiver(post_delete, sender=StockLot)
+@receiver(post_save, sender=Alert)
+def evaluate_alerts_on_change(sender, instance, **kwargs):
+    """
+    Re-evaluates the reagent's alerts once the change commits. A lot moved to
+    another reagent affects both.
+    """
+    reagent_ids = {instance.reagent_id}
+    if sender is StockLot and instance.get_loaded_value('reagent_id') is not None:
+        reagent_ids.add(instance.get_loaded_value('reagent_id'))
+    queue_alert_evaluation(reagent_ids)
+
+@receiver(m2m_changed, sender=Alert.users_to_notify.through)
+def evaluate_alerts_on_new_recipients(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Recipients are added after the alert is saved, so the save's evaluation
+    finds nobody to notify; evaluate again once they are there.
+    """
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        reagent_ids = set(Alert.objects.filter(pk__in=pk_set).values_list('reagent_id', flat=True))
+    else:
+        reagent_ids = {instance.reagent_id}
+    queue_alert_evaluation(reagent_ids)
+
+@receiver(post_save, sender=StockMovement)
+@receiver(post_delete, sender=StockMovement)
+def evaluate_alerts_on_movement(sender, instance, **kwargs):
+    if StockMovement.stock_lot.is_cached(instance):
+        reagent_id = instance.stock_lot.reagent_id
+    else:
+        reagent_id = StockLot.objects.filter(pk=instance.stock_lot_id).values_list('reagent_id', flat=True).first()
+    if reagent_id is not None:
+        queue_alert_evaluation([reagent_id])
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def invalidate_notification_count(sender, instance, **kwargs):
+    invalidate_unread_counts([instance.user_id])
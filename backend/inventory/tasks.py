@@ -1,50 +1,109 @@
-from celery import shared_task
-from django.db.models import Sum
-from datetime import date, timedelta
-from .models import Alert, Notification, StockLot
+import datetime
+import logging
+import time
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import OperationalError
+from django.utils import timezone
+from .models import AuditLog, DailyMovementRollup
+from .alerts import (
+    evaluate_alerts, last_expiry_scan, record_expiry_scan, alert_reagent_ids, partition_reagent_ids,
+)
+from .services import refresh_dashboard_summary_cache, bump_dashboard_version
+from .audit import deserialize_audit_events
+from .partitions import ensure_audit_partitions
+from .report_jobs import write_report_file
+
+logger = logging.getLogger(__name__)
 
 @shared_task
 def check_alerts():
-    active_alerts = Alert.objects.filter(is_active=True)
-
-    for alert in active_alerts:
-        if alert.alert_type == 'low_stock':
-            # Calculate the total current quantity for the reagent across all its stock lots
-            total_quantity = StockLot.objects.filter(reagent=alert.reagent).aggregate(total=Sum('current_quantity'))['total'] or 0
-
-            if total_quantity < alert.threshold_value:
-                message = f"Alerta de estoque baixo para {alert.reagent.name}. Quantidade atual: {total_quantity}, Limite: {alert.threshold_value}."
-                
-                # Create notification for all users linked to the alert
-                for user in alert.users_to_notify.all():
-                    # Avoid creating duplicate notifications
-                    Notification.objects.get_or_create(
-                        user=user, 
-                        alert=alert, 
-                        message=message, 
-                        is_read=False
-                    )
-        
-        elif alert.alert_type == 'expiry_date':
-            # Calculate the date threshold
-            threshold_days = int(alert.threshold_value)
-            expiry_limit_date = date.today() + timedelta(days=threshold_days)
-
-            # Find stock lots expiring within the threshold
-            expiring_lots = StockLot.objects.filter(
-                reagent=alert.reagent,
-                expiry_date__lte=expiry_limit_date,
-                current_quantity__gt=0  # Only consider lots that are still in stock
-            )
-
-            if expiring_lots.exists():
-                for lot in expiring_lots:
-                    message = f"Alerta de validade para {alert.reagent.name} (Lote: {lot.lot_number}). Vence em: {lot.expiry_date.strftime('%d/%m/%Y')}."
-                    
-                    for user in alert.users_to_notify.all():
-                        Notification.objects.get_or_create(
-                            user=user,
-                            alert=alert,
-                            message=message,
-                            is_read=False
-                        )
\ No newline at end of file
+    """
+    Coordinates the periodic expiry scan. Stock-driven conditions are
+    evaluated as changes commit (see alerts.queue_alert_evaluation), so the
+    scan only looks for lots whose expiry window opened since the previous
+    one. The reagents with expiry alerts are split into ALERT_SCAN_SHARDS id
+    ranges, evaluated by a chord of evaluate_alert_chunk tasks across the
+    worker pool, and finish_expiry_scan aggregates their metrics.
+    """
+    today = timezone.localdate()
+    since = last_expiry_scan()
+    if since is not None and since >= today:
+        return {'shards': 0, 'reagents': 0}
+
+    alert_types = ['expiry_date']
+    reagent_ids = alert_reagent_ids(alert_types)
+    chunks = partition_reagent_ids(reagent_ids, settings.ALERT_SCAN_SHARDS)
+    if not chunks:
+        record_expiry_scan(today)
+        return {'shards': 0, 'reagents': 0}
+
+    expiry_since = since.isoformat() if since else None
+    chord(
+        evaluate_alert_chunk.s(shard, chunk, today.isoformat(), alert_types, expiry_since)
+        for shard, chunk in enumerate(chunks)
+    )(finish_expiry_scan.s(today.isoformat()))
+    return {'shards': len(chunks), 'reagents': len(reagent_ids)}
+
+@shared_task
+def evaluate_alert_chunk(shard, reagent_ids, today, alert_types=None, expiry_since=None):
+    start = time.perf_counter()
+    result = evaluate_alerts(
+        reagent_ids=reagent_ids,
+        today=datetime.date.fromisoformat(today),
+        alert_types=alert_types,
+        expiry_since=datetime.date.fromisoformat(expiry_since) if expiry_since else None,
+    )
+    result.update(
+        shard=shard, reagents=len(reagent_ids),
+        duration_ms=round((time.perf_counter() - start) * 1000, 1),
+    )
+    return result
+
+@shared_task
+def finish_expiry_scan(results, today):
+    # Only runs once every chunk succeeded; otherwise the next scan covers the same window again.
+    summary = {
+        key: sum(result[key] for result in results)
+        for key in ('reagents', 'alerts', 'triggered', 'notifications')
+    }
+    summary['shards'] = len(results)
+    summary['slowest_shard_ms'] = max((result['duration_ms'] for result in results), default=0)
+    record_expiry_scan(datetime.date.fromisoformat(today))
+    logger.info("Expiry scan for %s: %s", today, summary)
+    return summary
+
+@shared_task
+def evaluate_reagent_alerts(reagent_ids):
+    return evaluate_alerts(reagent_ids=reagent_ids)
+
+@shared_task
+def refresh_dashboard_summary():
+    refresh_dashboard_summary_cache()
+
+# acks_late: a worker lost mid-insert leaves the message on the queue to be redelivered.
+@shared_task(acks_late=True, autoretry_for=(OperationalError,), retry_backoff=True, max_retries=10)
+def write_audit_log_events(events):
+    AuditLog.objects.bulk_create(deserialize_audit_events(events))
+
+@shared_task
+def create_audit_partitions():
+    # Partitions must exist before their month starts; a no-op unless the table is partitioned.
+    ensure_audit_partitions()
+
+@shared_task
+def rebuild_movement_rollups():
+    days = settings.MOVEMENT_ROLLUP_REBUILD_DAYS
+    start = timezone.localdate() - datetime.timedelta(days=days - 1) if days else None
+    rows = DailyMovementRollup.rebuild(start=start)
+    # Cached dashboard and analytics responses may hold totals that were repaired.
+    bump_dashboard_version()
+    logger.info("Movement rollups rebuilt since %s: %d rows", start or 'the first movement', rows)
+    return rows
+
+# store_eager_result: a job generated inline when the broker is down still gets its result row.
+@shared_task(bind=True, store_eager_result=True)
+def generate_report(self, spec):
+    # The returned metadata is stored by the django-db result backend.
+    return write_report_file(spec, self.request.id)
@@ -1,6 +1,8 @@
 import pytest
+from django.core.cache import cache
 from rest_framework.test import APIClient
 from inventory.models import User
+from config.celery import app as celery_app
 
 @pytest.fixture
 def api_client():
@@ -17,4 +19,13 @@ def authenticated_client():
         role='Analista'
     )
     client.force_authenticate(user=user)
-    return client, user
\ No newline at end of file
+    return client, user
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Isola o cache (QR codes, dashboard) entre os testes."""
+    cache.clear()
+
+@pytest.fixture
+def eager_celery(monkeypatch):
+    """Executa as tarefas do Celery no próprio processo, como um worker faria."""
+    monkeypatch.setattr(celery_app.conf, 'task_always_eager', True)
@@ -0,0 +1,351 @@
+import pytest
+import datetime
+from decimal import Decimal
+from inventory.models import Category, Supplier, Location, Reagent, StockLot, Alert, Notification, User, ReagentStockSummary
+from django.core.cache import cache
+from django.test import override_settings
+from freezegun import freeze_time
+from inventory import tasks
+from inventory.tasks import check_alerts
+from inventory.alerts import evaluate_alerts, get_unread_count, partition_reagent_ids, EXPIRY_SCAN_KEY
+from inventory.services import perform_withdrawal
+
+TODAY = datetime.date.today()
+
+
+@pytest.fixture
+def alert_setup():
+    category = Category.objects.create(name='Alertas')
+    supplier = Supplier.objects.create(name='Fornecedor Alertas')
+    location = Location.objects.create(name='Armário Alertas')
+    users = [User.objects.create_user(username=f'notificado{i}', password='testpass') for i in range(2)]
+
+    def make_reagent(sku, lots):
+        reagent = Reagent.objects.create(
+            name=f'Reagente {sku}', sku=sku, category=category, supplier=supplier, min_stock_level=Decimal('1.00')
+        )
+        for number, days, quantity in lots:
+            StockLot.objects.create(
+                reagent=reagent, lot_number=number, location=location,
+                expiry_date=TODAY + datetime.timedelta(days=days), purchase_price=Decimal('1.00'),
+                initial_quantity=Decimal('10.00'), current_quantity=Decimal(quantity)
+            )
+        return reagent
+
+    def make_alert(reagent, alert_type, threshold, recipients=None):
+        alert = Alert.objects.create(
+            name=f'{alert_type} {reagent.sku}', reagent=reagent, alert_type=alert_type,
+            threshold_value=Decimal(threshold)
+        )
+        alert.users_to_notify.set(users if recipients is None else recipients)
+        return alert
+
+    return make_reagent, make_alert, users
+
+
+@pytest.mark.django_db
+class TestEvaluateAlerts:
+    """Testes para a avaliação das regras de alerta em conjunto"""
+
+    def test_low_stock_notifies_every_recipient(self, alert_setup):
+        """Reagentes abaixo do limite notificam todos os destinatários do alerta"""
+        make_reagent, make_alert, users = alert_setup
+        low = make_reagent('BAIXO', [('B-1', 100, '2.00')])
+        enough = make_reagent('OK', [('OK-1', 100, '20.00')])
+        empty = make_reagent('VAZIO', [])
+        alert = make_alert(low, 'low_stock', '5.00')
+        make_alert(enough, 'low_stock', '5.00')
+        make_alert(empty, 'low_stock', '5.00', recipients=users[:1])
+
+        evaluate_alerts()
+
+        assert Notification.objects.filter(alert=alert).count() == 2
+        assert 'Quantidade atual: 2.00, Limite: 5.00' in Notification.objects.filter(alert=alert).first().message
+        assert Notification.objects.filter(alert__reagent=empty).count() == 1
+        assert not Notification.objects.filter(alert__reagent=enough).exists()
+
+    @override_settings(TIME_ZONE='America/Sao_Paulo')
+    def test_period_follows_the_django_time_zone(self, alert_setup):
+        """O dia da notificação é o do fuso horário do Django, não o do servidor"""
+        make_reagent, make_alert, users = alert_setup
+        alert = make_alert(make_reagent('FUSO', [('Z-1', 100, '2.00')]), 'low_stock', '5.00', recipients=users[:1])
+
+        with freeze_time('2025-03-01 01:00:00'):
+            evaluate_alerts()
+
+        assert Notification.objects.get(alert=alert).dedupe_key == f'{alert.pk}:-:low_stock:2025-02-28'
+
+    def test_expiry_notifies_each_lot_in_window(self, alert_setup):
+        """Cada lote com saldo que vence dentro do prazo do alerta gera uma notificação"""
+        make_reagent, make_alert, users = alert_setup
+        reagent = make_reagent('VENCE', [('V-1', 5, '1.00'), ('V-2', 20, '1.00'), ('V-3', 60, '1.00'), ('V-0', 1, '0.00')])
+        other = make_reagent('OUTRO', [('O-1', 50, '1.00')])
+        make_alert(reagent, 'expiry_date', '30', recipients=users[:1])
+        make_alert(other, 'expiry_date', '10', recipients=users[:1])
+
+        evaluate_alerts()
+
+        messages = sorted(Notification.objects.values_list('message', flat=True))
+        assert len(messages) == 2
+        assert 'Lote: V-1' in messages[0] and 'Lote: V-2' in messages[1]
+
+    def test_rerun_does_not_duplicate(self, alert_setup):
+        """Rodar de novo não duplica notificações do mesmo lote, lidas ou não"""
+        make_reagent, make_alert, users = alert_setup
+        alert = make_alert(make_reagent('REPETE', [('R-1', 3, '1.00')]), 'expiry_date', '10')
+
+        evaluate_alerts()
+        evaluate_alerts()
+        assert Notification.objects.filter(alert=alert).count() == 2
+
+        Notification.objects.filter(user=users[0]).update(is_read=True)
+        evaluate_alerts()
+        assert Notification.objects.filter(alert=alert).count() == 2
+        assert Notification.objects.get(user=users[0]).is_read
+
+    def test_low_stock_is_upserted_per_day(self, alert_setup):
+        """Estoque baixo gera uma notificação por dia, com a quantidade atualizada a cada avaliação"""
+        make_reagent, make_alert, users = alert_setup
+        reagent = make_reagent('DIARIO', [('D-1', 100, '4.00')])
+        alert = make_alert(reagent, 'low_stock', '5.00', recipients=users[:1])
+
+        evaluate_alerts()
+        ReagentStockSummary.objects.filter(reagent=reagent).update(total_quantity=Decimal('3.00'))
+        evaluate_alerts()
+
+        notification = Notification.objects.get(alert=alert)
+        assert 'Quantidade atual: 3.00' in notification.message
+        assert notification.lot is None
+        assert notification.dedupe_key == f'{alert.pk}:-:low_stock:{TODAY.isoformat()}'
+
+        evaluate_alerts(today=TODAY + datetime.timedelta(days=1))
+        assert Notification.objects.filter(alert=alert).count() == 2
+
+    def test_inactive_alerts_are_ignored(self, alert_setup):
+        """Alertas inativos não são avaliados"""
+        make_reagent, make_alert, users = alert_setup
+        alert = make_alert(make_reagent('INATIVO', []), 'low_stock', '5.00')
+        alert.is_active = False
+        alert.save()
+
+        assert evaluate_alerts() == {'alerts': 0, 'triggered': 0, 'notifications': 0}
+        assert not Notification.objects.exists()
+
+    def test_query_count_does_not_grow_with_alerts(self, alert_setup, django_assert_num_queries):
+        """O número de consultas é fixo, independente da quantidade de alertas, lotes e usuários"""
+        make_reagent, make_alert, users = alert_setup
+        for i in range(10):
+            reagent = make_reagent(f'MUITOS-{i}', [(f'M-{i}-{n}', n + 1, '1.00') for n in range(3)])
+            make_alert(reagent, 'low_stock', '50.00')
+            make_alert(reagent, 'expiry_date', '30')
+
+        # Alerts, expiring lots, recipients and one bulk insert.
+        with django_assert_num_queries(4):
+            result = evaluate_alerts()
+
+        assert result == {'alerts': 20, 'triggered': 20, 'notifications': 80}
+        assert Notification.objects.count() == 80
+
+
+@pytest.mark.django_db
+class TestIncrementalAlerts:
+    """Testes para a reavaliação dos alertas quando o estoque muda"""
+
+    def test_withdrawal_triggers_low_stock_on_commit(self, alert_setup, django_capture_on_commit_callbacks):
+        """Uma retirada que deixa o reagente abaixo do limite notifica após o commit"""
+        make_reagent, make_alert, users = alert_setup
+        reagent = make_reagent('RETIRA', [('R-1', 100, '6.00')])
+        alert = make_alert(reagent, 'low_stock', '5.00')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            perform_withdrawal(reagent, Decimal('2.00'), users[0])
+
+        assert Notification.objects.filter(alert=alert).count() == 2
+
+    def test_only_touched_reagent_is_evaluated(self, alert_setup, django_capture_on_commit_callbacks):
+        """A mudança de um lote reavalia somente os alertas do seu reagente"""
+        make_reagent, make_alert, users = alert_setup
+        with django_capture_on_commit_callbacks(execute=True):
+            make_alert(make_reagent('MUDA', [('M-1', 100, '9.00')]), 'low_stock', '5.00')
+            make_alert(make_reagent('PARADO', [('P-1', 100, '9.00')]), 'low_stock', '5.00')
+        # Queryset updates send no signals: PARADO is now below its limit but nothing re-evaluates it.
+        ReagentStockSummary.objects.filter(reagent__sku='PARADO').update(total_quantity=Decimal('1.00'))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            lot = StockLot.objects.get(lot_number='M-1')
+            lot.current_quantity = Decimal('1.00')
+            lot.save()
+
+        assert list(Notification.objects.values_list('alert__reagent__sku', flat=True).distinct()) == ['MUDA']
+
+    def test_new_lot_inside_window_notifies(self, alert_setup, django_capture_on_commit_callbacks):
+        """Um lote cadastrado já dentro do prazo de validade do alerta notifica na hora"""
+        make_reagent, make_alert, users = alert_setup
+        reagent = make_reagent('NOVO', [])
+        make_alert(reagent, 'expiry_date', '30', recipients=users[:1])
+
+        with django_capture_on_commit_callbacks(execute=True):
+            StockLot.objects.create(
+                reagent=reagent, lot_number='N-1', location=Location.objects.get(),
+                expiry_date=TODAY + datetime.timedelta(days=10),
+                purchase_price=Decimal('1.00'), initial_quantity=Decimal('1.00'), current_quantity=Decimal('1.00')
+            )
+
+        assert 'Lote: N-1' in Notification.objects.get().message
+
+    def test_new_alert_notifies_its_recipients(self, alert_setup, django_capture_on_commit_callbacks):
+        """Um alerta novo para um reagente já abaixo do limite notifica os destinatários definidos depois de salvo"""
+        make_reagent, make_alert, users = alert_setup
+        reagent = make_reagent('JA-BAIXO', [('J-1', 100, '2.00')])
+
+        # Saved and committed on its own, as outside a request transaction.
+        with django_capture_on_commit_callbacks(execute=True):
+            alert = Alert.objects.create(
+                name='Novo', reagent=reagent, alert_type='low_stock', threshold_value=Decimal('5.00')
+            )
+        assert not Notification.objects.exists()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            alert.users_to_notify.set(users)
+
+        assert set(Notification.objects.filter(alert=alert).values_list('user', flat=True)) == {user.pk for user in users}
+
+    @override_settings(ALERT_EVALUATION_ASYNC=True)
+    def test_async_queues_one_task_per_transaction(self, alert_setup, monkeypatch, django_capture_on_commit_callbacks):
+        """Com ALERT_EVALUATION_ASYNC os reagentes alterados na transação vão juntos para a fila"""
+        make_reagent, make_alert, users = alert_setup
+        first = make_reagent('FILA-1', [('F-1', 100, '9.00')])
+        second = make_reagent('FILA-2', [('F-2', 100, '9.00')])
+        queued = []
+        monkeypatch.setattr(tasks.evaluate_reagent_alerts, 'apply_async', lambda args, **kwargs: queued.append(args[0]))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            for lot in StockLot.objects.all():
+                lot.current_quantity = Decimal('1.00')
+                lot.save()
+
+        assert queued == [sorted([first.pk, second.pk])]
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('eager_celery')
+class TestExpiryScan:
+    """Testes para a varredura periódica de validade"""
+
+    def test_scan_only_reports_windows_opened_since_last_run(self, alert_setup):
+        """Só os lotes cujo prazo de alerta começou desde a última varredura são notificados"""
+        make_reagent, make_alert, users = alert_setup
+        reagent = make_reagent('JANELA', [('J-ANTIGO', 20, '1.00'), ('J-HOJE', 30, '1.00'), ('J-FORA', 31, '1.00')])
+        make_reagent('SEM-ALERTA', [('S-1', 30, '1.00')])
+        make_alert(reagent, 'expiry_date', '30', recipients=users[:1])
+        cache.set(EXPIRY_SCAN_KEY, (TODAY - datetime.timedelta(days=1)).isoformat())
+
+        assert check_alerts() == {'shards': 1, 'reagents': 1}
+
+        assert [message.split('Lote: ')[1][:7] for message in Notification.objects.values_list('message', flat=True)] == ['J-HOJE)']
+        assert cache.get(EXPIRY_SCAN_KEY) == TODAY.isoformat()
+
+    def test_scan_runs_once_per_day(self, alert_setup, django_assert_num_queries):
+        """Varreduras repetidas no mesmo dia não consultam o banco"""
+        cache.set(EXPIRY_SCAN_KEY, TODAY.isoformat())
+
+        with django_assert_num_queries(0):
+            assert check_alerts() == {'shards': 0, 'reagents': 0}
+
+    def test_first_scan_checks_whole_window(self, alert_setup):
+        """Sem registro da última varredura todo o prazo é verificado"""
+        make_reagent, make_alert, users = alert_setup
+        make_alert(make_reagent('PRIMEIRA', [('P-1', 3, '1.00'), ('P-2', 25, '1.00')]), 'expiry_date', '30', recipients=users[:1])
+
+        check_alerts()
+
+        assert Notification.objects.count() == 2
+
+    def test_scan_ignores_low_stock(self, alert_setup):
+        """Estoque baixo não é mais verificado pela varredura periódica"""
+        make_reagent, make_alert, users = alert_setup
+        make_alert(make_reagent('IGNORA', []), 'low_stock', '5.00')
+
+        assert check_alerts() == {'shards': 0, 'reagents': 0}
+
+        assert not Notification.objects.exists()
+        assert cache.get(EXPIRY_SCAN_KEY) == TODAY.isoformat()
+
+    @override_settings(ALERT_SCAN_SHARDS=3)
+    def test_scan_is_split_into_shards(self, alert_setup, monkeypatch):
+        """Os reagentes são divididos em faixas de id avaliadas por tarefas separadas e somadas no final"""
+        make_reagent, make_alert, users = alert_setup
+        for i in range(7):
+            make_alert(make_reagent(f'FAIXA-{i}', [(f'F-{i}', 5, '1.00')]), 'expiry_date', '30', recipients=users[:1])
+        logged = []
+        monkeypatch.setattr(tasks.logger, 'info', lambda message, today, summary: logged.append(summary))
+
+        assert check_alerts() == {'shards': 3, 'reagents': 7}
+
+        assert Notification.objects.count() == 7
+        [summary] = logged
+        assert {key: summary[key] for key in ('shards', 'reagents', 'alerts', 'notifications')} == {
+            'shards': 3, 'reagents': 7, 'alerts': 7, 'notifications': 7
+        }
+
+    def test_partition_reagent_ids(self):
+        """As faixas de id são contíguas e de tamanhos próximos"""
+        assert partition_reagent_ids(list(range(1, 11)), 3) == [[1, 2, 3, 4], [5, 6, 7], [8, 9, 10]]
+        assert partition_reagent_ids([4, 9], 8) == [[4], [9]]
+        assert partition_reagent_ids([], 8) == []
+
+
+@pytest.mark.django_db
+class TestNotificationEndpoints:
+    """Testes para os endpoints de notificações do usuário"""
+
+    @pytest.fixture
+    def notified(self, alert_setup, authenticated_client):
+        make_reagent, make_alert, users = alert_setup
+        client, user = authenticated_client
+        make_alert(make_reagent('LEITURA', [('L-1', 3, '1.00'), ('L-2', 5, '1.00')]), 'expiry_date', '10', recipients=[user])
+        evaluate_alerts()
+        return client, user
+
+    def test_unread_count_is_cached(self, notified, django_assert_num_queries):
+        """A contagem de não lidas é servida do cache depois da primeira consulta"""
+        client, user = notified
+        assert client.get('/api/v1/notifications/unread-count/').json() == {'unread': 2}
+
+        with django_assert_num_queries(0):
+            assert get_unread_count(user.pk) == 2
+
+    def test_count_follows_new_and_read_notifications(self, notified, alert_setup, django_capture_on_commit_callbacks):
+        """Novas notificações e a marcação como lida atualizam a contagem"""
+        client, user = notified
+        make_reagent, make_alert, users = alert_setup
+        assert get_unread_count(user.pk) == 2
+
+        with django_capture_on_commit_callbacks(execute=True):
+            make_alert(make_reagent('OUTRA', []), 'low_stock', '5.00', recipients=[user])
+            evaluate_alerts()
+        assert client.get('/api/v1/notifications/unread-count/').json() == {'unread': 3}
+
+        first = Notification.objects.filter(user=user).order_by('id').first()
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post('/api/v1/notifications/mark-read/', {'ids': [first.pk]}, format='json')
+        assert response.json() == {'updated': 1}
+        assert client.get('/api/v1/notifications/unread-count/').json() == {'unread': 2}
+
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post('/api/v1/notifications/mark-read/', {'all': True}, format='json')
+        assert client.get('/api/v1/notifications/unread-count/').json() == {'unread': 0}
+
+    def test_list_only_own_notifications(self, notified, alert_setup):
+        """A listagem traz só as notificações do usuário, filtradas por is_read"""
+        client, user = notified
+        make_reagent, make_alert, users = alert_setup
+        make_alert(make_reagent('ALHEIA', []), 'low_stock', '5.00')
+        evaluate_alerts()
+        Notification.objects.filter(user=user, lot__lot_number='L-1').update(is_read=True)
+
+        response = client.get('/api/v1/notifications/?is_read=false')
+
+        assert [row['lot'] for row in response.json()['results']] == [StockLot.objects.get(lot_number='L-2').pk]
+        assert client.get('/api/v1/notifications/?is_read=talvez').status_code == 400
+        assert client.post('/api/v1/notifications/mark-read/', {'ids': 'todas'}, format='json').status_code == 400
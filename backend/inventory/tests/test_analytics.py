@@ -0,0 +1,142 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from freezegun import freeze_time
+
+from inventory.analytics import get_consumption_analytics, normalize_consumption_params
+from inventory.models import Category, Supplier, Location, Reagent, StockLot, StockMovement, User
+
+URL = '/api/v1/analytics/consumption/'
+
+
+@pytest.fixture
+def consumption_data(authenticated_client):
+    client, user = authenticated_client
+    other_user = User.objects.create_user(username='analista2', password='testpass')
+    supplier = Supplier.objects.create(name='Fornecedor Análise')
+    solvents = Category.objects.create(name='Solventes')
+    acids = Category.objects.create(name='Ácidos')
+    shelf = Location.objects.create(name='Prateleira')
+    fridge = Location.objects.create(name='Geladeira')
+    lots = {}
+    for name, category, location in [
+        ('Etanol', solvents, shelf), ('Acetona', solvents, fridge), ('HCl', acids, shelf)
+    ]:
+        reagent = Reagent.objects.create(
+            name=name, sku=f'{name}-AN', category=category, supplier=supplier, min_stock_level=Decimal('1.00')
+        )
+        lots[name] = StockLot.objects.create(
+            reagent=reagent, lot_number='A1', location=location, expiry_date=datetime.date(2027, 1, 1),
+            purchase_price=Decimal('2.00'), initial_quantity=Decimal('500.00'), current_quantity=Decimal('500.00')
+        )
+    for day, name, quantity, by in [
+        ('2025-01-06', 'Etanol', '10.00', user), ('2025-01-20', 'Etanol', '5.00', other_user),
+        ('2025-02-03', 'Acetona', '4.00', user), ('2025-04-01', 'HCl', '1.00', user),
+        ('2025-04-02', 'Etanol', '2.00', other_user),
+    ]:
+        with freeze_time(f'{day} 10:00:00'):
+            StockMovement.objects.create(stock_lot=lots[name], user=by, quantity=Decimal(quantity), move_type='Retirada')
+    with freeze_time('2025-01-07 10:00:00'):
+        StockMovement.objects.create(stock_lot=lots['HCl'], user=user, quantity=Decimal('50.00'), move_type='Entrada')
+    return client, user, lots
+
+
+START, END = datetime.date(2025, 1, 1), datetime.date(2025, 6, 30)
+
+
+@pytest.mark.django_db
+class TestConsumptionAnalytics:
+    """Testes para as séries de consumo por período"""
+
+    def test_month_buckets_with_top_groups(self, consumption_data):
+        """Meses com consumo, os N maiores reagentes em séries próprias e o restante em 'others'"""
+        data = get_consumption_analytics(START, END, bucket='month', group_by='reagent', top=1)
+
+        assert data['labels'] == ['2025-01', '2025-02', '2025-04']
+        assert data['total']['quantities'] == [15.0, 4.0, 3.0]
+        assert data['total']['total_value'] == 44.0
+        assert [(series['name'], series['quantities']) for series in data['series']] == [('Etanol', [15.0, 0.0, 2.0])]
+        assert data['others']['groups'] == 2
+        assert data['others']['quantities'] == [0.0, 4.0, 1.0]
+
+    def test_bucket_labels(self, consumption_data):
+        """Semanas começam na segunda-feira; trimestres são rotulados AAAA-Qn"""
+        weeks = get_consumption_analytics(START, END, bucket='week')
+        assert weeks['labels'] == ['2025-01-06', '2025-01-20', '2025-02-03', '2025-03-31']
+        assert weeks['total']['quantities'] == [10.0, 5.0, 4.0, 3.0]
+
+        quarters = get_consumption_analytics(START, END, bucket='quarter')
+        assert quarters['labels'] == ['2025-Q1', '2025-Q2']
+        assert quarters['total']['quantities'] == [19.0, 3.0]
+
+        days = get_consumption_analytics(datetime.date(2025, 4, 1), datetime.date(2025, 4, 1), bucket='day')
+        assert days['labels'] == ['2025-04-01']
+        assert days['total']['quantities'] == [1.0]
+
+    @pytest.mark.parametrize('group_by, expected', [
+        ('category', [('Solventes', 21.0), ('Ácidos', 1.0)]),
+        ('location', [('Prateleira', 18.0), ('Geladeira', 4.0)]),
+        ('user', [('testuser', 15.0), ('analista2', 7.0)]),
+    ])
+    def test_groupings(self, consumption_data, group_by, expected):
+        """Agrupamento por categoria, localização e usuário, do maior para o menor"""
+        data = get_consumption_analytics(START, END, bucket='quarter', group_by=group_by)
+        assert [(series['name'], series['total_quantity']) for series in data['series']] == expected
+        assert data['others'] is None
+
+    def test_single_grouped_query(self, consumption_data, django_assert_num_queries):
+        """As séries saem de uma única consulta agrupada"""
+        with django_assert_num_queries(1):
+            get_consumption_analytics(START, END, bucket='week', group_by='category', top=1)
+
+    @pytest.mark.parametrize('params', [
+        {'bucket': 'year'}, {'group_by': 'supplier'}, {'top': '0'}, {'top': 'x'},
+        {'start_date': '2025-02-01', 'end_date': '2025-01-01'}, {'start_date': '01/02/2025'},
+        {'start_date': '2000-01-01', 'end_date': '2025-01-01'},
+    ])
+    def test_invalid_params(self, params):
+        """Parâmetros inválidos são rejeitados"""
+        with pytest.raises(ValueError):
+            normalize_consumption_params(params)
+
+
+@pytest.mark.django_db
+class TestConsumptionAnalyticsEndpoint:
+    """Testes para o endpoint de análise de consumo"""
+
+    def test_endpoint(self, consumption_data):
+        """O endpoint devolve as séries pedidas"""
+        client, user, lots = consumption_data
+        response = client.get(URL, {
+            'start_date': '2025-01-01', 'end_date': '2025-06-30', 'bucket': 'month', 'group_by': 'user', 'top': 1,
+        })
+
+        assert response.status_code == 200
+        assert response.data['labels'] == ['2025-01', '2025-02', '2025-04']
+        assert [series['name'] for series in response.data['series']] == ['testuser']
+        assert response.data['others']['quantities'] == [5.0, 0.0, 2.0]
+
+    def test_invalid_params_return_400(self, consumption_data):
+        """Parâmetros inválidos respondem 400 com a mensagem de erro"""
+        client, user, lots = consumption_data
+        response = client.get(URL, {'bucket': 'year'})
+        assert response.status_code == 400
+        assert 'bucket' in response.data['error']
+
+    def test_cached_until_stock_changes(self, consumption_data, django_assert_num_queries,
+                                        django_capture_on_commit_callbacks):
+        """A resposta fica em cache até uma movimentação ser gravada"""
+        client, user, lots = consumption_data
+        params = {'start_date': '2025-01-01', 'end_date': '2025-06-30'}
+        client.get(URL, params)
+        with django_assert_num_queries(0):
+            cached = client.get(URL, params)
+        assert cached.data['total']['quantities'] == [15.0, 4.0, 3.0]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            with freeze_time('2025-02-10 10:00:00'):
+                StockMovement.objects.create(
+                    stock_lot=lots['HCl'], user=user, quantity=Decimal('6.00'), move_type='Retirada'
+                )
+        assert client.get(URL, params).data['total']['quantities'] == [15.0, 10.0, 3.0]
@@ -46,8 +46,8 @@ def test_list_reagents(authenticated_client):
     response = client.get('/api/v1/reagents/')
 
     assert response.status_code == 200
-    assert len(response.data) == 1
-    assert response.data[0]['sku'] == 'NAOH-001'
+    assert response.data['count'] == 1
+    assert response.data['results'][0]['sku'] == 'NAOH-001'
 
 @pytest.mark.django_db
 def test_create_stock_lot(authenticated_client):
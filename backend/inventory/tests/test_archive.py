@@ -0,0 +1,102 @@
+import pytest
+import json
+import datetime
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from inventory import archive
+from inventory.archive import archive_audit_month, iter_archived_audit_events, list_archive_files
+from inventory.models import AuditLog
+
+UTC = datetime.timezone.utc
+JANUARY = datetime.date(2025, 1, 1)
+FEBRUARY = datetime.date(2025, 2, 1)
+
+
+def at(day, hour=12, month=1):
+    return datetime.datetime(2025, month, day, hour, tzinfo=UTC)
+
+
+@pytest.fixture
+def old_events():
+    AuditLog.objects.bulk_create([
+        AuditLog(action=AuditLog.CREATE, object_type=5, object_id=1, timestamp=at(5), details={'name': 'A'}),
+        AuditLog(action=AuditLog.UPDATE, object_type=5, object_id=1, timestamp=at(20), details={'name': ['A', 'B']}),
+        AuditLog(action=AuditLog.CREATE, object_type=2, object_id=9, timestamp=at(25), details={'name': 'C'}),
+        AuditLog(action=AuditLog.DELETE, object_type=5, object_id=1, timestamp=at(3, month=2), details={'name': 'B'}),
+    ])
+
+
+@pytest.mark.django_db
+class TestAuditArchive:
+    """Testes para a exportação e a consulta do arquivo do log de auditoria"""
+
+    @pytest.mark.parametrize('archive_format', ['jsonl', 'columnar'])
+    def test_export_verify_and_delete(self, old_events, tmp_path, archive_format):
+        """Os meses anteriores ao corte são exportados, conferidos e removidos em lotes"""
+        output = StringIO()
+
+        call_command(
+            'archive_audit_log', before='2025-03', archive_dir=tmp_path, format=archive_format,
+            chunk_size=2, batch_size=1, stdout=output
+        )
+
+        assert not AuditLog.objects.exists()
+        assert '2025-01: 3 rows archived, 3 rows removed' in output.getvalue()
+        assert [month for month, path in list_archive_files(tmp_path)] == [JANUARY, FEBRUARY]
+        rows = list(iter_archived_audit_events(archive_dir=tmp_path))
+        assert [row['details']['name'] for row in rows] == ['A', ['A', 'B'], 'C', 'B']
+        assert rows[0]['timestamp'] == at(5)
+
+    def test_columnar_groups_columns(self, old_events, tmp_path):
+        """No formato colunar cada linha do arquivo é um grupo de linhas com uma lista por coluna"""
+        archive_audit_month(JANUARY, tmp_path, 'columnar', chunk_size=2)
+
+        with archive.gzip.open(tmp_path / 'auditlog-2025-01.columns.json.gz', 'rt') as archive_file:
+            groups = [json.loads(line) for line in archive_file]
+        assert [group['rows'] for group in groups] == [2, 1]
+        assert groups[0]['columns']['object_id'] == [1, 1]
+
+    def test_query_by_range_and_filters(self, old_events, tmp_path):
+        """A consulta abre só os meses do intervalo e aplica os filtros"""
+        call_command('archive_audit_log', before='2025-03', archive_dir=tmp_path, format='columnar', stdout=StringIO())
+
+        rows = iter_archived_audit_events(at(10), at(1, 0, month=2), archive_dir=tmp_path, object_type=5)
+        assert [(row['action'], row['object_id']) for row in rows] == [(AuditLog.UPDATE, 1)]
+
+    def test_interrupted_run_is_resumed_without_duplicates(self, old_events, tmp_path):
+        """Linhas já arquivadas por uma execução interrompida não são exportadas de novo"""
+        archive_audit_month(JANUARY, tmp_path)
+        AuditLog.objects.create(action=AuditLog.UPDATE, timestamp=at(28), details={'name': 'D'})
+
+        call_command('archive_audit_log', before='2025-02', archive_dir=tmp_path, stdout=StringIO())
+
+        assert [path.name for month, path in list_archive_files(tmp_path)] == [
+            'auditlog-2025-01.jsonl.gz', 'auditlog-2025-01.part2.jsonl.gz'
+        ]
+        names = [row['details']['name'] for row in iter_archived_audit_events(archive_dir=tmp_path)]
+        assert names == ['A', ['A', 'B'], 'C', 'D']
+        assert AuditLog.objects.count() == 1
+
+    def test_failed_verification_keeps_rows(self, old_events, tmp_path, monkeypatch):
+        """Se a conferência falhar nenhuma linha do mês é removida"""
+        monkeypatch.setattr(archive, 'archived_ids', lambda month, archive_dir=None: set())
+
+        with pytest.raises(CommandError, match='not in the archive'):
+            call_command('archive_audit_log', before='2025-02', archive_dir=tmp_path, stdout=StringIO())
+
+        assert AuditLog.objects.count() == 4
+
+    def test_archive_endpoint(self, authenticated_client, old_events, tmp_path):
+        """O endpoint devolve as linhas arquivadas como JSON lines, com os filtros do log"""
+        client, user = authenticated_client
+        call_command('archive_audit_log', before='2025-03', archive_dir=tmp_path, stdout=StringIO())
+
+        with override_settings(AUDIT_ARCHIVE_DIR=tmp_path):
+            response = client.get('/api/v1/audit-logs/archive/?object_type=Reagent&start_date=2025-01-10')
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        assert response['Content-Type'] == 'application/x-ndjson'
+        assert [row['action'] for row in rows] == [AuditLog.UPDATE, AuditLog.DELETE]
+        assert client.get('/api/v1/audit-logs/archive/?end_date=ontem').status_code == 400
@@ -0,0 +1,313 @@
+import pytest
+import gzip
+import json
+import logging
+import datetime
+from io import StringIO
+from django.db import connection, transaction, OperationalError
+from django.db.models import QuerySet
+from django.core.management import call_command
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from decimal import Decimal
+from inventory.models import Category, Supplier, Location, Reagent, StockLot, StockMovement, Requisition, User, AuditLog
+from inventory.partitions import add_months, ensure_audit_partitions, partition_name
+from inventory import audit, tasks
+from inventory.audit import record_audit_event, write_audit_events
+
+
+@pytest.mark.django_db
+class TestAuditPipeline:
+    """Testes para a gravação adiada dos eventos de auditoria"""
+
+    def test_events_are_written_in_one_insert_on_commit(self, django_capture_on_commit_callbacks):
+        """Os eventos de uma transação são gravados juntos, com um único INSERT, após o commit"""
+        with django_capture_on_commit_callbacks() as callbacks:
+            with transaction.atomic():
+                for i in range(5):
+                    Category.objects.create(name=f'Auditoria {i}')
+            assert not AuditLog.objects.exists()
+
+        with CaptureQueriesContext(connection) as context:
+            for callback in callbacks:
+                callback()
+
+        inserts = [q for q in context.captured_queries if q['sql'].startswith('INSERT INTO "inventory_auditlog"')]
+        assert len(inserts) == 1
+        assert AuditLog.objects.filter(action=AuditLog.CREATE).count() == 5
+
+    def test_rolled_back_events_are_discarded(self, django_capture_on_commit_callbacks):
+        """Eventos de uma transação desfeita não são gravados"""
+        with django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(RuntimeError):
+                with transaction.atomic():
+                    Category.objects.create(name='Desfeita')
+                    raise RuntimeError
+            Category.objects.create(name='Confirmada')
+
+        assert list(AuditLog.objects.values_list('details__name', flat=True)) == ['Confirmada']
+
+    def test_event_keeps_its_own_timestamp(self, django_capture_on_commit_callbacks):
+        """O horário gravado é o do evento, não o da gravação"""
+        with django_capture_on_commit_callbacks() as callbacks:
+            record_audit_event(AuditLog.STOCK_WITHDRAWAL, {'x': 1})
+        recorded = connection.audit_batch.items[0].timestamp
+
+        for callback in callbacks:
+            callback()
+
+        assert AuditLog.objects.get(action=AuditLog.STOCK_WITHDRAWAL).timestamp == recorded
+
+    @override_settings(AUDIT_LOG_ASYNC=True)
+    def test_async_hands_events_to_celery(self, monkeypatch, django_capture_on_commit_callbacks):
+        """Com AUDIT_LOG_ASYNC os eventos vão para a fila e o worker os grava"""
+        queued = []
+        monkeypatch.setattr(tasks.write_audit_log_events, 'apply_async', lambda args, **kwargs: queued.append(args[0]))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Category.objects.create(name='Assíncrona')
+
+        assert not AuditLog.objects.exists()
+        assert [event['action'] for event in queued[0]] == [AuditLog.CREATE]
+
+        tasks.write_audit_log_events(queued[0])
+        assert AuditLog.objects.get().details['name'] == 'Assíncrona'
+
+    @override_settings(AUDIT_LOG_ASYNC=True)
+    def test_async_falls_back_to_inline_write(self, monkeypatch, django_capture_on_commit_callbacks):
+        """Sem broker os eventos são gravados diretamente"""
+        def broker_down(*args, **kwargs):
+            raise ConnectionError("broker down")
+        monkeypatch.setattr(tasks.write_audit_log_events, 'apply_async', broker_down)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Category.objects.create(name='Sem broker')
+
+        assert AuditLog.objects.filter(action=AuditLog.CREATE).count() == 1
+
+    def test_locked_insert_is_retried(self, monkeypatch):
+        """Uma tabela travada por outra escrita é tentada de novo em vez de perder os eventos"""
+        monkeypatch.setattr(audit, 'AUDIT_WRITE_BACKOFF', 0)
+        bulk_create = QuerySet.bulk_create
+        attempts = []
+
+        def locked_twice(self, *args, **kwargs):
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError('database table is locked')
+            return bulk_create(self, *args, **kwargs)
+        monkeypatch.setattr(QuerySet, 'bulk_create', locked_twice)
+
+        write_audit_events([AuditLog(action=AuditLog.STOCK_WITHDRAWAL, details={'x': 1})])
+
+        assert len(attempts) == 3
+        assert AuditLog.objects.filter(action=AuditLog.STOCK_WITHDRAWAL).count() == 1
+
+    def test_lasting_lock_hands_events_to_celery(self, monkeypatch):
+        """Se a tabela continuar travada os eventos vão para o worker, que tenta de novo"""
+        monkeypatch.setattr(audit, 'AUDIT_WRITE_BACKOFF', 0)
+        queued = []
+        monkeypatch.setattr(tasks.write_audit_log_events, 'apply_async', lambda args, **kwargs: queued.append(args[0]))
+
+        def always_locked(*args, **kwargs):
+            raise OperationalError('database table is locked')
+        monkeypatch.setattr(QuerySet, 'bulk_create', always_locked)
+        write_audit_events([AuditLog(action=AuditLog.STOCK_WITHDRAWAL, details={'x': 1})])
+
+        assert [event['action'] for event in queued[0]] == [AuditLog.STOCK_WITHDRAWAL]
+
+    def test_failed_insert_logs_the_events(self, monkeypatch, caplog):
+        """Se a gravação falhar os eventos completos vão para o log de erros"""
+        def insert_fails(*args, **kwargs):
+            raise RuntimeError("disk full")
+        monkeypatch.setattr(QuerySet, 'bulk_create', insert_fails)
+
+        # The 'inventory' logger does not propagate to the root handler caplog uses.
+        monkeypatch.setattr(logging.getLogger('inventory'), 'handlers', [caplog.handler])
+        write_audit_events([AuditLog(action=AuditLog.DELETE, details={'lost_event': 42})])
+
+        assert '"lost_event": 42' in caplog.text
+
+
+@pytest.mark.django_db
+class TestFieldTracking:
+    """Testes para o registro apenas dos campos alterados"""
+
+    @pytest.fixture
+    def pending_requisition(self):
+        category = Category.objects.create(name='Rastreamento')
+        supplier = Supplier.objects.create(name='Fornecedor Rastreamento')
+        reagent = Reagent.objects.create(
+            name='Tolueno', sku='TOL-TRACK', category=category, supplier=supplier, min_stock_level=Decimal('1.00')
+        )
+        requester = User.objects.create_user(username='rastreado', password='testpass')
+        return Requisition.objects.create(requester=requester, reagent=reagent, quantity=Decimal('2.00'))
+
+    def test_update_stores_only_changed_fields(self, django_capture_on_commit_callbacks):
+        """A atualização grava somente os campos alterados, com valor antigo e novo"""
+        category = Category.objects.create(name='Antiga', description='Mantida')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            category = Category.objects.get(pk=category.pk)
+            category.name = 'Nova'
+            category.save()
+
+        assert AuditLog.objects.get(action=AuditLog.UPDATE).details == {'name': ['Antiga', 'Nova']}
+
+    def test_noop_save_is_not_logged(self, django_capture_on_commit_callbacks):
+        """Salvar sem alterações não gera registro de auditoria"""
+        category = Category.objects.create(name='Inalterada')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            category.save()
+
+        assert not AuditLog.objects.filter(action=AuditLog.UPDATE).exists()
+
+    def test_password_is_never_logged(self, django_capture_on_commit_callbacks):
+        """O hash da senha não entra no registro de auditoria"""
+        with django_capture_on_commit_callbacks(execute=True):
+            user = User.objects.create_user(username='sigiloso', password='testpass')
+            user.set_password('outra')
+            user.save()
+
+        assert 'password' not in AuditLog.objects.get(action=AuditLog.CREATE).details
+        assert not AuditLog.objects.filter(action=AuditLog.UPDATE).exists()
+
+    def test_status_change_needs_no_extra_queries(
+        self, pending_requisition, django_assert_num_queries, django_capture_on_commit_callbacks
+    ):
+        """A mudança de status é auditada sem reler a requisição nem carregar relacionamentos"""
+        requisition = Requisition.objects.get(pk=pending_requisition.pk)
+        requisition.status = 'Rejeitada'
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            with django_assert_num_queries(1):  # Only the UPDATE.
+                requisition.save()
+        for callback in callbacks:
+            callback()
+
+        audit = AuditLog.objects.get(action=AuditLog.STATUS_CHANGE)
+        assert audit.details == {'status': ['Pendente', 'Rejeitada']}
+        assert (audit.object_type, audit.object_id) == (AuditLog.object_type_for(Requisition), requisition.pk)
+
+    def test_snapshot_resets_after_save(self, pending_requisition, django_capture_on_commit_callbacks):
+        """Cada save compara com o estado salvo anterior, não com o carregado originalmente"""
+        with django_capture_on_commit_callbacks(execute=True):
+            pending_requisition.status = 'Aprovada'
+            pending_requisition.save()
+            pending_requisition.quantity = Decimal('3.00')
+            pending_requisition.save()
+
+        assert list(AuditLog.objects.filter(action__in=[AuditLog.UPDATE, AuditLog.STATUS_CHANGE]).order_by('id').values_list(
+            'action', 'details'
+        )) == [
+            (AuditLog.STATUS_CHANGE, {'status': ['Pendente', 'Aprovada']}),
+            (AuditLog.UPDATE, {'quantity': ['2.00', '3.00']}),
+        ]
+
+def audit_row(timestamp, **fields):
+    fields.setdefault('action', AuditLog.UPDATE)
+    return AuditLog(timestamp=timestamp, details=fields.pop('details', {'x': 1}), **fields)
+
+
+@pytest.mark.django_db
+class TestCompactAuditLog:
+    """Testes para o formato compacto, os filtros e o arquivamento do log de auditoria"""
+
+    def test_stock_movement_is_logged_once(self, django_capture_on_commit_callbacks):
+        """Criar uma movimentação gera um único registro, com o tipo e o id em colunas"""
+        user = User.objects.create_user(username='movimentador', password='testpass')
+        category = Category.objects.create(name='Movimentação')
+        supplier = Supplier.objects.create(name='Fornecedor Movimentação')
+        location = Location.objects.create(name='Prateleira')
+        reagent = Reagent.objects.create(
+            name='Etanol', sku='ETOH-AUD', category=category, supplier=supplier, min_stock_level=Decimal('1.00')
+        )
+        lot = StockLot.objects.create(
+            reagent=reagent, lot_number='AUD-1', location=location, expiry_date=datetime.date(2030, 1, 1),
+            purchase_price=Decimal('1.00'), initial_quantity=Decimal('5.00'), current_quantity=Decimal('5.00')
+        )
+
+        with django_capture_on_commit_callbacks(execute=True):
+            movement = StockMovement.objects.create(
+                stock_lot=lot, user=user, move_type='Entrada', quantity=Decimal('1.00')
+            )
+
+        audit = AuditLog.objects.get(object_type=AuditLog.object_type_for(StockMovement))
+        assert (audit.action, audit.object_id) == (AuditLog.CREATE, movement.pk)
+        assert audit.details['stock_lot_id'] == lot.pk
+        assert 'id' not in audit.details
+
+    def test_list_filters(self, authenticated_client):
+        """A listagem filtra por tipo, ação, objeto e intervalo de datas"""
+        client, user = authenticated_client
+        AuditLog.objects.bulk_create([
+            audit_row(datetime.datetime(2025, 3, 10, tzinfo=datetime.timezone.utc),
+                      action=AuditLog.CREATE, object_type=AuditLog.object_type_for(Category), object_id=7),
+            audit_row(datetime.datetime(2025, 3, 11, tzinfo=datetime.timezone.utc),
+                      object_type=AuditLog.object_type_for(Category), object_id=7),
+            audit_row(datetime.datetime(2025, 4, 1, tzinfo=datetime.timezone.utc),
+                      object_type=AuditLog.object_type_for(Reagent), object_id=7),
+        ])
+
+        def ids(query):
+            response = client.get(f'/api/v1/audit-logs/?{query}')
+            assert response.status_code == 200
+            return [(row['action_name'], row['object_type_name']) for row in response.data['results']]
+
+        assert ids('object_type=category&object_id=7') == [('UPDATE', 'Category'), ('CREATE', 'Category')]
+        assert ids('action=CREATE') == [('CREATE', 'Category')]
+        assert ids('object_type=5') == [('UPDATE', 'Reagent')]
+        assert ids('start_date=2025-03-11&end_date=2025-03-31') == [('UPDATE', 'Category')]
+        assert client.get('/api/v1/audit-logs/?object_type=Planet').status_code == 400
+        assert client.get('/api/v1/audit-logs/?object_id=abc').status_code == 400
+        assert client.get('/api/v1/audit-logs/?start_date=10/03/2025').status_code == 400
+
+    def test_archive_moves_expired_months_to_files(self, tmp_path):
+        """Os meses além da retenção vão para arquivos .jsonl.gz e saem da tabela"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        current_month = now.date().replace(day=1)
+        old_month = add_months(current_month, -3)
+        old = datetime.datetime.combine(old_month, datetime.time(12), tzinfo=datetime.timezone.utc)
+        AuditLog.objects.bulk_create([
+            audit_row(old, details={'n': 1}),
+            audit_row(old + datetime.timedelta(days=1), details={'n': 2}),
+            audit_row(now, details={'n': 3}),
+        ])
+
+        call_command('archive_audit_log', retention_months=1, archive_dir=tmp_path, stdout=StringIO())
+
+        with gzip.open(tmp_path / f'auditlog-{old_month:%Y-%m}.jsonl.gz', 'rt') as archive:
+            rows = [json.loads(line) for line in archive]
+        assert [row['details'] for row in rows] == [{'n': 1}, {'n': 2}]
+        assert rows[0]['action'] == AuditLog.UPDATE
+        assert list(AuditLog.objects.values_list('details', flat=True)) == [{'n': 3}]
+        assert sorted(path.name for path in tmp_path.iterdir()) == [f'auditlog-{old_month:%Y-%m}.jsonl.gz']
+
+    def test_archive_dry_run_keeps_rows(self, tmp_path):
+        """Com --dry-run nada é gravado nem removido"""
+        old = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=400)
+        AuditLog.objects.bulk_create([audit_row(old)])
+        output = StringIO()
+
+        call_command('archive_audit_log', retention_months=1, archive_dir=tmp_path, dry_run=True, stdout=output)
+
+        assert 'would be archived' in output.getvalue()
+        assert AuditLog.objects.count() == 1
+        assert not list(tmp_path.iterdir())
+
+    def test_partition_helpers(self):
+        """Nomes de partição por mês e no-op fora do PostgreSQL"""
+        assert add_months(datetime.date(2025, 11, 1), 3) == datetime.date(2026, 2, 1)
+        assert add_months(datetime.date(2025, 1, 1), -1) == datetime.date(2024, 12, 1)
+        assert partition_name(datetime.date(2025, 2, 1)) == 'inventory_auditlog_p2025_02'
+        if connection.vendor != 'postgresql':
+            assert ensure_audit_partitions() == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_event_outside_transaction_is_written_immediately():
+    """Fora de uma transação o evento é gravado na hora"""
+    record_audit_event(AuditLog.STOCK_WITHDRAWAL, {'ok': True})
+
+    assert AuditLog.objects.filter(action=AuditLog.STOCK_WITHDRAWAL).exists()
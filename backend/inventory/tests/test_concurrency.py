@@ -0,0 +1,230 @@
+import pytest
+import threading
+from decimal import Decimal
+from django.db import connection, transaction, OperationalError
+from django.db.models import Sum
+from inventory.models import Category, Supplier, Location, Reagent, StockLot, StockMovement, Requisition, User, AuditLog, DailyMovementRollup
+from inventory import audit, services
+from inventory.serializers import StockMovementSerializer
+from inventory.services import perform_withdrawal, approve_requisition, retry_on_conflict
+import datetime
+
+THREADS = 8
+WITHDRAWALS_PER_THREAD = 5
+
+
+@pytest.fixture(autouse=True)
+def patient_retries(monkeypatch):
+    # The in-memory test database uses SQLite's shared cache, whose table locks
+    # fail immediately instead of waiting on the busy timeout; give the retry
+    # loop enough room to ride that out.
+    monkeypatch.setattr(services, 'WITHDRAWAL_RETRY_ATTEMPTS', 200)
+    monkeypatch.setattr(services, 'WITHDRAWAL_RETRY_BACKOFF', 0.005)
+    # The audit insert runs after commit and retries the same locks on its own.
+    monkeypatch.setattr(audit, 'AUDIT_WRITE_ATTEMPTS', 200)
+    monkeypatch.setattr(audit, 'AUDIT_WRITE_BACKOFF', 0.005)
+
+
+@pytest.fixture
+def contended_stock():
+    category = Category.objects.create(name='Concorrência')
+    supplier = Supplier.objects.create(name='Fornecedor Concorrência')
+    location = Location.objects.create(name='Armário Concorrência')
+    reagent = Reagent.objects.create(
+        name='Etanol Absoluto',
+        sku='ETOH-CONC-001',
+        category=category,
+        supplier=supplier,
+        min_stock_level=Decimal('1.00')
+    )
+    for i, days in enumerate([10, 20, 30]):
+        StockLot.objects.create(
+            reagent=reagent,
+            lot_number=f'CONC-{i}',
+            location=location,
+            expiry_date=datetime.date.today() + datetime.timedelta(days=days),
+            purchase_price=Decimal('1.00'),
+            initial_quantity=Decimal('10.00'),
+            current_quantity=Decimal('10.00')
+        )
+    user = User.objects.create_user(username='concorrente', password='testpass')
+    return reagent, user
+
+
+def run_in_threads(target, count):
+    barrier = threading.Barrier(count)
+    results = []
+    lock = threading.Lock()
+
+    def worker(index):
+        barrier.wait()
+        try:
+            outcome = target(index)
+        except Exception as e:  # collected and asserted by the test
+            outcome = e
+        finally:
+            connection.close()
+        with lock:
+            results.append(outcome)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentWithdrawals:
+    """Testes de estresse para retiradas FEFO concorrentes"""
+
+    def test_parallel_withdrawals_never_oversubscribe(self, contended_stock):
+        """Retiradas em paralelo nunca deixam estoque negativo nem perdem atualizações"""
+        reagent, user = contended_stock
+
+        def withdraw(index):
+            succeeded = 0
+            for _ in range(WITHDRAWALS_PER_THREAD):
+                try:
+                    perform_withdrawal(reagent, Decimal('1.50'), user)
+                    succeeded += 1
+                except ValueError:
+                    pass  # Out of stock
+            return succeeded
+
+        results = run_in_threads(withdraw, THREADS)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        assert not errors, errors
+        successes = sum(results)
+        # 30.00 in stock, 40 requests of 1.50: exactly 20 fit.
+        assert successes == 20
+
+        lots = StockLot.objects.filter(reagent=reagent)
+        assert all(lot.current_quantity >= 0 for lot in lots)
+        remaining = sum(lot.current_quantity for lot in lots)
+        withdrawn = sum(m.quantity for m in StockMovement.objects.filter(stock_lot__reagent=reagent))
+        assert remaining == Decimal('0.00')
+        assert withdrawn == Decimal('30.00')
+        assert reagent.stock_summary.total_quantity == remaining
+        # Every committed withdrawal kept its audit row.
+        assert AuditLog.objects.filter(action=AuditLog.STOCK_WITHDRAWAL, object_id=reagent.pk).count() == successes
+
+    def test_parallel_writes_to_different_lots_keep_the_summary_exact(self, contended_stock):
+        """Entradas simultâneas em lotes diferentes do mesmo reagente somam todas no resumo"""
+        reagent, user = contended_stock
+        lot_ids = list(StockLot.objects.filter(reagent=reagent).values_list('pk', flat=True))
+
+        @retry_on_conflict
+        def receive(lot_id):
+            serializer = StockMovementSerializer(data={
+                'stock_lot': lot_id, 'user': user.pk, 'quantity': '2.00', 'move_type': 'Entrada',
+            })
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+        def write(index):
+            for _ in range(WITHDRAWALS_PER_THREAD):
+                receive(lot_ids[index % len(lot_ids)])
+
+        results = run_in_threads(write, THREADS)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        assert not errors, errors
+        reagent.stock_summary.refresh_from_db()
+        assert reagent.stock_summary.total_quantity == Decimal('30.00') + THREADS * WITHDRAWALS_PER_THREAD * Decimal('2.00')
+        assert reagent.stock_summary.total_quantity == sum(lot.current_quantity for lot in StockLot.objects.filter(reagent=reagent))
+
+    def test_rollup_rebuild_during_writes_keeps_the_totals(self, contended_stock):
+        """Reconstruir os totais diários enquanto entradas são gravadas não perde nem duplica movimentações"""
+        reagent, user = contended_stock
+        lot_ids = list(StockLot.objects.filter(reagent=reagent).values_list('pk', flat=True))
+        rebuild = retry_on_conflict(DailyMovementRollup.rebuild)
+
+        @retry_on_conflict
+        def receive(lot_id):
+            StockMovement.objects.create(
+                stock_lot_id=lot_id, user=user, quantity=Decimal('1.00'), move_type='Entrada'
+            )
+
+        def work(index):
+            for _ in range(WITHDRAWALS_PER_THREAD):
+                if index == 0:
+                    rebuild()
+                else:
+                    receive(lot_ids[index % len(lot_ids)])
+
+        results = run_in_threads(work, THREADS)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        assert not errors, errors
+        rolled_up = DailyMovementRollup.objects.filter(move_type='Entrada').aggregate(
+            quantity=Sum('quantity'), count=Sum('movement_count')
+        )
+        assert rolled_up == {
+            'quantity': (THREADS - 1) * WITHDRAWALS_PER_THREAD * Decimal('1.00'),
+            'count': (THREADS - 1) * WITHDRAWALS_PER_THREAD,
+        }
+
+    def test_requisition_is_approved_once(self, contended_stock):
+        """Duas aprovações simultâneas da mesma requisição retiram o estoque uma única vez"""
+        reagent, user = contended_stock
+        requisition = Requisition.objects.create(requester=user, reagent=reagent, quantity=Decimal('4.00'))
+
+        def approve(index):
+            return approve_requisition(Requisition.objects.get(pk=requisition.pk), user)
+
+        results = run_in_threads(approve, 4)
+
+        assert results.count(True) == 1
+        assert all(isinstance(result, ValueError) for result in results if result is not True)
+        assert StockMovement.objects.filter(stock_lot__reagent=reagent).count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+class TestRetryOnConflict:
+    """Testes para a repetição de transações em conflito"""
+
+    def test_retries_until_success(self, monkeypatch):
+        """Conflitos transitórios são repetidos em uma nova transação"""
+        monkeypatch.setattr(services, 'WITHDRAWAL_RETRY_BACKOFF', 0)
+        attempts = []
+
+        @retry_on_conflict
+        def flaky():
+            attempts.append(connection.in_atomic_block)
+            if len(attempts) < 3:
+                raise OperationalError('database is locked')
+            return 'ok'
+
+        assert flaky() == 'ok'
+        assert attempts == [True, True, True]
+
+    def test_gives_up_after_max_attempts(self, monkeypatch):
+        """Após o limite de tentativas o erro é propagado"""
+        monkeypatch.setattr(services, 'WITHDRAWAL_RETRY_BACKOFF', 0)
+        calls = []
+
+        @retry_on_conflict
+        def always_locked():
+            calls.append(1)
+            raise OperationalError('database is locked')
+
+        with pytest.raises(OperationalError):
+            always_locked()
+        assert len(calls) == services.WITHDRAWAL_RETRY_ATTEMPTS
+
+    def test_nested_call_runs_once(self):
+        """Dentro de uma transação externa a função não é repetida"""
+        calls = []
+
+        @retry_on_conflict
+        def locked():
+            calls.append(1)
+            raise OperationalError('database is locked')
+
+        with pytest.raises(OperationalError):
+            with transaction.atomic():
+                locked()
+        assert len(calls) == 1
@@ -0,0 +1,165 @@
+import pytest
+from decimal import Decimal
+from django.test import override_settings
+from freezegun import freeze_time
+from inventory.models import Category, Supplier, Location, Reagent, StockLot, StockMovement
+from inventory import tasks
+from inventory.services import get_dashboard_summary, get_cached_dashboard_summary
+import datetime
+
+
+@pytest.fixture
+def dashboard_data(authenticated_client):
+    client, user = authenticated_client
+    category = Category.objects.create(name='Dashboard')
+    supplier = Supplier.objects.create(name='Fornecedor Dashboard')
+    location = Location.objects.create(name='Armário Dashboard')
+    reagent = Reagent.objects.create(
+        name='Ácido Sulfúrico',
+        sku='H2SO4-DASH',
+        category=category,
+        supplier=supplier,
+        min_stock_level=Decimal('1000.00')
+    )
+    today = datetime.date.today()
+    lots = {}
+    for lot_number, days, quantity in [
+        ('EXPIRED', -5, '10.00'), ('SOON', 30, '20.00'), ('VALID', 200, '30.00'), ('EMPTY', 30, '0.00')
+    ]:
+        lots[lot_number] = StockLot.objects.create(
+            reagent=reagent,
+            lot_number=lot_number,
+            location=location,
+            expiry_date=today + datetime.timedelta(days=days),
+            purchase_price=Decimal('2.00'),
+            initial_quantity=Decimal('30.00'),
+            current_quantity=Decimal(quantity)
+        )
+    StockMovement.objects.create(stock_lot=lots['VALID'], user=user, quantity=Decimal('5.00'), move_type='Retirada')
+    return client, lots
+
+
+@pytest.mark.django_db
+class TestDashboardSummary:
+    """Testes para o serviço de resumo do dashboard"""
+
+    def test_summary_values(self, dashboard_data):
+        """Contagens de validade, valor total e listas são calculados corretamente"""
+        data, timings = get_dashboard_summary()
+
+        assert data['total_stock_value'] == Decimal('120.00')
+        assert data['expiry_data']['values'] == [1, 1, 1]
+        assert [item['lot_number'] for item in data['expiring_soon_items']] == ['SOON']
+        assert [item['sku'] for item in data['low_stock_items']] == ['H2SO4-DASH']
+        assert data['consumption_data']['values'] == [5.0]
+        assert set(timings) == {'stock', 'low_stock', 'expiring_soon', 'consumption'}
+
+    @override_settings(TIME_ZONE='America/Sao_Paulo')
+    def test_today_follows_the_django_time_zone(self):
+        """O dia de hoje é o do fuso do Django, como nos alertas, e não o dia em UTC"""
+        category = Category.objects.create(name='Fuso')
+        supplier = Supplier.objects.create(name='Fornecedor Fuso')
+        location = Location.objects.create(name='Armário Fuso')
+        reagent = Reagent.objects.create(
+            name='Metanol', sku='MEOH-FUSO', category=category, supplier=supplier, min_stock_level=Decimal('1.00')
+        )
+        StockLot.objects.create(
+            reagent=reagent, lot_number='HOJE', location=location, expiry_date=datetime.date(2025, 2, 28),
+            purchase_price=Decimal('2.00'), initial_quantity=Decimal('10.00'), current_quantity=Decimal('10.00')
+        )
+
+        with freeze_time('2025-03-01 01:00:00'):  # 28/02, 22h em São Paulo
+            data, timings = get_dashboard_summary()
+
+        assert data['expiry_data']['values'] == [0, 1, 0]
+        assert [item['lot_number'] for item in data['expiring_soon_items']] == ['HOJE']
+
+    def test_summary_query_count(self, dashboard_data, django_assert_num_queries):
+        """O resumo usa um número constante de consultas"""
+        with django_assert_num_queries(4):
+            get_dashboard_summary()
+
+    def test_endpoint_exposes_section_timings(self, dashboard_data):
+        """O endpoint informa o tempo de cada seção no cabeçalho Server-Timing"""
+        client, lots = dashboard_data
+
+        response = client.get('/api/v1/dashboard/summary/')
+
+        assert response.status_code == 200
+        sections = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        assert sections == ['stock', 'low_stock', 'expiring_soon', 'consumption', 'cache']
+        assert response['Server-Timing'].endswith('cache;desc=miss')
+
+
+@pytest.fixture
+def queued_refreshes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(tasks.refresh_dashboard_summary, 'apply_async', lambda *args, **kwargs: calls.append(kwargs))
+    return calls
+
+
+@pytest.mark.django_db
+class TestCachedDashboardSummary:
+    """Testes para o cache do dashboard com invalidação por eventos"""
+
+    def test_second_read_is_a_hit(self, dashboard_data, django_assert_num_queries):
+        """Após o primeiro cálculo o resumo é servido do cache sem consultas"""
+        assert get_cached_dashboard_summary()[2] == 'miss'
+
+        with django_assert_num_queries(0):
+            data, timings, cache_state = get_cached_dashboard_summary()
+
+        assert cache_state == 'hit'
+        assert data['total_stock_value'] == Decimal('120.00')
+
+    def test_write_serves_stale_and_queues_refresh(
+        self, dashboard_data, queued_refreshes, django_capture_on_commit_callbacks
+    ):
+        """Uma escrita confirmada marca o cache como obsoleto e agenda um único recálculo"""
+        client, lots = dashboard_data
+        get_cached_dashboard_summary()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            lots['VALID'].current_quantity = Decimal('0.00')
+            lots['VALID'].save()
+
+        data, timings, cache_state = get_cached_dashboard_summary()
+        assert cache_state == 'stale'
+        assert data['total_stock_value'] == Decimal('120.00')
+        assert get_cached_dashboard_summary()[2] == 'stale'
+        assert len(queued_refreshes) == 1
+
+        tasks.refresh_dashboard_summary()
+
+        data, timings, cache_state = get_cached_dashboard_summary()
+        assert cache_state == 'hit'
+        assert data['total_stock_value'] == Decimal('60.00')
+
+    def test_uncommitted_write_keeps_cache_fresh(self, dashboard_data, django_capture_on_commit_callbacks):
+        """A invalidação só acontece quando a transação é confirmada"""
+        client, lots = dashboard_data
+        get_cached_dashboard_summary()
+
+        with django_capture_on_commit_callbacks(execute=False) as callbacks:
+            lots['SOON'].save()
+
+        assert callbacks
+        assert get_cached_dashboard_summary()[2] == 'hit'
+
+    def test_unreachable_broker_refreshes_inline(
+        self, dashboard_data, monkeypatch, django_capture_on_commit_callbacks
+    ):
+        """Sem broker disponível o resumo obsoleto é recalculado na própria requisição"""
+        client, lots = dashboard_data
+        get_cached_dashboard_summary()
+
+        def broker_down(*args, **kwargs):
+            raise ConnectionError("broker down")
+        monkeypatch.setattr(tasks.refresh_dashboard_summary, 'apply_async', broker_down)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            lots['EXPIRED'].delete()
+
+        data, timings, cache_state = get_cached_dashboard_summary()
+        assert cache_state == 'miss'
+        assert data['expiry_data']['values'] == [0, 1, 1]
@@ -0,0 +1,102 @@
+import pytest
+import datetime
+from django.db import connection
+from django.db.models import Sum
+from inventory.models import StockLot, StockMovement, Requisition, Notification, AuditLog
+
+# The plans below document which index serves each hot query. They are checked
+# with SQLite's EXPLAIN QUERY PLAN; PostgreSQL may legitimately prefer a
+# sequential scan on the tiny tables of a test database.
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(connection.vendor != 'sqlite', reason="Plans are asserted against SQLite"),
+]
+
+TODAY = datetime.date(2025, 1, 1)
+NOW = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+HOT_QUERIES = [
+    (
+        'stocklot_fefo_idx',
+        # services.get_lots_for_withdrawal
+        lambda: StockLot.objects.filter(reagent_id=1, current_quantity__gt=0).order_by('expiry_date'),
+    ),
+    (
+        'stocklot_in_stock_expiry_idx',
+        # services.get_expiry_report, DashboardSummaryView expiring soon
+        lambda: StockLot.objects.filter(
+            current_quantity__gt=0, expiry_date__gte=TODAY, expiry_date__lte=TODAY + datetime.timedelta(days=90)
+        ),
+    ),
+    (
+        'stocklot_in_stock_expiry_idx',
+        # services.get_expiry_report(expired=True)
+        lambda: StockLot.objects.filter(current_quantity__gt=0, expiry_date__lt=TODAY),
+    ),
+    (
+        'movement_type_timestamp_idx',
+        # services.get_consumption_by_user_report
+        lambda: StockMovement.objects.filter(
+            move_type='Retirada', timestamp__range=(NOW, NOW + datetime.timedelta(days=30))
+        ).values('user__username', 'stock_lot__reagent__name').annotate(total_quantity=Sum('quantity')),
+    ),
+    (
+        'movement_type_timestamp_idx',
+        # DashboardSummaryView consumption series
+        lambda: StockMovement.objects.filter(move_type='Retirada', timestamp__gte=NOW),
+    ),
+    (
+        'movement_timestamp_idx',
+        # Cursor pagination of /stock-movements/
+        lambda: StockMovement.objects.order_by('-timestamp', '-id')[:50],
+    ),
+    (
+        'auditlog_timestamp_idx',
+        # Cursor pagination of /audit-logs/
+        lambda: AuditLog.objects.order_by('-timestamp', '-id')[:50],
+    ),
+    (
+        'auditlog_object_idx',
+        # /audit-logs/?object_type=&object_id=
+        lambda: AuditLog.objects.filter(object_type=2, object_id=1).order_by('-timestamp', '-id')[:50],
+    ),
+    (
+        'auditlog_action_idx',
+        # /audit-logs/?action=
+        lambda: AuditLog.objects.filter(action=1).order_by('-timestamp', '-id')[:50],
+    ),
+    (
+        'auditlog_user_idx',
+        # /audit-logs/?user=
+        lambda: AuditLog.objects.filter(user_id=1).order_by('-timestamp', '-id')[:50],
+    ),
+    (
+        'requisition_status_idx',
+        lambda: Requisition.objects.filter(status='Pendente').order_by('request_date'),
+    ),
+    (
+        'requisition_request_date_idx',
+        # Cursor pagination of /requisitions/
+        lambda: Requisition.objects.order_by('-request_date', '-id')[:50],
+    ),
+    (
+        'notification_user_unread_idx',
+        lambda: Notification.objects.filter(user_id=1, is_read=False),
+    ),
+]
+
+
+@pytest.mark.parametrize('index_name, queryset', HOT_QUERIES)
+def test_hot_query_uses_index(index_name, queryset):
+    """Each hot filter/sort query is planned as an index search or ordered index scan"""
+    plan = queryset().explain()
+
+    assert f'USING INDEX {index_name}' in plan, plan
+    assert 'USE TEMP B-TREE FOR ORDER BY' not in plan, plan
+
+
+def test_partial_indexes_skip_depleted_lots():
+    """Queries that do not restrict to in-stock lots cannot use the partial indexes"""
+    plan = StockLot.objects.filter(expiry_date__lt=TODAY).explain()
+
+    assert 'stocklot_in_stock_expiry_idx' not in plan
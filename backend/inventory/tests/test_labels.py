@@ -0,0 +1,209 @@
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+from io import BytesIO, StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from PIL import Image
+from inventory.models import Category, Supplier, Location, Reagent, StockLot
+from inventory import labels
+from inventory.utils import render_qr_code_png
+import datetime
+
+
+@pytest.fixture
+def label_lots():
+    category = Category.objects.create(name='Etiquetas')
+    supplier = Supplier.objects.create(name='Fornecedor Etiquetas')
+    location = Location.objects.create(name='Câmara Fria')
+    other_location = Location.objects.create(name='Prateleira E-1')
+    reagent = Reagent.objects.create(
+        name='Tampão Fosfato',
+        sku='PBS-LBL-001',
+        category=category,
+        supplier=supplier,
+        min_stock_level=Decimal('10.00')
+    )
+    lots = []
+    for i in range(30):
+        lots.append(StockLot.objects.create(
+            reagent=reagent,
+            lot_number=f'PBS-{i:03d}',
+            location=location if i < 25 else other_location,
+            expiry_date=datetime.date.today() + datetime.timedelta(days=180),
+            purchase_price=Decimal('5.00'),
+            initial_quantity=Decimal('10.00'),
+            current_quantity=Decimal('10.00')
+        ))
+    return lots
+
+
+class TestRenderQrCodes:
+    """Testes para a renderização em lote dos QR codes"""
+
+    def test_process_pool_matches_serial_rendering(self):
+        """O pool de processos produz as mesmas imagens que o caminho serial"""
+        cache.clear()
+        payloads = [f'pool-{i}' for i in range(8)]
+
+        rendered = list(labels.render_qr_codes(payloads, workers=2, min_parallel=1))
+
+        assert rendered == [render_qr_code_png(payload) for payload in payloads]
+
+    def test_pool_is_shared_between_sheets(self):
+        """Folhas seguidas reutilizam o mesmo pool em vez de iniciar processos a cada pedido"""
+        cache.clear()
+        list(labels.render_qr_codes(['shared-1', 'shared-2'], workers=2, min_parallel=1))
+        with labels.label_sheet_pool(2) as pool:
+            pass
+
+        cache.clear()
+        rendered = list(labels.render_qr_codes(['shared-1', 'shared-2'], workers=2, min_parallel=1))
+
+        with labels.label_sheet_pool(2) as again:
+            assert again is pool
+        assert rendered == [render_qr_code_png('shared-1'), render_qr_code_png('shared-2')]
+
+    def test_replaced_pool_serves_its_users_until_released(self):
+        """Trocar o número de processos não derruba o pool de quem ainda o está usando"""
+        with labels.label_sheet_pool(2) as old:
+            with labels.label_sheet_pool(3) as new:
+                assert new is not old
+            assert list(old.map(render_qr_code_png, ['in-use-1'])) == [render_qr_code_png('in-use-1')]
+
+        with pytest.raises(RuntimeError):
+            old.submit(render_qr_code_png, 'released')
+        with labels.label_sheet_pool(3) as current:
+            assert current is new
+
+    @pytest.mark.parametrize('breaks_after', [0, 1])
+    def test_broken_pool_falls_back_to_serial(self, monkeypatch, breaks_after):
+        """Se o pool quebra ao enviar ou no meio da folha, o restante é renderizado no próprio processo"""
+        cache.clear()
+        payloads = ['broken-1', 'broken-2', 'broken-3']
+        with labels.label_sheet_pool(2) as pool:
+            pass
+
+        def broken_map(function, items, chunksize=1):
+            if not breaks_after:
+                raise BrokenProcessPool()
+
+            def results():
+                for item in list(items)[:breaks_after]:
+                    yield function(item)
+                raise BrokenProcessPool()
+            return results()
+        monkeypatch.setattr(pool, 'map', broken_map)
+        rendered = list(labels.render_qr_codes(payloads, workers=2, min_parallel=1))
+
+        assert rendered == [render_qr_code_png(payload) for payload in payloads]
+        with labels.label_sheet_pool(2) as fresh:
+            assert fresh is not pool
+
+    def test_benchmark_reports_throughput(self):
+        """O benchmark informa lotes/s para os dois caminhos"""
+        result = labels.benchmark_qr_rendering(['b-1', 'b-2', 'b-3', 'b-4'], workers=2)
+
+        assert result['lots'] == 4
+        assert result['serial_lots_per_sec'] > 0
+        assert result['parallel_lots_per_sec'] > 0
+
+
+@pytest.mark.django_db
+class TestLabelSheets:
+    """Testes para a geração das folhas de etiquetas"""
+
+    def test_lot_selection_requires_filter(self):
+        """Sem ids nem filtros a seleção é rejeitada"""
+        with pytest.raises(ValueError):
+            labels.get_lots_for_labels()
+
+    def test_lot_selection_by_location(self, label_lots):
+        """A seleção por localização retorna apenas os lotes daquele local"""
+        lots = labels.get_lots_for_labels(location_id=label_lots[0].location_id)
+
+        assert lots.count() == 25
+
+    def test_pdf_has_one_page_per_sheet(self, label_lots):
+        """O PDF tem uma página por folha de 24 etiquetas"""
+        pdf = b''.join(labels.iter_label_sheet_pdf(labels.iter_label_sheet_pages(label_lots, workers=1)))
+
+        assert pdf.startswith(b'%PDF-1.4')
+        assert pdf.rstrip().endswith(b'%%EOF')
+        assert b'/Count 2' in pdf
+        startxref = int(pdf.rsplit(b'startxref\n', 1)[1].split(b'\n', 1)[0])
+        assert pdf[startxref:].startswith(b'xref')
+
+    def test_png_sheet(self, label_lots):
+        """O formato PNG renderiza uma única folha"""
+        png = labels.render_label_sheet_png(label_lots, page=2, workers=1)
+
+        image = Image.open(BytesIO(png))
+        assert image.size == (labels.PAGE_WIDTH_PX, labels.PAGE_HEIGHT_PX)
+
+        with pytest.raises(ValueError):
+            labels.render_label_sheet_png(label_lots, page=3, workers=1)
+
+    def test_label_sheet_endpoint_streams_pdf(self, authenticated_client, label_lots):
+        """O endpoint devolve o PDF como streaming"""
+        client, user = authenticated_client
+
+        response = client.post(
+            '/api/v1/stock-lots/labels/',
+            {'ids': [lot.id for lot in label_lots[:5]]},
+            format='json'
+        )
+
+        assert response.status_code == 200
+        assert response.streaming
+        assert response['Content-Type'] == 'application/pdf'
+        assert b''.join(response.streaming_content).startswith(b'%PDF')
+
+    def test_label_sheet_endpoint_png_page(self, authenticated_client, label_lots):
+        """O endpoint devolve uma página PNG com o total de páginas no cabeçalho"""
+        client, user = authenticated_client
+
+        response = client.post(
+            '/api/v1/stock-lots/labels/',
+            {'reagent': label_lots[0].reagent_id, 'format': 'png'},
+            format='json'
+        )
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'image/png'
+        assert response['X-Label-Sheet-Pages'] == '2'
+
+    def test_label_sheet_endpoint_validation(self, authenticated_client, label_lots):
+        """Seleções vazias ou inválidas são rejeitadas"""
+        client, user = authenticated_client
+
+        assert client.post('/api/v1/stock-lots/labels/', {}, format='json').status_code == 400
+        assert client.post('/api/v1/stock-lots/labels/', {'ids': [999999]}, format='json').status_code == 404
+        response = client.post(
+            '/api/v1/stock-lots/labels/',
+            {'ids': [label_lots[0].id], 'format': 'gif'},
+            format='json'
+        )
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize('ids', ['12', 12, {'id': 1}, ['x']])
+    def test_label_sheet_endpoint_rejects_ids_that_are_not_a_list(self, authenticated_client, label_lots, ids):
+        """ids precisa ser uma lista de ids: uma string como "12" não vira os lotes 1 e 2"""
+        client, user = authenticated_client
+
+        response = client.post('/api/v1/stock-lots/labels/', {'ids': ids, 'format': 'png'}, format='json')
+
+        assert response.status_code == 400
+
+    def test_management_command(self, label_lots, tmp_path):
+        """O comando gera o arquivo e o benchmark"""
+        output = tmp_path / 'labels.pdf'
+        stdout = StringIO()
+
+        call_command(
+            'generate_label_sheet', '--reagent', str(label_lots[0].reagent_id),
+            '--output', str(output), '--workers', '2', '--benchmark', stdout=stdout
+        )
+
+        assert output.read_bytes().startswith(b'%PDF')
+        assert 'lots/s' in stdout.getvalue()
@@ -139,25 +139,29 @@ def test_approve_requisition_invalid_status():
         approve_requisition(requisition, approver)
 
 @pytest.mark.django_db
-def test_audit_log_creation():
+def test_audit_log_creation(django_capture_on_commit_callbacks):
     """
     Tests that creating a model instance automatically creates an AuditLog entry.
+    Audit events are written when the transaction commits.
     """
     # Create a Category instance
-    category = Category.objects.create(name='Test Category', description='For testing audit log')
+    with django_capture_on_commit_callbacks(execute=True):
+        category = Category.objects.create(name='Test Category', description='For testing audit log')
 
     # Assert that an AuditLog entry was created
-    assert AuditLog.objects.filter(action='CREATE_CATEGORY', details__model='Category', details__id=category.id).exists()
+    assert AuditLog.objects.filter(action=AuditLog.CREATE, object_type=AuditLog.object_type_for(Category), object_id=category.id).exists()
 
     # Test update
     category.name = 'Updated Category'
-    category.save()
-    assert AuditLog.objects.filter(action='UPDATE_CATEGORY', details__model='Category', details__id=category.id).exists()
+    with django_capture_on_commit_callbacks(execute=True):
+        category.save()
+    assert AuditLog.objects.filter(action=AuditLog.UPDATE, object_type=AuditLog.object_type_for(Category), object_id=category.id).exists()
 
     # Test delete
     category_id = category.id
-    category.delete()
-    assert AuditLog.objects.filter(action='DELETE_CATEGORY', details__model='Category', details__id=category_id).exists()
+    with django_capture_on_commit_callbacks(execute=True):
+        category.delete()
+    assert AuditLog.objects.filter(action=AuditLog.DELETE, object_type=AuditLog.object_type_for(Category), object_id=category_id).exists()
 
 @pytest.mark.django_db
 def test_perform_withdrawal_updates_stock():
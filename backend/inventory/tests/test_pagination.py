@@ -0,0 +1,110 @@
+import pytest
+from decimal import Decimal
+from django.test import override_settings
+from inventory.models import Category, Supplier, Location, Reagent, StockLot, StockMovement, Requisition
+import datetime
+
+
+@pytest.fixture
+def pagination_data(authenticated_client, django_capture_on_commit_callbacks):
+    client, user = authenticated_client
+    # Audit rows are written on commit; run the hooks so /audit-logs/ has data.
+    with django_capture_on_commit_callbacks(execute=True):
+        category = Category.objects.create(name='Paginação')
+        supplier = Supplier.objects.create(name='Fornecedor Paginação')
+        location = Location.objects.create(name='Armário Paginação')
+        reagents = [
+            Reagent.objects.create(
+                name=f'Reagente {i}',
+                sku=f'PAG-{i:03d}',
+                category=category,
+                supplier=supplier,
+                min_stock_level=Decimal('1.00')
+            )
+            for i in range(12)
+        ]
+        lot = StockLot.objects.create(
+            reagent=reagents[0],
+            lot_number='PAG-LOT',
+            location=location,
+            expiry_date=datetime.date.today() + datetime.timedelta(days=365),
+            purchase_price=Decimal('1.00'),
+            initial_quantity=Decimal('100.00'),
+            current_quantity=Decimal('100.00')
+        )
+        movements = [
+            StockMovement.objects.create(stock_lot=lot, user=user, quantity=Decimal('1.00'), move_type='Entrada')
+            for _ in range(7)
+        ]
+        requisitions = [
+            Requisition.objects.create(requester=user, reagent=reagents[0], quantity=Decimal('1.00'))
+            for _ in range(5)
+        ]
+    return {'client': client, 'reagents': reagents, 'movements': movements, 'requisitions': requisitions}
+
+
+def collect_cursor_pages(client, url):
+    ids = []
+    pages = 0
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert 'count' not in response.data
+        ids += [item['id'] for item in response.data['results']]
+        url = response.data['next']
+        pages += 1
+    return ids, pages
+
+
+@pytest.mark.django_db
+class TestPagination:
+    """Testes para a paginação dos endpoints de listagem"""
+
+    def test_catalog_uses_page_numbers(self, pagination_data):
+        """Tabelas de catálogo usam paginação por número de página"""
+        client = pagination_data['client']
+
+        response = client.get('/api/v1/reagents/?page_size=5&page=2')
+
+        assert response.status_code == 200
+        assert response.data['count'] == 12
+        assert [item['sku'] for item in response.data['results']] == [f'PAG-{i:03d}' for i in range(5, 10)]
+        assert response.data['next'] is not None
+        assert response.data['previous'] is not None
+
+    @override_settings(API_MAX_PAGE_SIZE=4)
+    def test_page_size_is_capped(self, pagination_data):
+        """O page_size solicitado é limitado pelo máximo configurado"""
+        client = pagination_data['client']
+
+        response = client.get('/api/v1/reagents/?page_size=1000')
+
+        assert len(response.data['results']) == 4
+
+    def test_stock_movements_use_cursor(self, pagination_data):
+        """Movimentações são paginadas por cursor, da mais recente para a mais antiga"""
+        client = pagination_data['client']
+
+        ids, pages = collect_cursor_pages(client, '/api/v1/stock-movements/?page_size=3')
+
+        expected = sorted((movement.id for movement in pagination_data['movements']), reverse=True)
+        assert ids == expected
+        assert pages == 3
+
+    def test_requisitions_use_cursor(self, pagination_data):
+        """Requisições são paginadas por cursor sobre a data de requisição"""
+        client = pagination_data['client']
+
+        ids, pages = collect_cursor_pages(client, '/api/v1/requisitions/?page_size=2')
+
+        expected = sorted((requisition.id for requisition in pagination_data['requisitions']), reverse=True)
+        assert ids == expected
+
+    def test_audit_logs_use_cursor(self, pagination_data):
+        """O log de auditoria é paginado por cursor sem repetir registros"""
+        client = pagination_data['client']
+
+        ids, pages = collect_cursor_pages(client, '/api/v1/audit-logs/?page_size=10')
+
+        assert len(ids) == len(set(ids))
+        assert pages > 1
@@ -1,10 +1,15 @@
 import pytest
 from rest_framework.test import APIClient
-from inventory.models import Reagent, Category, Supplier, StockLot, Location, StockMovement, User, Requisition
+from inventory.models import Reagent, Category, Supplier, StockLot, Location, StockMovement, User, Requisition, AuditLog
+from inventory.services import get_lots_for_withdrawal, perform_withdrawal
+from inventory.planning import FefoPlanner
 import datetime
 from django.utils import timezone
 from decimal import Decimal
 import time
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 @pytest.fixture
 def performance_test_data():
@@ -207,4 +212,167 @@ def test_single_stock_lot_retrieve_performance(performance_test_data):
     response_time = end_time - start_time
     
     assert response.status_code == 200
-    assert response_time < 0.5  # Should respond in less than 0.5 seconds
\ No newline at end of file
+    assert response_time < 0.5  # Should respond in less than 0.5 seconds
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200, url
+    return len(context.captured_queries)
+
+# Expected queries per list request: page-number pagination issues a COUNT plus
+# the page SELECT; cursor pagination only the keyset SELECT.
+LIST_ENDPOINT_QUERIES = {
+    '/api/v1/reagents/': 2,
+    '/api/v1/stock-lots/': 2,
+    '/api/v1/stock-lots/?include=qr': 2,
+    '/api/v1/stock-movements/': 1,
+    '/api/v1/requisitions/': 1,
+    '/api/v1/categories/': 2,
+    '/api/v1/suppliers/': 2,
+    '/api/v1/locations/': 2,
+    '/api/v1/audit-logs/': 1,
+    '/api/v1/users/': 2,
+}
+
+ADMIN_CHANGELISTS = ['reagent', 'stocklot', 'stockmovement', 'alert', 'notification', 'user']
+
+@pytest.mark.django_db
+def test_list_endpoints_query_count_is_constant(performance_test_data):
+    """Each list endpoint issues a fixed number of queries, whatever the page size"""
+    client = APIClient()
+    user = User.objects.create_user(username='testuser', password='testpass', role='Analista')
+    client.force_authenticate(user=user)
+
+    for url, expected in LIST_ENDPOINT_QUERIES.items():
+        separator = '&' if '?' in url else '?'
+        small_page = count_queries(client, f'{url}{separator}page_size=5')
+        large_page = count_queries(client, f'{url}{separator}page_size=200')
+        assert small_page == large_page == expected, url
+
+@pytest.mark.django_db
+def test_detail_endpoints_query_count(performance_test_data):
+    """Detail endpoints fetch a single row without lazy relation loads"""
+    client = APIClient()
+    user = User.objects.create_user(username='testuser', password='testpass', role='Analista')
+    client.force_authenticate(user=user)
+
+    reagent = performance_test_data['reagents'][0]
+    stock_lot = performance_test_data['stock_lots'][0]
+
+    assert count_queries(client, f'/api/v1/reagents/{reagent.id}/') == 1
+    assert count_queries(client, f'/api/v1/stock-lots/{stock_lot.id}/') == 1
+
+@pytest.mark.django_db
+def test_admin_changelists_do_not_query_per_row(performance_test_data, admin_client):
+    """Admin list pages select their displayed relations up front"""
+    for model_name in ADMIN_CHANGELISTS:
+        # A full page lists 100 rows, so a per-row lookup would blow well past this bound.
+        assert count_queries(admin_client, f'/admin/inventory/{model_name}/') <= 10, model_name
+
+def legacy_withdrawal(reagent, quantity, user):
+    """The per-lot withdrawal loop perform_withdrawal replaced, kept as the benchmark baseline"""
+    total_withdrawn = 0
+    for lot, qty_to_withdraw in get_lots_for_withdrawal(reagent, quantity, lock=True):
+        lot.current_quantity -= qty_to_withdraw
+        lot.save()
+        total_withdrawn += qty_to_withdraw
+        StockMovement.objects.create(stock_lot=lot, user=user, quantity=qty_to_withdraw, move_type='Retirada')
+    return total_withdrawn
+
+@pytest.fixture
+def make_withdrawal_lots():
+    category = Category.objects.create(name='Benchmark')
+    supplier = Supplier.objects.create(name='Fornecedor Benchmark')
+    location = Location.objects.create(name='Armário Benchmark')
+
+    def make(sku, lot_count):
+        reagent = Reagent.objects.create(
+            name=f'Reagente {sku}', sku=sku, category=category, supplier=supplier, min_stock_level=Decimal('1.00')
+        )
+        for i in range(lot_count):
+            StockLot.objects.create(
+                reagent=reagent,
+                lot_number=f'{sku}-{i:03d}',
+                location=location,
+                expiry_date=timezone.now().date() + datetime.timedelta(days=30 + i),
+                purchase_price=Decimal('1.00'),
+                initial_quantity=Decimal('10.00'),
+                current_quantity=Decimal('10.00')
+            )
+        return reagent
+    return make
+
+# The queries of one perform_withdrawal, committed, whatever the number of lots:
+WITHDRAWAL_QUERIES = [
+    'SAVEPOINT',                      # the withdrawal's atomic block, nested in the test transaction
+    'SELECT lots FOR UPDATE',         # FEFO candidates, locked
+    'UPDATE lots CASE',               # every touched lot in one statement
+    'INSERT movements',               # one bulk insert
+    'SELECT summary FOR UPDATE',      # ReagentStockSummary.refresh locks the row...
+    'SELECT lot totals',              # ...sums the lots...
+    'UPDATE summary',                 # ...and writes the totals
+    'INSERT rollup ON CONFLICT',      # DailyMovementRollup.apply
+    'RELEASE SAVEPOINT',
+    # On commit:
+    'SAVEPOINT',                      # the audit insert's atomic block, only a savepoint inside the test transaction
+    'INSERT audit',                   # one bulk insert for the whole transaction
+    'RELEASE SAVEPOINT',
+    'SELECT alerts',                  # the alert evaluation of the reagent
+]
+
+def withdraw_and_commit(withdraw, reagent, quantity, user):
+    """Runs a withdrawal and its on-commit work; returns the elapsed seconds."""
+    start_time = time.perf_counter()
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        with transaction.atomic():
+            withdraw(reagent, quantity, user)
+    return time.perf_counter() - start_time
+
+@pytest.mark.django_db
+def test_batched_withdrawal_benchmark(make_withdrawal_lots, django_assert_num_queries, record_property):
+    """A FEFO withdrawal spanning many lots costs a constant number of queries, unlike the per-lot loop"""
+    user = User.objects.create_user(username='benchmark', password='testpass')
+    small = make_withdrawal_lots('BENCH-SMALL', 5)
+    large = make_withdrawal_lots('BENCH-LARGE', 20)
+    baseline = make_withdrawal_lots('BENCH-BASE', 20)
+
+    # The same queries for 5 lots as for 20.
+    with django_assert_num_queries(len(WITHDRAWAL_QUERIES)):
+        withdraw_and_commit(perform_withdrawal, small, Decimal('50.00'), user)
+    with django_assert_num_queries(len(WITHDRAWAL_QUERIES)) as batched_queries:
+        batched_time = withdraw_and_commit(perform_withdrawal, large, Decimal('200.00'), user)
+    with CaptureQueriesContext(connection) as legacy_queries:
+        legacy_time = withdraw_and_commit(legacy_withdrawal, baseline, Decimal('200.00'), user)
+
+    # Latency is recorded, not asserted: it depends on the machine.
+    timings = (f'20 lots: batched {len(batched_queries)} queries in {batched_time * 1000:.1f}ms, '
+               f'per-lot loop {len(legacy_queries)} queries in {legacy_time * 1000:.1f}ms')
+    record_property('batched_withdrawal_ms', round(batched_time * 1000, 2))
+    record_property('legacy_withdrawal_ms', round(legacy_time * 1000, 2))
+    assert len(legacy_queries) >= 5 * 20, timings
+
+    assert StockMovement.objects.filter(stock_lot__reagent=large).count() == 20
+    assert not StockLot.objects.filter(reagent=large, current_quantity__gt=0).exists()
+    audit = AuditLog.objects.get(action=AuditLog.STOCK_WITHDRAWAL, object_id=large.pk)
+    assert len(audit.details['lots']) == 20
+
+def test_fefo_planner_simulation_speed():
+    """Simulating a requisition queue against thousands of lots stays under 10ms"""
+    today = timezone.now().date()
+    lots = [
+        (i, f'LOT-{i:05d}', today + datetime.timedelta(days=i % 720), Decimal('10.00'))
+        for i in range(5000)
+    ]
+    lots.sort(key=lambda lot: lot[2])
+    pending = [(i, Decimal('7.50')) for i in range(200)]
+    planner = FefoPlanner(1, lots, pending)
+
+    timings = []
+    for _ in range(5):
+        start_time = time.perf_counter()
+        plan = planner.simulate([{'quantity': Decimal('25.00'), 'needed_by': today + datetime.timedelta(days=30)}])
+        timings.append(time.perf_counter() - start_time)
+
+    assert plan['total_shortfall'] == 0
+    assert min(timings) < 0.010
@@ -0,0 +1,192 @@
+import pytest
+from decimal import Decimal
+from inventory.models import Category, Supplier, Location, Reagent, StockLot, StockMovement, Requisition, User
+from inventory.planning import FefoPlanner
+from inventory.services import perform_withdrawal
+import datetime
+
+TODAY = datetime.date(2025, 1, 1)
+
+
+def days(n):
+    return TODAY + datetime.timedelta(days=n)
+
+
+def planner(lots, pending=()):
+    return FefoPlanner(1, [(i, number, expiry, Decimal(quantity)) for i, (number, expiry, quantity) in enumerate(lots)], pending)
+
+
+class TestFefoPlanner:
+    """Testes para a simulação FEFO em memória"""
+
+    def test_pending_requisitions_consume_earliest_lots(self):
+        """Requisições pendentes consomem primeiro os lotes que vencem antes"""
+        plan = planner(
+            [('A', days(10), '5.00'), ('B', days(20), '10.00')],
+            pending=[(101, Decimal('4.00')), (102, Decimal('3.00'))]
+        ).simulate(as_of=TODAY)
+
+        first, second = plan['demands']
+        assert first['allocations'] == [
+            {'lot_id': 0, 'lot_number': 'A', 'quantity': Decimal('4.00'), 'expired': False}
+        ]
+        assert [a['lot_number'] for a in second['allocations']] == ['A', 'B']
+        assert plan['total_shortfall'] == 0
+        assert plan['remaining'] == Decimal('8.00')
+
+    def test_shortfall_and_what_if_demand(self):
+        """A demanda simulada entra depois das pendentes e reporta a falta"""
+        plan = planner(
+            [('A', days(10), '5.00')], pending=[(101, Decimal('4.00'))]
+        ).simulate([{'quantity': Decimal('2.50')}], as_of=TODAY)
+
+        assert plan['demands'][1]['source'] == 'simulation'
+        assert plan['demands'][1]['shortfall'] == Decimal('1.50')
+        assert plan['total_shortfall'] == Decimal('1.50')
+
+    def test_lots_expired_at_need_are_flagged(self):
+        """Como na retirada, o lote que vence primeiro é alocado, marcado se já estiver vencido na data de uso"""
+        plan = planner(
+            [('A', days(10), '2.00'), ('B', days(40), '5.00')]
+        ).simulate([{'quantity': Decimal('3.00'), 'needed_by': days(15)}], as_of=TODAY)
+
+        assert [(a['lot_number'], a['quantity'], a['expired']) for a in plan['demands'][0]['allocations']] == [
+            ('A', Decimal('2.00'), True), ('B', Decimal('1.00'), False)
+        ]
+        assert [lot['lot_number'] for lot in plan['expiring_unused']] == ['B']
+
+    def test_expiring_unused_respects_horizon(self):
+        """Somente lotes que vencem dentro do horizonte são reportados"""
+        plan = planner(
+            [('A', days(10), '5.00'), ('B', days(200), '5.00')]
+        ).simulate(as_of=TODAY, horizon_days=30)
+
+        assert plan['expiring_unused'] == [
+            {'lot_id': 0, 'lot_number': 'A', 'expiry_date': days(10), 'quantity': Decimal('5.00')}
+        ]
+
+    def test_simulation_does_not_mutate_snapshot(self):
+        """Simulações repetidas partem sempre do mesmo estoque"""
+        plan = planner([('A', days(10), '5.00')])
+
+        plan.simulate([{'quantity': Decimal('5.00')}], as_of=TODAY)
+        assert plan.simulate(as_of=TODAY)['remaining'] == Decimal('5.00')
+
+
+@pytest.fixture
+def plan_reagent():
+    category = Category.objects.create(name='Planejamento')
+    supplier = Supplier.objects.create(name='Fornecedor Planejamento')
+    location = Location.objects.create(name='Armário Planejamento')
+    reagent = Reagent.objects.create(
+        name='Clorofórmio', sku='CHCL3-PLAN', category=category, supplier=supplier, min_stock_level=Decimal('1.00')
+    )
+    for number, offset, quantity in (('P-1', 5, '2.00'), ('P-2', 50, '10.00'), ('P-VAZIO', 1, '0.00')):
+        StockLot.objects.create(
+            reagent=reagent, lot_number=number, location=location,
+            expiry_date=datetime.date.today() + datetime.timedelta(days=offset),
+            purchase_price=Decimal('1.00'), initial_quantity=Decimal('10.00'), current_quantity=Decimal(quantity)
+        )
+    requester = User.objects.create_user(username='planejador', password='testpass')
+    Requisition.objects.create(requester=requester, reagent=reagent, quantity=Decimal('3.00'))
+    return reagent
+
+
+@pytest.mark.django_db
+class TestFefoPlanEndpoint:
+    """Testes para o endpoint de planejamento FEFO"""
+
+    def test_get_with_quantity(self, authenticated_client, plan_reagent):
+        """O GET simula a quantidade digitada após as requisições pendentes"""
+        client, user = authenticated_client
+
+        response = client.get(f'/api/v1/reagents/{plan_reagent.id}/fefo-plan/?quantity=10')
+
+        assert response.status_code == 200
+        assert response.data['available'] == Decimal('12.00')
+        assert [demand['source'] for demand in response.data['demands']] == ['requisition', 'simulation']
+        assert response.data['total_shortfall'] == Decimal('1.00')
+
+    def test_post_demand_queue(self, authenticated_client, plan_reagent):
+        """O POST aceita uma fila de demandas com datas de uso"""
+        client, user = authenticated_client
+        needed_by = (datetime.date.today() + datetime.timedelta(days=10)).isoformat()
+
+        response = client.post(f'/api/v1/reagents/{plan_reagent.id}/fefo-plan/', {
+            'demands': [{'id': 'x', 'quantity': '1.00', 'needed_by': needed_by}],
+            'include_pending': False,
+            'horizon_days': 30,
+        }, format='json')
+
+        assert response.status_code == 200
+        assert [(a['lot_number'], a['expired']) for a in response.data['demands'][0]['allocations']] == [('P-1', True)]
+        assert [lot['lot_number'] for lot in response.data['expiring_unused']] == ['P-1']
+
+    def test_snapshot_is_cached_until_stock_changes(
+        self, authenticated_client, plan_reagent, django_assert_num_queries, django_capture_on_commit_callbacks
+    ):
+        """O snapshot é reutilizado até a próxima escrita de estoque ou requisição"""
+        client, user = authenticated_client
+        url = f'/api/v1/reagents/{plan_reagent.id}/fefo-plan/?quantity=1'
+        client.get(url)
+
+        with django_assert_num_queries(1):  # Only the reagent existence check.
+            client.get(url)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            lot = StockLot.objects.get(lot_number='P-2')
+            lot.current_quantity = Decimal('1.00')
+            lot.save()
+
+        assert client.get(url).data['available'] == Decimal('3.00')
+
+    def test_validation(self, authenticated_client, plan_reagent):
+        """Quantidades, datas inválidas e reagentes inexistentes são rejeitados"""
+        client, user = authenticated_client
+        url = f'/api/v1/reagents/{plan_reagent.id}/fefo-plan/'
+
+        assert client.get(f'{url}?quantity=abc').status_code == 400
+        assert client.get(f'{url}?quantity=-1').status_code == 400
+        assert client.get(f'{url}?quantity=1&needed_by=amanhã').status_code == 400
+        assert client.post(url, {'demands': 'x'}, format='json').status_code == 400
+        assert client.get('/api/v1/reagents/999999/fefo-plan/').status_code == 404
+
+    @pytest.mark.parametrize('query', [
+        'quantity=1e30', 'quantity=100000000', 'quantity=Infinity', 'quantity=NaN', 'quantity=0.001',
+        'quantity=1&horizon_days=-1', 'quantity=1&horizon_days=99999999',
+        'quantity=1&needed_by=9999-12-31',
+    ])
+    def test_out_of_range_values_are_rejected(self, authenticated_client, plan_reagent, query):
+        """Quantidades enormes, não finitas ou abaixo de centésimos e horizontes fora do limite respondem 400, não 500"""
+        client, user = authenticated_client
+
+        assert client.get(f'/api/v1/reagents/{plan_reagent.id}/fefo-plan/?{query}').status_code == 400
+
+
+@pytest.mark.django_db
+class TestPlanMatchesWithdrawal:
+    """Testes comparando a simulação com uma retirada real sobre os mesmos lotes"""
+
+    def test_simulation_allocates_like_perform_withdrawal(self, plan_reagent):
+        """A simulação aloca os mesmos lotes e quantidades que a retirada, inclusive lotes vencidos"""
+        location = Location.objects.get(name='Armário Planejamento')
+        StockLot.objects.create(
+            reagent=plan_reagent, lot_number='P-VENCIDO', location=location,
+            expiry_date=datetime.date.today() - datetime.timedelta(days=3),
+            purchase_price=Decimal('1.00'), initial_quantity=Decimal('10.00'), current_quantity=Decimal('1.00')
+        )
+        user = User.objects.get(username='planejador')
+
+        plan = FefoPlanner.load(plan_reagent.id).simulate([{'quantity': Decimal('5.00')}], include_pending=False)
+        perform_withdrawal(plan_reagent, Decimal('5.00'), user)
+        withdrawn = StockMovement.objects.filter(stock_lot__reagent=plan_reagent).order_by('stock_lot__expiry_date')
+
+        assert [(a['lot_number'], a['quantity']) for a in plan['demands'][0]['allocations']] == [
+            (movement.stock_lot.lot_number, movement.quantity) for movement in withdrawn
+        ] == [('P-VENCIDO', Decimal('1.00')), ('P-1', Decimal('2.00')), ('P-2', Decimal('2.00'))]
+        assert [a['expired'] for a in plan['demands'][0]['allocations']] == [True, False, False]
+
+        shortfall = FefoPlanner.load(plan_reagent.id).simulate([{'quantity': Decimal('9.00')}], include_pending=False)
+        assert shortfall['demands'][0]['shortfall'] == Decimal('1.00')
+        with pytest.raises(ValueError):
+            perform_withdrawal(plan_reagent, Decimal('9.00'), user)
@@ -0,0 +1,169 @@
+import pytest
+from decimal import Decimal
+from django.core.cache import cache
+from inventory.models import Category, Supplier, Location, Reagent, StockLot
+from inventory.serializers import StockLotSerializer
+from inventory import utils
+import datetime
+
+
+@pytest.fixture
+def qr_stock_lot():
+    category = Category.objects.create(name='Sais QR')
+    supplier = Supplier.objects.create(name='Fornecedor QR')
+    location = Location.objects.create(name='Prateleira QR')
+    reagent = Reagent.objects.create(
+        name='Cloreto de Potássio',
+        sku='KCL-QR-001',
+        category=category,
+        supplier=supplier,
+        min_stock_level=Decimal('10.00')
+    )
+    return StockLot.objects.create(
+        reagent=reagent,
+        lot_number='KCL-QR-A',
+        location=location,
+        expiry_date=datetime.date.today() + datetime.timedelta(days=365),
+        purchase_price=Decimal('10.00'),
+        initial_quantity=Decimal('100.00'),
+        current_quantity=Decimal('100.00')
+    )
+
+
+@pytest.fixture
+def render_counter(monkeypatch):
+    """Conta quantas vezes o PNG é efetivamente renderizado."""
+    calls = []
+    original = utils.render_qr_code_png
+
+    def counting_render(data):
+        calls.append(data)
+        return original(data)
+
+    utils.get_qr_code_png.cache_clear()
+    cache.clear()
+    monkeypatch.setattr(utils, 'render_qr_code_png', counting_render)
+    yield calls
+    utils.get_qr_code_png.cache_clear()
+
+
+class TestQrCodeCache:
+    """Testes para o cache de QR codes"""
+
+    def test_cached_image_matches_direct_rendering(self):
+        """O cache devolve exatamente a mesma imagem que a renderização direta"""
+        assert utils.get_qr_code_image('qr-payload') == utils.generate_qr_code_image('qr-payload')
+
+    def test_renders_once_per_payload(self, render_counter):
+        """Payloads repetidos não são renderizados novamente"""
+        first = utils.get_qr_code_png('lot-1')
+        second = utils.get_qr_code_png('lot-1')
+
+        assert first == second
+        assert render_counter == ['lot-1']
+
+    def test_shared_cache_backend_survives_lru_eviction(self, render_counter):
+        """Uma falta no LRU local é servida pelo backend de cache do Django"""
+        utils.get_qr_code_png('lot-2')
+        utils.get_qr_code_png.cache_clear()
+        utils.get_qr_code_png('lot-2')
+
+        assert render_counter == ['lot-2']
+
+    def test_cache_key_is_content_addressed(self):
+        """A chave depende apenas do conteúdo codificado"""
+        assert utils.qr_code_cache_key('42') == utils.qr_code_cache_key('42')
+        assert utils.qr_code_cache_key('42') != utils.qr_code_cache_key('43')
+
+
+@pytest.mark.django_db
+class TestStockLotQrCode:
+    """Testes para a pré-computação do QR code dos lotes"""
+
+    def test_qr_code_precomputed_on_creation(self, render_counter, qr_stock_lot):
+        """A criação do lote aquece o cache"""
+        assert render_counter == [qr_stock_lot.qr_code_data]
+        assert cache.get(utils.qr_code_cache_key(qr_stock_lot.qr_code_data)) is not None
+
+    def test_serialization_does_not_render(self, render_counter, qr_stock_lot):
+        """A serialização de lotes existentes não renderiza PNGs"""
+        del render_counter[:]
+
+        data = StockLotSerializer(qr_stock_lot).data
+
+        assert data['qr_code_image'].startswith('data:image/png;base64,')
+        assert render_counter == []
+
+
+@pytest.mark.django_db
+class TestStockLotQrCodeEndpoints:
+    """Testes para os endpoints de imagem do QR code"""
+
+    def test_png_endpoint_returns_raw_bytes(self, authenticated_client, qr_stock_lot):
+        """O endpoint PNG devolve os bytes da imagem com cache de longa duração"""
+        client, user = authenticated_client
+
+        response = client.get(f'/api/v1/stock-lots/{qr_stock_lot.id}/qr.png')
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'image/png'
+        assert response.content == utils.render_qr_code_png(qr_stock_lot.qr_code_data)
+        assert response['ETag'].startswith('"png-')
+        assert 'max-age=31536000' in response['Cache-Control']
+        assert 'immutable' in response['Cache-Control']
+        assert 'private' in response['Cache-Control'] and 'public' not in response['Cache-Control']
+
+    def test_svg_endpoint(self, authenticated_client, qr_stock_lot):
+        """O endpoint SVG devolve um documento SVG"""
+        client, user = authenticated_client
+
+        response = client.get(f'/api/v1/stock-lots/{qr_stock_lot.id}/qr.svg')
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'image/svg+xml'
+        assert b'<svg' in response.content
+        assert response['ETag'].startswith('"svg-')
+
+    def test_matching_etag_returns_not_modified(self, authenticated_client, qr_stock_lot):
+        """Um If-None-Match válido devolve 304 sem corpo"""
+        client, user = authenticated_client
+        url = f'/api/v1/stock-lots/{qr_stock_lot.id}/qr.png'
+        etag = client.get(url)['ETag']
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 304
+        assert response.content == b''
+
+    def test_image_and_etag_follow_the_lot_payload(self, authenticated_client, qr_stock_lot, monkeypatch):
+        """Imagem e ETag saem de StockLot.qr_code_data, não do id da URL"""
+        client, user = authenticated_client
+        url = f'/api/v1/stock-lots/{qr_stock_lot.id}/qr.png'
+        etag = client.get(url)['ETag']
+
+        monkeypatch.setattr(StockLot, 'qr_code_data', property(lambda lot: f'https://lab.example/lots/{lot.pk}'))
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 200
+        assert response['ETag'] == f'"png-{utils.qr_code_digest(qr_stock_lot.qr_code_data)}"'
+        assert response.content == utils.render_qr_code_png(qr_stock_lot.qr_code_data)
+
+    def test_unknown_lot_returns_404(self, authenticated_client):
+        """Lotes inexistentes devolvem 404"""
+        client, user = authenticated_client
+
+        response = client.get('/api/v1/stock-lots/999999/qr.png')
+
+        assert response.status_code == 404
+
+    def test_list_omits_inline_image_unless_requested(self, authenticated_client, qr_stock_lot):
+        """A listagem só inclui a imagem base64 com ?include=qr"""
+        client, user = authenticated_client
+
+        response = client.get('/api/v1/stock-lots/')
+        lot_data = response.data['results'][0]
+        assert 'qr_code_image' not in lot_data
+        assert lot_data['qr_code_url'].endswith(f'/api/v1/stock-lots/{qr_stock_lot.id}/qr.png')
+
+        response = client.get('/api/v1/stock-lots/?include=qr')
+        assert response.data['results'][0]['qr_code_image'].startswith('data:image/png;base64,')
@@ -2,6 +2,15 @@ import pytest
 from rest_framework.test import APIClient
 from inventory.models import Reagent, Category, Supplier, StockLot, Location, StockMovement, User
 import datetime
+import io
+import json
+import zipfile
+from xml.etree import ElementTree
+from django.db.models import QuerySet
+from inventory.exports import EXPORT_CHUNK_SIZE
+from inventory import tasks
+from django.test import override_settings
+from django_celery_results.models import TaskResult
 from django.utils import timezone
 from freezegun import freeze_time
 from decimal import Decimal
@@ -197,4 +206,158 @@ def test_expiry_report_invalid_parameters(authenticated_client, report_test_data
 
     # Test invalid days_until_expiry parameter
     response_invalid = client.get('/api/v1/reports/expiry/?days_until_expiry=invalid')
-    assert response_invalid.status_code == 400
\ No newline at end of file
+    assert response_invalid.status_code == 400
+@pytest.fixture
+def expiring_lots(report_test_data):
+    category, supplier, location, reagent = report_test_data
+    for i in range(3):
+        StockLot.objects.create(
+            reagent=reagent, lot_number=f'LOT-EXP-{i}', location=location,
+            expiry_date=timezone.now().date() + datetime.timedelta(days=10 + i),
+            purchase_price=10, initial_quantity=100, current_quantity=Decimal('5.50')
+        )
+    return reagent
+
+@pytest.mark.django_db
+def test_report_csv_export(authenticated_client, expiring_lots):
+    """?format=csv streams the report rows as CSV with a header"""
+    client, user = authenticated_client
+
+    response = client.get('/api/v1/reports/expiry/?days_until_expiry=30&format=csv')
+
+    assert response.status_code == 200
+    assert response.streaming
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    assert response['Content-Disposition'] == 'attachment; filename="validade.csv"'
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert lines[0] == 'reagent__name,lot_number,expiry_date,current_quantity,location__name'
+    assert len(lines) == 4
+    assert lines[1].startswith('TestReagent,LOT-EXP-0,') and lines[1].endswith(',5.50,TestLocation')
+
+@pytest.mark.django_db
+def test_report_jsonl_export(authenticated_client, expiring_lots):
+    """?format=jsonl streams one JSON object per row"""
+    client, user = authenticated_client
+
+    response = client.get('/api/v1/reports/stock-value/?group_by=location&format=jsonl')
+
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+    assert response['Content-Type'] == 'application/x-ndjson; charset=utf-8'
+    assert [(row['location__name'], Decimal(row['total_value'])) for row in rows] == [('TestLocation', Decimal('165'))]
+
+@pytest.mark.django_db
+def test_report_xlsx_export(authenticated_client, expiring_lots):
+    """?format=xlsx streams a workbook with a header row and one row per report row"""
+    client, user = authenticated_client
+
+    response = client.get('/api/v1/reports/expiry/?format=xlsx')
+
+    workbook = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+    assert workbook.testzip() is None
+    namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+    sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+    rows = [
+        [cell.findtext('s:v', namespaces=namespace) or cell.findtext('s:is/s:t', namespaces=namespace) for cell in row]
+        for row in sheet.iterfind('s:sheetData/s:row', namespace)
+    ]
+    assert rows[0] == ['reagent__name', 'lot_number', 'expiry_date', 'current_quantity', 'location__name']
+    assert [row[1] for row in rows[1:]] == ['LOT-EXP-0', 'LOT-EXP-1', 'LOT-EXP-2']
+    assert rows[1][3] == '5.50'
+
+@pytest.mark.django_db
+def test_report_export_reads_rows_from_an_iterator(authenticated_client, expiring_lots, monkeypatch):
+    """Exports stream the queryset through .iterator() instead of building a list"""
+    client, user = authenticated_client
+    chunk_sizes = []
+    original_iterator = QuerySet.iterator
+    monkeypatch.setattr(QuerySet, 'iterator', lambda self, chunk_size=None: chunk_sizes.append(chunk_size) or original_iterator(self, chunk_size))
+
+    response = client.get('/api/v1/reports/consumption-by-user/?start_date=2025-01-01&end_date=2025-01-31&format=csv')
+
+    assert b''.join(response.streaming_content).decode().strip() == 'user__username,stock_lot__reagent__name,total_quantity'
+    assert chunk_sizes == [EXPORT_CHUNK_SIZE]
+
+@pytest.mark.django_db
+def test_report_export_errors_stay_json(authenticated_client, report_test_data):
+    """Parameter errors are answered in JSON whatever format was asked for"""
+    client, user = authenticated_client
+
+    response = client.get('/api/v1/reports/waste-loss/?format=csv')
+
+    assert response.status_code == 400
+    assert response['Content-Type'] == 'application/json'
+    assert response.json() == {'error': 'start_date and end_date are required.'}
+
+@pytest.fixture
+def report_jobs(authenticated_client, expiring_lots, eager_celery, tmp_path):
+    client, user = authenticated_client
+    with override_settings(MEDIA_ROOT=tmp_path):
+        yield client
+
+EXPIRY_JOB = {'report': 'expiry', 'params': {'days_until_expiry': '30'}, 'format': 'csv'}
+
+@pytest.mark.django_db
+def test_report_job_is_generated_and_downloaded(report_jobs):
+    """Um job de relatório é calculado pelo Celery, registrado no backend de resultados e baixado depois"""
+    response = report_jobs.post('/api/v1/reports/jobs/', EXPIRY_JOB, format='json')
+
+    assert response.status_code == 202
+    job_id = response.json()['job_id']
+    status_response = report_jobs.get(f'/api/v1/reports/jobs/{job_id}/').json()
+    assert status_response['status'] == 'SUCCESS'
+    assert status_response['result']['rows'] == 3
+    assert status_response['result']['spec'] == {'report': 'expiry', 'params': {'days_until_expiry': 30}, 'format': 'csv'}
+    assert TaskResult.objects.get(task_id=job_id).status == 'SUCCESS'
+
+    download = report_jobs.get(status_response['download_url'])
+    lines = b''.join(download.streaming_content).decode().splitlines()
+    assert download['Content-Type'] == 'text/csv'
+    assert lines[0].startswith('reagent__name,lot_number') and len(lines) == 4
+
+@pytest.mark.django_db
+def test_identical_spec_reuses_job(report_jobs, tmp_path):
+    """Um pedido idêntico dentro do TTL reaproveita o resultado, a menos que o arquivo tenha sumido"""
+    first = report_jobs.post('/api/v1/reports/jobs/', EXPIRY_JOB, format='json').json()
+
+    again = report_jobs.post('/api/v1/reports/jobs/', dict(EXPIRY_JOB, params={'days_until_expiry': 30}), format='json')
+    assert again.status_code == 200
+    assert again.json()['job_id'] == first['job_id'] and again.json()['reused']
+
+    other = report_jobs.post('/api/v1/reports/jobs/', dict(EXPIRY_JOB, format='jsonl'), format='json').json()
+    assert other['job_id'] != first['job_id']
+
+    for path in (tmp_path / 'reports').iterdir():
+        path.unlink()
+    assert report_jobs.get(f"/api/v1/reports/jobs/{first['job_id']}/download/").status_code == 410
+    regenerated = report_jobs.post('/api/v1/reports/jobs/', EXPIRY_JOB, format='json').json()
+    assert regenerated['job_id'] != first['job_id'] and not regenerated['reused']
+
+@pytest.mark.django_db
+def test_report_job_runs_inline_without_broker(authenticated_client, expiring_lots, tmp_path, monkeypatch):
+    """Sem broker o job é gerado no próprio processo e continua consultável"""
+    client, user = authenticated_client
+
+    def broker_down(*args, **kwargs):
+        raise ConnectionError('broker down')
+    monkeypatch.setattr(tasks.generate_report, 'apply_async', broker_down)
+
+    with override_settings(MEDIA_ROOT=tmp_path):
+        job_id = client.post('/api/v1/reports/jobs/', EXPIRY_JOB, format='json').json()['job_id']
+        assert client.get(f'/api/v1/reports/jobs/{job_id}/').json()['status'] == 'SUCCESS'
+
+@pytest.mark.django_db
+def test_report_job_validation(report_jobs):
+    """Especificações inválidas e jobs desconhecidos são recusados"""
+    invalid = [
+        ({'report': 'financeiro'}, 'report must be one of'),
+        ({'report': 'waste-loss', 'params': {'start_date': '2025-01-01'}}, 'end_date is required'),
+        ({'report': 'expiry', 'params': {'days_until_expiry': 'muitos'}}, 'Invalid value for days_until_expiry'),
+        ({'report': 'expiry', 'params': {'ordem': 'nome'}}, 'Unknown parameters'),
+        ({'report': 'stock-value', 'params': {'group_by': 'supplier'}}, 'Invalid group_by'),
+        ({'report': 'expiry', 'format': 'pdf'}, 'format must be one of'),
+    ]
+    for spec, message in invalid:
+        response = report_jobs.post('/api/v1/reports/jobs/', spec, format='json')
+        assert response.status_code == 400 and message in response.json()['error'], spec
+
+    assert report_jobs.get('/api/v1/reports/jobs/nao-existe/').status_code == 404
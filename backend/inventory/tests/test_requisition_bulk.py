@@ -0,0 +1,135 @@
+import pytest
+from decimal import Decimal
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from inventory.models import (
+    Category, Supplier, Location, Reagent, StockLot, StockMovement, Requisition, ReagentStockSummary, AuditLog, User
+)
+from inventory.services import bulk_process_requisitions
+import datetime
+
+URL = '/api/v1/requisitions/bulk-action/'
+
+
+@pytest.fixture
+def bulk_stock():
+    category = Category.objects.create(name='Aprovação em Lote')
+    supplier = Supplier.objects.create(name='Fornecedor Lote')
+    location = Location.objects.create(name='Almoxarifado')
+    requester = User.objects.create_user(username='solicitante', password='testpass')
+    reagents = []
+    for sku in ('LOTE-A', 'LOTE-B'):
+        reagent = Reagent.objects.create(
+            name=f'Reagente {sku}', sku=sku, category=category, supplier=supplier, min_stock_level=Decimal('1.00')
+        )
+        for lot_number, days in (('NOVO', 60), ('VELHO', 10)):
+            StockLot.objects.create(
+                reagent=reagent,
+                lot_number=f'{sku}-{lot_number}',
+                location=location,
+                expiry_date=datetime.date.today() + datetime.timedelta(days=days),
+                purchase_price=Decimal('1.00'),
+                initial_quantity=Decimal('10.00'),
+                current_quantity=Decimal('10.00')
+            )
+        reagents.append(reagent)
+    return reagents, requester
+
+
+def requisition(reagent, requester, quantity, status='Pendente'):
+    return Requisition.objects.create(requester=requester, reagent=reagent, quantity=Decimal(quantity), status=status)
+
+
+@pytest.mark.django_db
+class TestBulkRequisitionAction:
+    """Testes para a aprovação/rejeição de requisições em lote"""
+
+    def test_approves_with_fefo_across_requisitions(self, bulk_stock, django_capture_on_commit_callbacks):
+        """As requisições consomem os lotes em ordem FEFO, compartilhando o estoque em memória"""
+        (reagent_a, reagent_b), requester = bulk_stock
+        approver = User.objects.create_user(username='gestor', password='testpass')
+        first = requisition(reagent_a, requester, '6.00')
+        second = requisition(reagent_a, requester, '6.00')
+        third = requisition(reagent_b, requester, '3.00')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            results = bulk_process_requisitions([first.pk, second.pk, third.pk], 'approve', approver)
+
+        assert [result['success'] for result in results] == [True, True, True]
+        lots = dict(StockLot.objects.values_list('lot_number', 'current_quantity'))
+        assert lots == {
+            'LOTE-A-VELHO': Decimal('0.00'), 'LOTE-A-NOVO': Decimal('8.00'),
+            'LOTE-B-VELHO': Decimal('7.00'), 'LOTE-B-NOVO': Decimal('10.00'),
+        }
+        assert StockMovement.objects.filter(move_type='Retirada').count() == 4
+        assert ReagentStockSummary.objects.get(reagent=reagent_a).total_quantity == Decimal('8.00')
+        first.refresh_from_db()
+        assert first.status == 'Aprovada'
+        assert first.approver == approver
+        assert AuditLog.objects.filter(action=AuditLog.BULK_REQUISITION_ACTION).count() == 1
+
+    def test_reports_failures_per_item(self, bulk_stock):
+        """Falta de estoque, status inválido e ids inexistentes não impedem os demais itens"""
+        (reagent_a, reagent_b), requester = bulk_stock
+        approver = User.objects.create_user(username='gestor', password='testpass')
+        fits = requisition(reagent_a, requester, '15.00')
+        too_big = requisition(reagent_a, requester, '10.00')
+        done = requisition(reagent_b, requester, '1.00', status='Aprovada')
+
+        results = bulk_process_requisitions([fits.pk, too_big.pk, done.pk, 999999], 'approve', approver)
+
+        assert [result['success'] for result in results] == [True, False, False, False]
+        assert 'Not enough stock' in results[1]['detail']
+        assert results[1]['status'] == 'Pendente'
+        assert 'Pendente' in results[2]['detail']
+        assert results[3]['detail'] == 'Not found.'
+        too_big.refresh_from_db()
+        assert too_big.status == 'Pendente'
+        assert StockLot.objects.get(lot_number='LOTE-A-NOVO').current_quantity == Decimal('5.00')
+
+    def test_reject_does_not_touch_stock(self, bulk_stock):
+        """Rejeitar em lote apenas muda o status"""
+        (reagent_a, reagent_b), requester = bulk_stock
+        approver = User.objects.create_user(username='gestor', password='testpass')
+        pending = [requisition(reagent_a, requester, '1.00') for _ in range(3)]
+
+        results = bulk_process_requisitions([r.pk for r in pending], 'reject', approver)
+
+        assert all(result['status'] == 'Rejeitada' for result in results)
+        assert not StockMovement.objects.exists()
+
+    def test_query_count_does_not_grow_with_batch(self, bulk_stock):
+        """O número de consultas não cresce com o número de requisições"""
+        (reagent_a, reagent_b), requester = bulk_stock
+        approver = User.objects.create_user(username='gestor', password='testpass')
+
+        def approve(count):
+            ids = [requisition(reagent, requester, '0.50').pk for _ in range(count) for reagent in (reagent_a, reagent_b)]
+            with CaptureQueriesContext(connection) as context:
+                bulk_process_requisitions(ids, 'approve', approver)
+            return len(context.captured_queries)
+
+        assert approve(2) == approve(8)
+
+    def test_endpoint(self, authenticated_client, bulk_stock):
+        """O endpoint devolve o resultado de cada item e os totais"""
+        client, user = authenticated_client
+        (reagent_a, reagent_b), requester = bulk_stock
+        ok = requisition(reagent_a, requester, '2.00')
+        too_big = requisition(reagent_b, requester, '50.00')
+
+        response = client.post(URL, {'ids': [ok.pk, too_big.pk], 'action': 'approve'}, format='json')
+
+        assert response.status_code == 200
+        assert response.data['succeeded'] == 1
+        assert response.data['failed'] == 1
+        assert [result['id'] for result in response.data['results']] == [ok.pk, too_big.pk]
+
+    def test_endpoint_validation(self, authenticated_client, bulk_stock):
+        """Listas vazias, ids inválidos e ações desconhecidas são rejeitados"""
+        client, user = authenticated_client
+
+        assert client.post(URL, {'ids': [], 'action': 'approve'}, format='json').status_code == 400
+        assert client.post(URL, {'ids': 'abc', 'action': 'approve'}, format='json').status_code == 400
+        assert client.post(URL, {'ids': ['x'], 'action': 'approve'}, format='json').status_code == 400
+        assert client.post(URL, {'ids': [1], 'action': 'archive'}, format='json').status_code == 400
@@ -0,0 +1,184 @@
+import datetime
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from freezegun import freeze_time
+
+from inventory import tasks
+from inventory.models import (
+    Category, Supplier, Location, Reagent, StockLot, StockMovement, DailyMovementRollup, User
+)
+from inventory.services import (
+    perform_withdrawal, get_consumption_by_user_report, get_waste_loss_report,
+    consumption_by_user_queryset, waste_loss_queryset,
+)
+
+
+@pytest.fixture
+def rollup_data():
+    category = Category.objects.create(name='Rollup')
+    supplier = Supplier.objects.create(name='Fornecedor Rollup')
+    reagent = Reagent.objects.create(
+        name='Etanol', sku='ETA-ROLL-001', category=category, supplier=supplier, min_stock_level=Decimal('1.00')
+    )
+    location = Location.objects.create(name='Armário Rollup')
+    lot = StockLot.objects.create(
+        reagent=reagent, lot_number='R1', location=location, expiry_date=datetime.date(2027, 1, 1),
+        purchase_price=Decimal('2.00'), initial_quantity=Decimal('100.00'), current_quantity=Decimal('100.00')
+    )
+    user = User.objects.create_user(username='rollup', password='testpass')
+    return reagent, location, lot, user
+
+
+def move(lot, user, quantity, move_type='Retirada', day='2025-08-10'):
+    with freeze_time(f'{day} 14:00:00'):
+        return StockMovement.objects.create(stock_lot=lot, user=user, quantity=Decimal(quantity), move_type=move_type)
+
+
+def rollup_rows():
+    return {
+        (row.date, row.move_type): (row.quantity, row.value, row.movement_count, row.negative_quantity, row.negative_count)
+        for row in DailyMovementRollup.objects.all()
+    }
+
+
+@pytest.mark.django_db
+class TestRollupMaintenance:
+    """Testes para a manutenção incremental dos totais diários"""
+
+    def test_movements_add_up_per_day_and_type(self, rollup_data):
+        """Movimentações do mesmo dia e tipo somam quantidade, valor e contagem"""
+        reagent, location, lot, user = rollup_data
+        move(lot, user, '3.00')
+        move(lot, user, '2.00')
+        move(lot, user, '-4.00', move_type='Ajuste')
+        move(lot, user, '1.50', move_type='Ajuste')
+        move(lot, user, '7.00', day='2025-08-11')
+
+        rows = rollup_rows()
+        assert rows[(datetime.date(2025, 8, 10), 'Retirada')] == (Decimal('5.00'), Decimal('10.0000'), 2, Decimal('0'), 0)
+        assert rows[(datetime.date(2025, 8, 10), 'Ajuste')] == (
+            Decimal('-2.50'), Decimal('-5.0000'), 2, Decimal('-4.00'), 1
+        )
+        assert rows[(datetime.date(2025, 8, 11), 'Retirada')][:3] == (Decimal('7.00'), Decimal('14.0000'), 1)
+        row = DailyMovementRollup.objects.get(date=datetime.date(2025, 8, 11))
+        assert (row.reagent_id, row.user_id, row.location_id) == (reagent.pk, user.pk, location.pk)
+
+    def test_edit_and_delete_move_the_totals(self, rollup_data):
+        """Editar move a quantidade entre linhas; excluir a última movimentação remove a linha"""
+        reagent, location, lot, user = rollup_data
+        movement = move(lot, user, '3.00')
+        move(lot, user, '2.00')
+
+        movement.quantity = Decimal('5.00')
+        movement.move_type = 'Descarte'
+        movement.save()
+        rows = rollup_rows()
+        assert rows[(datetime.date(2025, 8, 10), 'Retirada')][:3] == (Decimal('2.00'), Decimal('4.0000'), 1)
+        assert rows[(datetime.date(2025, 8, 10), 'Descarte')][:3] == (Decimal('5.00'), Decimal('10.0000'), 1)
+
+        movement.delete()
+        assert set(rollup_rows()) == {(datetime.date(2025, 8, 10), 'Retirada')}
+
+    def test_lot_changes_carry_the_totals(self, rollup_data):
+        """Mudar o lote de local ou de preço leva os totais junto"""
+        reagent, location, lot, user = rollup_data
+        move(lot, user, '3.00')
+        other_location = Location.objects.create(name='Geladeira Rollup')
+
+        lot.location = other_location
+        lot.purchase_price = Decimal('5.00')
+        lot.save()
+
+        row = DailyMovementRollup.objects.get()
+        assert row.location_id == other_location.pk
+        assert (row.quantity, row.value, row.movement_count) == (Decimal('3.00'), Decimal('15.0000'), 1)
+
+    def test_withdrawal_updates_rollup(self, rollup_data):
+        """A retirada em lote (sem sinais) também atualiza os totais"""
+        reagent, location, lot, user = rollup_data
+        perform_withdrawal(reagent, Decimal('6.00'), user)
+
+        row = DailyMovementRollup.objects.get()
+        assert row.date == timezone.localdate()
+        assert (row.move_type, row.quantity, row.value, row.movement_count) == ('Retirada', Decimal('6.00'), Decimal('12.0000'), 1)
+
+    def test_rebuild_repairs_drift(self, rollup_data):
+        """A reconstrução recalcula os dias a partir das movimentações"""
+        reagent, location, lot, user = rollup_data
+        move(lot, user, '3.00')
+        move(lot, user, '-1.00', move_type='Ajuste', day='2025-08-12')
+        expected = rollup_rows()
+
+        DailyMovementRollup.objects.filter(move_type='Retirada').update(quantity=Decimal('99.00'))
+        DailyMovementRollup.objects.filter(move_type='Ajuste').delete()
+        assert DailyMovementRollup.rebuild(start=datetime.date(2025, 8, 11)) == 1
+        assert rollup_rows()[(datetime.date(2025, 8, 10), 'Retirada')][0] == Decimal('99.00')
+
+        out = StringIO()
+        call_command('rebuild_movement_rollups', stdout=out)
+        assert 'Movement rollups rebuilt (2 rows)' in out.getvalue()
+        assert rollup_rows() == expected
+
+    def test_nightly_task_rebuilds_recent_days(self, rollup_data, settings):
+        """A tarefa noturna só reconstrói a janela configurada"""
+        reagent, location, lot, user = rollup_data
+        settings.MOVEMENT_ROLLUP_REBUILD_DAYS = 2
+        move(lot, user, '3.00', day='2025-08-09')
+        move(lot, user, '4.00', day='2025-08-10')
+        DailyMovementRollup.objects.update(quantity=Decimal('0.00'))
+
+        with freeze_time('2025-08-10 23:00:00'):
+            assert tasks.rebuild_movement_rollups() == 2
+
+        settings.MOVEMENT_ROLLUP_REBUILD_DAYS = 1
+        DailyMovementRollup.objects.update(quantity=Decimal('0.00'))
+        with freeze_time('2025-08-10 23:00:00'):
+            assert tasks.rebuild_movement_rollups() == 1
+        assert rollup_rows()[(datetime.date(2025, 8, 9), 'Retirada')][0] == Decimal('0.00')
+        assert rollup_rows()[(datetime.date(2025, 8, 10), 'Retirada')][0] == Decimal('4.00')
+
+
+@pytest.mark.django_db
+class TestReportsFromRollup:
+    """Testes para os relatórios lidos dos totais diários"""
+
+    def raw_bounds(self, start, end):
+        # Datetimes are not whole days, so the reports read the movements.
+        return timezone.make_aware(datetime.datetime.combine(start, datetime.time.min)), \
+            timezone.make_aware(datetime.datetime.combine(end, datetime.time.min))
+
+    def test_reports_match_the_movements(self, rollup_data):
+        """Para dias inteiros os relatórios leem os totais e dão o mesmo resultado"""
+        reagent, location, lot, user = rollup_data
+        move(lot, user, '3.00', day='2025-08-01')
+        move(lot, user, '2.00', day='2025-08-15')
+        move(lot, user, '9.00', day='2025-08-31')
+        move(lot, user, '-4.00', move_type='Ajuste')
+        move(lot, user, '6.00', move_type='Ajuste')
+        move(lot, user, '1.00', move_type='Descarte')
+        start, end = datetime.date(2025, 8, 1), datetime.date(2025, 8, 31)
+
+        assert consumption_by_user_queryset(start, end).model is DailyMovementRollup
+        assert waste_loss_queryset(start, end).model is DailyMovementRollup
+        consumption = get_consumption_by_user_report(start, end)
+        waste = get_waste_loss_report(start, end)
+        assert consumption == get_consumption_by_user_report(*self.raw_bounds(start, end))
+        assert waste == get_waste_loss_report(*self.raw_bounds(start, end))
+        assert consumption == [{'user__username': 'rollup', 'stock_lot__reagent__name': 'Etanol', 'total_quantity': Decimal('5.00')}]
+        assert [(row['move_type'], row['total_quantity']) for row in waste] == [
+            ('Ajuste', Decimal('-4.00')), ('Descarte', Decimal('1.00'))
+        ]
+
+    def test_movement_at_end_midnight_reads_the_movements(self, rollup_data):
+        """Uma movimentação exatamente à meia-noite do último dia mantém a leitura das movimentações"""
+        reagent, location, lot, user = rollup_data
+        with freeze_time('2025-08-31 00:00:00'):
+            StockMovement.objects.create(stock_lot=lot, user=user, quantity=Decimal('2.00'), move_type='Retirada')
+        start, end = datetime.date(2025, 8, 1), datetime.date(2025, 8, 31)
+
+        assert consumption_by_user_queryset(start, end).model is StockMovement
+        assert get_consumption_by_user_report(start, end)[0]['total_quantity'] == Decimal('2.00')
@@ -0,0 +1,150 @@
+import pytest
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from inventory.models import (
+    Category, Supplier, Location, Reagent, StockLot, StockMovement, ReagentStockSummary, User
+)
+from inventory.serializers import StockMovementSerializer
+from inventory.services import perform_withdrawal
+import datetime
+
+
+@pytest.fixture
+def summary_reagent():
+    category = Category.objects.create(name='Resumo')
+    supplier = Supplier.objects.create(name='Fornecedor Resumo')
+    return Reagent.objects.create(
+        name='Acetona',
+        sku='ACET-SUM-001',
+        category=category,
+        supplier=supplier,
+        min_stock_level=Decimal('50.00')
+    )
+
+
+@pytest.fixture
+def summary_location():
+    return Location.objects.create(name='Armário Resumo')
+
+
+def create_lot(reagent, location, lot_number, quantity, price, days):
+    return StockLot.objects.create(
+        reagent=reagent,
+        lot_number=lot_number,
+        location=location,
+        expiry_date=datetime.date.today() + datetime.timedelta(days=days),
+        purchase_price=Decimal(price),
+        initial_quantity=Decimal(quantity),
+        current_quantity=Decimal(quantity)
+    )
+
+
+@pytest.mark.django_db
+class TestReagentStockSummary:
+    """Testes para os totais de estoque por reagente"""
+
+    def test_summary_follows_lot_creation(self, summary_reagent, summary_location):
+        """Criar lotes atualiza quantidade, valor, validade mais próxima e contagem"""
+        create_lot(summary_reagent, summary_location, 'A', '10.00', '2.00', 30)
+        create_lot(summary_reagent, summary_location, 'B', '20.00', '3.00', 10)
+
+        summary = ReagentStockSummary.objects.get(reagent=summary_reagent)
+        assert summary.total_quantity == Decimal('30.00')
+        assert summary.total_value == Decimal('80.00')
+        assert summary.earliest_expiry == datetime.date.today() + datetime.timedelta(days=10)
+        assert summary.lot_count == 2
+
+    def test_summary_follows_withdrawal(self, summary_reagent, summary_location):
+        """A retirada FEFO atualiza o resumo na mesma transação"""
+        user = User.objects.create_user(username='resumo', password='testpass')
+        create_lot(summary_reagent, summary_location, 'A', '10.00', '2.00', 10)
+        create_lot(summary_reagent, summary_location, 'B', '20.00', '3.00', 30)
+
+        perform_withdrawal(summary_reagent, 15, user)
+
+        summary = ReagentStockSummary.objects.get(reagent=summary_reagent)
+        assert summary.total_quantity == Decimal('15.00')
+        assert summary.total_value == Decimal('45.00')
+        assert summary.earliest_expiry == datetime.date.today() + datetime.timedelta(days=30)
+        assert summary.lot_count == 1
+
+    def test_summary_follows_movement_serializer(self, summary_reagent, summary_location):
+        """Descartes registrados pelo serializer atualizam o resumo"""
+        user = User.objects.create_user(username='resumo', password='testpass')
+        lot = create_lot(summary_reagent, summary_location, 'A', '10.00', '2.00', 10)
+
+        serializer = StockMovementSerializer(data={
+            'stock_lot': lot.id, 'user': user.id, 'quantity': '4.00', 'move_type': 'Descarte'
+        })
+        assert serializer.is_valid(), serializer.errors
+        serializer.save()
+
+        assert ReagentStockSummary.objects.get(reagent=summary_reagent).total_quantity == Decimal('6.00')
+
+    def test_summary_follows_lot_edit_and_delete(self, summary_reagent, summary_location):
+        """Edições de preço e exclusão de lotes refletem no resumo"""
+        lot = create_lot(summary_reagent, summary_location, 'A', '10.00', '2.00', 10)
+        create_lot(summary_reagent, summary_location, 'B', '5.00', '1.00', 20)
+
+        lot.purchase_price = Decimal('4.00')
+        lot.save()
+        assert ReagentStockSummary.objects.get(reagent=summary_reagent).total_value == Decimal('45.00')
+
+        lot.delete()
+        summary = ReagentStockSummary.objects.get(reagent=summary_reagent)
+        assert summary.total_quantity == Decimal('5.00')
+        assert summary.lot_count == 1
+
+    def test_moving_lot_to_another_reagent(self, summary_reagent, summary_location):
+        """Trocar o reagente de um lote atualiza os dois resumos"""
+        other = Reagent.objects.create(
+            name='Metanol', sku='METH-SUM-001', category=summary_reagent.category,
+            supplier=summary_reagent.supplier, min_stock_level=Decimal('1.00')
+        )
+        lot = create_lot(summary_reagent, summary_location, 'A', '10.00', '2.00', 10)
+        lot = StockLot.objects.get(pk=lot.pk)
+
+        lot.reagent = other
+        lot.save()
+
+        assert ReagentStockSummary.objects.get(reagent=summary_reagent).total_quantity == 0
+        assert ReagentStockSummary.objects.get(reagent=other).total_quantity == Decimal('10.00')
+
+    def test_deleting_reagent_cascades(self, summary_reagent, summary_location):
+        """Excluir o reagente remove lotes e resumo sem recriar o resumo"""
+        create_lot(summary_reagent, summary_location, 'A', '10.00', '2.00', 10)
+
+        summary_reagent.delete()
+
+        assert not ReagentStockSummary.objects.exists()
+
+    def test_reconcile_command_fixes_drift(self, summary_reagent, summary_location):
+        """O comando de reconciliação reconstrói resumos divergentes ou ausentes"""
+        create_lot(summary_reagent, summary_location, 'A', '10.00', '2.00', 10)
+        ReagentStockSummary.objects.filter(reagent=summary_reagent).update(total_quantity=999, lot_count=7)
+        StockLot.objects.filter(reagent=summary_reagent).update(current_quantity=Decimal('8.00'))
+
+        stdout = StringIO()
+        call_command('reconcile_stock_summaries', stdout=stdout)
+
+        summary = ReagentStockSummary.objects.get(reagent=summary_reagent)
+        assert summary.total_quantity == Decimal('8.00')
+        assert summary.total_value == Decimal('16.00')
+        assert summary.lot_count == 1
+        assert '1 rows' in stdout.getvalue()
+        assert ReagentStockSummary.rebuild() == 0
+
+    def test_dashboard_low_stock_uses_summary(self, authenticated_client, summary_reagent, summary_location):
+        """O dashboard lista como estoque baixo reagentes abaixo do mínimo ou sem lotes"""
+        client, user = authenticated_client
+        create_lot(summary_reagent, summary_location, 'A', '10.00', '2.00', 200)
+        Reagent.objects.create(
+            name='Sem Lotes', sku='NOLOT-001', category=summary_reagent.category,
+            supplier=summary_reagent.supplier, min_stock_level=Decimal('1.00')
+        )
+
+        response = client.get('/api/v1/dashboard/summary/')
+
+        low_stock = {item['sku']: item['current_stock'] for item in response.data['low_stock_items']}
+        assert low_stock == {'ACET-SUM-001': Decimal('10.00'), 'NOLOT-001': 0}
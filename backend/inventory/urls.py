@@ -1,18 +1,20 @@
 from django.urls import path
 from .views import (
     ObtainAuthToken, Logout,
-    ReagentListCreateView, ReagentRetrieveUpdateDestroyView,
-    StockLotListCreateView, StockLotRetrieveUpdateDestroyView, StockMovementListCreateView,
-    RequisitionListCreateView, RequisitionApproveRejectView,
+    ReagentListCreateView, ReagentRetrieveUpdateDestroyView, ReagentFefoPlanView,
+    StockLotListCreateView, StockLotRetrieveUpdateDestroyView, StockLotQrCodeView, StockLotLabelSheetView, StockMovementListCreateView,
+    RequisitionListCreateView, RequisitionApproveRejectView, RequisitionBulkActionView,
     CategoryListCreateView, CategoryRetrieveUpdateDestroyView,
     SupplierListCreateView, SupplierRetrieveUpdateDestroyView,
     LocationListCreateView, LocationRetrieveUpdateDestroyView,
     AttachmentListCreateView, AttachmentRetrieveUpdateDestroyView,
-    AuditLogListCreateView, AuditLogRetrieveUpdateDestroyView,
+    AuditLogListCreateView, AuditLogRetrieveUpdateDestroyView, AuditLogArchiveView,
     UserListCreateView, UserRetrieveUpdateDestroyView,
-    DashboardSummaryView, FinancialReportView,
+    NotificationListView, NotificationMarkReadView, NotificationUnreadCountView,
+    DashboardSummaryView, ConsumptionAnalyticsView, FinancialReportView,
     ReagentListView, ReagentDetailView, RequisitionListView, DashboardView, StockLotCreateView, StockMovementWithdrawView,
-    ConsumptionByUserReportView, WasteLossReportView, StockValueReportView, ExpiryReportView
+    ConsumptionByUserReportView, WasteLossReportView, StockValueReportView, ExpiryReportView,
+    ReportJobCreateView, ReportJobDetailView, ReportJobDownloadView,
 )
 
 urlpatterns = [
@@ -20,13 +22,18 @@ urlpatterns = [
     path('logout/', Logout.as_view(), name='api_logout'),
     path('reagents/', ReagentListCreateView.as_view(), name='reagent-list-create'),
     path('reagents/<int:pk>/', ReagentRetrieveUpdateDestroyView.as_view(), name='reagent-detail'),
+    path('reagents/<int:pk>/fefo-plan/', ReagentFefoPlanView.as_view(), name='reagent-fefo-plan'),
 
     path('stock-lots/', StockLotListCreateView.as_view(), name='stocklot-list-create'),
     path('stock-lots/<int:pk>/', StockLotRetrieveUpdateDestroyView.as_view(), name='stocklot-detail'),
+    path('stock-lots/<int:pk>/qr.png', StockLotQrCodeView.as_view(), {'fmt': 'png'}, name='stocklot-qr-png'),
+    path('stock-lots/<int:pk>/qr.svg', StockLotQrCodeView.as_view(), {'fmt': 'svg'}, name='stocklot-qr-svg'),
+    path('stock-lots/labels/', StockLotLabelSheetView.as_view(), name='stocklot-labels'),
     path('stock-movements/', StockMovementListCreateView.as_view(), name='stockmovement-list-create'),
 
     path('requisitions/', RequisitionListCreateView.as_view(), name='requisition-list-create'),
     path('requisitions/<int:pk>/action/', RequisitionApproveRejectView.as_view(), name='requisition-action'),
+    path('requisitions/bulk-action/', RequisitionBulkActionView.as_view(), name='requisition-bulk-action'),
 
     path('categories/', CategoryListCreateView.as_view(), name='category-list-create'),
     path('categories/<int:pk>/', CategoryRetrieveUpdateDestroyView.as_view(), name='category-detail'),
@@ -42,12 +49,18 @@ urlpatterns = [
 
     path('audit-logs/', AuditLogListCreateView.as_view(), name='auditlog-list-create'),
     path('audit-logs/<int:pk>/', AuditLogRetrieveUpdateDestroyView.as_view(), name='auditlog-detail'),
+    path('audit-logs/archive/', AuditLogArchiveView.as_view(), name='auditlog-archive'),
 
     path('users/', UserListCreateView.as_view(), name='user-list-create'),
     path('users/<int:pk>/', UserRetrieveUpdateDestroyView.as_view(), name='user-detail'),
 
+    path('notifications/', NotificationListView.as_view(), name='notification-list'),
+    path('notifications/mark-read/', NotificationMarkReadView.as_view(), name='notification-mark-read'),
+    path('notifications/unread-count/', NotificationUnreadCountView.as_view(), name='notification-unread-count'),
+
     path('dashboard/summary/', DashboardSummaryView.as_view(), name='dashboard-summary'),
     path('reports/financial/', FinancialReportView.as_view(), name='financial-report'),
+    path('analytics/consumption/', ConsumptionAnalyticsView.as_view(), name='consumption-analytics'),
 
     # Frontend URLs
     path('reagents/list/', ReagentListView.as_view(), name='reagent-list'),
@@ -62,4 +75,7 @@ urlpatterns = [
     path('reports/waste-loss/', WasteLossReportView.as_view(), name='waste-loss-report'),
     path('reports/stock-value/', StockValueReportView.as_view(), name='stock-value-report'),
     path('reports/expiry/', ExpiryReportView.as_view(), name='expiry-report'),
+    path('reports/jobs/', ReportJobCreateView.as_view(), name='report-job-create'),
+    path('reports/jobs/<str:job_id>/', ReportJobDetailView.as_view(), name='report-job-detail'),
+    path('reports/jobs/<str:job_id>/download/', ReportJobDownloadView.as_view(), name='report-job-download'),
 ]
\ No newline at end of file
@@ -1,9 +1,18 @@
 import json
 from datetime import date, datetime
 from decimal import Decimal
+from functools import lru_cache
+import hashlib
 import qrcode
+import qrcode.image.svg
 from io import BytesIO
 import base64
+from django.core.cache import cache
+from django.db import transaction
+
+# Bump when the rendering parameters below change, so cached images are not reused.
+QR_CODE_RENDER_VERSION = 1
+QR_CODE_LRU_SIZE = 4096
 
 class CustomJsonEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -13,7 +22,7 @@ class CustomJsonEncoder(json.JSONEncoder):
             return str(obj)
         return super().default(obj)
 
-def generate_qr_code_image(data: str):
+def _make_qr_code(data: str) -> qrcode.QRCode:
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -22,14 +31,116 @@ def generate_qr_code_image(data: str):
     )
     qr.add_data(data)
     qr.make(fit=True)
+    return qr
+
+def render_qr_code_png(data: str) -> bytes:
+    """
+    Renders the QR code for `data` as raw PNG bytes.
+    """
+    img = _make_qr_code(data).make_image(fill_color="black", back_color="white")
 
-    img = qr.make_image(fill_color="black", back_color="white")
-    
     # Save to BytesIO object
     buffer = BytesIO()
     img.save(buffer, format="PNG")
-    buffer.seek(0)
-    
-    # Encode to base64
-    image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    return f"data:image/png;base64,{image_base64}"
\ No newline at end of file
+    return buffer.getvalue()
+
+def render_qr_code_svg(data: str) -> bytes:
+    """
+    Renders the QR code for `data` as an SVG document (no Pillow involved).
+    """
+    img = _make_qr_code(data).make_image(image_factory=qrcode.image.svg.SvgPathImage)
+
+    buffer = BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+def qr_code_data_uri(png: bytes) -> str:
+    image_base64 = base64.b64encode(png).decode('utf-8')
+    return f"data:image/png;base64,{image_base64}"
+
+def generate_qr_code_image(data: str):
+    return qr_code_data_uri(render_qr_code_png(data))
+
+def qr_code_digest(data: str) -> str:
+    """
+    Content digest of a QR payload; identical payloads share one rendered image.
+    """
+    return hashlib.sha256(f'{QR_CODE_RENDER_VERSION}:{data}'.encode('utf-8')).hexdigest()
+
+def qr_code_cache_key(data: str, fmt: str = 'png') -> str:
+    return f'qr_code:{fmt}:{qr_code_digest(data)}'
+
+def _get_or_render_qr_code(data: str, fmt: str, render) -> bytes:
+    key = qr_code_cache_key(data, fmt)
+    image = cache.get(key)
+    if image is None:
+        image = render(data)
+        # The image is a pure function of the payload, so it never goes stale.
+        cache.set(key, image, timeout=None)
+    return image
+
+@lru_cache(maxsize=QR_CODE_LRU_SIZE)
+def get_qr_code_png(data: str) -> bytes:
+    """
+    Returns the PNG bytes for `data`, looking in the in-process LRU first, then
+    the Django cache backend, and only rendering on a miss in both.
+    """
+    return _get_or_render_qr_code(data, 'png', render_qr_code_png)
+
+@lru_cache(maxsize=QR_CODE_LRU_SIZE)
+def get_qr_code_svg(data: str) -> bytes:
+    """
+    SVG counterpart of `get_qr_code_png`.
+    """
+    return _get_or_render_qr_code(data, 'svg', render_qr_code_svg)
+
+def get_qr_code_image(data: str) -> str:
+    """
+    Cached counterpart of `generate_qr_code_image`.
+    """
+    return qr_code_data_uri(get_qr_code_png(data))
+
+
+class CommitBatch:
+    """
+    Items collected during one transaction and handed to `handler` in a
+    single call once it commits; dropped if it rolls back. Every `add`
+    registers the batch's flush as a commit hook, so the batch is handled by
+    whichever hook runs first; items added inside a savepoint that is later
+    rolled back are still handled if the outer transaction commits.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.items = []
+        self.flushed = False
+
+    def is_pending(self, connection):
+        # Neither flushed nor discarded from the connection by a rollback.
+        # Scanned from the end: the latest hook is normally this batch's own.
+        return not self.flushed and any(
+            callback == self.flush for sids, callback, robust in reversed(connection.run_on_commit)
+        )
+
+    def flush(self):
+        self.flushed = True
+        items, self.items = self.items, []
+        if items:
+            self.handler(items)
+
+    @classmethod
+    def add(cls, name, handler, items, using=None):
+        """
+        Adds `items` to the connection's pending batch called `name`, or
+        hands them to `handler` right away outside a transaction.
+        """
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            handler(list(items))
+            return
+        batch = getattr(connection, name, None)
+        if batch is None or not batch.is_pending(connection):
+            batch = cls(handler)
+            setattr(connection, name, batch)
+        batch.items.extend(items)
+        transaction.on_commit(batch.flush, using=using)
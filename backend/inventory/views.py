@@ -1,20 +1,29 @@
 from django.utils import timezone
 from django.utils import timezone
 import datetime
+import json
+from decimal import Decimal
 from rest_framework import generics, status, viewsets
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.views.generic import TemplateView, DetailView
-from django.db.models import Sum, F, Q
-from django.db.models.functions import TruncMonth
-from decimal import Decimal
+from django.http import HttpResponse, Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 
-from .models import Reagent, StockLot, StockMovement, Requisition, Category, Supplier, Location, Attachment, AuditLog, User
-from .serializers import ReagentSerializer, StockLotSerializer, StockMovementSerializer, StockWithdrawalSerializer, RequisitionSerializer, CategorySerializer, SupplierSerializer, LocationSerializer, AttachmentSerializer, AuditLogSerializer, UserSerializer
-from .services import approve_requisition, calculate_total_stock_value
+from .models import Reagent, StockLot, StockMovement, Requisition, Category, Supplier, Location, Attachment, AuditLog, User, Notification
+from .serializers import ReagentSerializer, StockLotSerializer, StockMovementSerializer, StockWithdrawalSerializer, RequisitionSerializer, CategorySerializer, SupplierSerializer, LocationSerializer, AttachmentSerializer, AuditLogSerializer, UserSerializer, NotificationSerializer
+from .services import approve_requisition, bulk_process_requisitions, get_cached_dashboard_summary
+from .pagination import TimestampCursorPagination, RequestDateCursorPagination, CreatedAtCursorPagination
+from .utils import CustomJsonEncoder, get_qr_code_png, get_qr_code_svg, qr_code_digest
+from .archive import iter_archived_audit_events
+from .alerts import get_unread_count, invalidate_unread_counts
+from .analytics import normalize_consumption_params, get_cached_consumption_analytics
+from .planning import FefoPlanner, DEFAULT_HORIZON_DAYS, MAX_DEMAND_QUANTITY, MAX_HORIZON_DAYS
+from .labels import get_lots_for_labels, iter_label_sheet_pages, iter_label_sheet_pdf, render_label_sheet_png, count_label_sheet_pages
 
 
 # Frontend Views
@@ -85,23 +94,163 @@ class Logout(APIView):
 
 
 class ReagentListCreateView(generics.ListCreateAPIView):
-    queryset = Reagent.objects.all()
+    queryset = Reagent.objects.order_by('id')
     serializer_class = ReagentSerializer
 
 class ReagentRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Reagent.objects.all()
     serializer_class = ReagentSerializer
 
+class ReagentFefoPlanView(APIView):
+    """
+    What-if FEFO simulation for one reagent: pending requisitions plus the
+    demands given (GET `quantity`/`needed_by`, or POST a `demands` list) are
+    allocated against the current lots. Reports shortfalls and the lots that
+    would expire unused.
+    """
+    def get(self, request, pk, format=None):
+        demands = []
+        if request.query_params.get('quantity'):
+            demands.append({
+                'quantity': request.query_params['quantity'],
+                'needed_by': request.query_params.get('needed_by'),
+            })
+        return self.plan(pk, demands, request.query_params)
+
+    def post(self, request, pk, format=None):
+        demands = request.data.get('demands') or []
+        if not isinstance(demands, list):
+            return Response({'detail': 'demands must be a list.'}, status=status.HTTP_400_BAD_REQUEST)
+        return self.plan(pk, demands, request.data)
+
+    def plan(self, pk, demands, options):
+        try:
+            demands = [
+                {
+                    'id': demand.get('id'),
+                    # Raises InvalidOperation for infinities and for more digits than Decimal can hold.
+                    'quantity': Decimal(str(demand['quantity'])).quantize(Decimal('0.01')),
+                    'needed_by': datetime.date.fromisoformat(demand['needed_by']) if demand.get('needed_by') else None,
+                }
+                for demand in demands
+            ]
+            horizon_days = int(options.get('horizon_days', DEFAULT_HORIZON_DAYS))
+            if not 0 <= horizon_days <= MAX_HORIZON_DAYS:
+                raise ValueError(horizon_days)
+            for demand in demands:
+                if demand['needed_by']:
+                    # The horizon end must still be a valid date (OverflowError otherwise).
+                    demand['needed_by'] + datetime.timedelta(days=horizon_days)
+        except (KeyError, TypeError, ValueError, ArithmeticError, AttributeError):
+            return Response({'detail': 'Invalid demand, date or horizon.'}, status=status.HTTP_400_BAD_REQUEST)
+        if any(
+            not demand['quantity'].is_finite() or not 0 < demand['quantity'] <= MAX_DEMAND_QUANTITY
+            for demand in demands
+        ):
+            return Response(
+                {'detail': f'Quantities must be positive and at most {MAX_DEMAND_QUANTITY}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        include_pending = str(options.get('include_pending', 'true')).lower() not in ('false', '0')
+
+        if not Reagent.objects.filter(pk=pk).exists():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        planner = FefoPlanner.for_reagent(pk)
+        return Response(
+            planner.simulate(demands, include_pending=include_pending, horizon_days=horizon_days),
+            status=status.HTTP_200_OK
+        )
+
 class StockLotListCreateView(generics.ListCreateAPIView):
-    queryset = StockLot.objects.all()
+    queryset = StockLot.objects.order_by('id')
     serializer_class = StockLotSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET':
+            includes = self.request.query_params.get('include', '').split(',')
+            kwargs.setdefault('include_qr', 'qr' in includes)
+        return super().get_serializer(*args, **kwargs)
+
 class StockLotRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     queryset = StockLot.objects.all()
     serializer_class = StockLotSerializer
 
+class StockLotQrCodeView(APIView):
+    """
+    Serves a lot's QR code as raw image bytes. The image only depends on the
+    lot's QR payload, so responses carry a strong ETag and may be cached
+    indefinitely, though only privately as the endpoint needs a login.
+    """
+    QR_CODE_FORMATS = {
+        'png': (get_qr_code_png, 'image/png'),
+        'svg': (get_qr_code_svg, 'image/svg+xml'),
+    }
+    CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+    def get(self, request, pk, fmt='png', format=None):
+        try:
+            lot = StockLot.objects.get(pk=pk)
+        except StockLot.DoesNotExist:
+            raise Http404
+        get_image, content_type = self.QR_CODE_FORMATS[fmt]
+        data = lot.qr_code_data
+        etag = f'"{fmt}-{qr_code_digest(data)}"'
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(get_image(data), content_type=content_type)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, max_age=self.CACHE_MAX_AGE, immutable=True)
+        return response
+
+class StockLotLabelSheetView(APIView):
+    """
+    Renders printable labels for a batch of stock lots, selected by `ids`
+    and/or `reagent`/`location`. PDF sheets are streamed page by page; PNG
+    returns a single `page` of the sheet.
+    """
+    def post(self, request, format=None):
+        sheet_format = request.data.get('format', 'pdf')
+        if sheet_format not in ('pdf', 'png'):
+            return Response({'detail': "format must be 'pdf' or 'png'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        ids = request.data.get('ids') or []
+        if not isinstance(ids, list):
+            return Response({'detail': 'ids must be a list of stock lot ids.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(lot_id) for lot_id in ids]
+            page = int(request.data.get('page', 1))
+            lots = list(get_lots_for_labels(
+                ids=ids,
+                reagent_id=request.data.get('reagent'),
+                location_id=request.data.get('location'),
+            ))
+        except (TypeError, ValueError) as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not lots:
+            return Response({'detail': 'No stock lots match the selection.'}, status=status.HTTP_404_NOT_FOUND)
+
+        if sheet_format == 'png':
+            try:
+                png = render_label_sheet_png(lots, page=page)
+            except ValueError as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            response = HttpResponse(png, content_type='image/png')
+            response['X-Label-Sheet-Pages'] = count_label_sheet_pages(len(lots))
+            return response
+
+        response = StreamingHttpResponse(
+            iter_label_sheet_pdf(iter_label_sheet_pages(lots)),
+            content_type='application/pdf',
+        )
+        response['Content-Disposition'] = 'attachment; filename="etiquetas.pdf"'
+        return response
+
 class StockMovementListCreateView(generics.ListCreateAPIView):
     queryset = StockMovement.objects.all()
+    pagination_class = TimestampCursorPagination
 
     def get_serializer_class(self):
         if self.request.method == 'POST' and self.request.data.get('move_type') == 'Retirada':
@@ -119,11 +268,12 @@ class StockMovementListCreateView(generics.ListCreateAPIView):
 class RequisitionListCreateView(generics.ListCreateAPIView):
     queryset = Requisition.objects.all()
     serializer_class = RequisitionSerializer
+    pagination_class = RequestDateCursorPagination
 
 class RequisitionApproveRejectView(APIView):
     def post(self, request, pk, format=None):
         try:
-            requisition = Requisition.objects.get(pk=pk)
+            requisition = Requisition.objects.select_related('reagent').get(pk=pk)
         except Requisition.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -146,9 +296,31 @@ class RequisitionApproveRejectView(APIView):
         else:
             return Response({'detail': 'Invalid action.'}, status=status.HTTP_400_BAD_REQUEST)
 
+class RequisitionBulkActionView(APIView):
+    """
+    Approves or rejects a list of requisitions in a single transaction and
+    reports the outcome of each one.
+    """
+    def post(self, request, format=None):
+        ids = request.data.get('ids')
+        if not isinstance(ids, list):
+            return Response({'detail': 'ids must be a list of requisition ids.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(requisition_id) for requisition_id in ids]
+            results = bulk_process_requisitions(ids, request.data.get('action'), request.user)
+        except (TypeError, ValueError) as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        succeeded = sum(1 for result in results if result['success'])
+        return Response({
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+        }, status=status.HTTP_200_OK)
+
 # CRUD Views for other models
 class CategoryListCreateView(generics.ListCreateAPIView):
-    queryset = Category.objects.all()
+    queryset = Category.objects.order_by('id')
     serializer_class = CategorySerializer
 
 class CategoryRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
@@ -156,7 +328,7 @@ class CategoryRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CategorySerializer
 
 class SupplierListCreateView(generics.ListCreateAPIView):
-    queryset = Supplier.objects.all()
+    queryset = Supplier.objects.order_by('id')
     serializer_class = SupplierSerializer
 
 class SupplierRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
@@ -164,7 +336,7 @@ class SupplierRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = SupplierSerializer
 
 class LocationListCreateView(generics.ListCreateAPIView):
-    queryset = Location.objects.all()
+    queryset = Location.objects.order_by('id')
     serializer_class = LocationSerializer
 
 class LocationRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
@@ -172,83 +344,154 @@ class LocationRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = LocationSerializer
 
 class AttachmentListCreateView(generics.ListCreateAPIView):
-    queryset = Attachment.objects.all()
+    queryset = Attachment.objects.order_by('id')
     serializer_class = AttachmentSerializer
 
 class AttachmentRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Attachment.objects.all()
     serializer_class = AttachmentSerializer
 
+def _audit_choice_code(value, choices, param):
+    codes = {name.lower(): code for code, name in choices}
+    if value.lower() in codes:
+        return codes[value.lower()]
+    if value.isdigit() and int(value) in codes.values():
+        return int(value)
+    raise ValidationError({'error': f"Unknown {param}: {value}."})
+
+def _day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+def parse_audit_log_filters(params):
+    """
+    Reads the audit log query parameters: object_type and action (name or
+    code), object_id, user and a start_date/end_date range (YYYY-MM-DD).
+    Returns (field filters, start, end), with end exclusive.
+    """
+    filters = {}
+    if params.get('object_type'):
+        filters['object_type'] = _audit_choice_code(params['object_type'], AuditLog.OBJECT_TYPE_CHOICES, 'object_type')
+    if params.get('action'):
+        filters['action'] = _audit_choice_code(params['action'], AuditLog.ACTION_CHOICES, 'action')
+    for param, field in (('object_id', 'object_id'), ('user', 'user_id')):
+        if params.get(param):
+            if not params[param].isdigit():
+                raise ValidationError({'error': f"{param} must be an integer."})
+            filters[field] = int(params[param])
+    start = end = None
+    try:
+        if params.get('start_date'):
+            start = _day_start(datetime.datetime.strptime(params['start_date'], '%Y-%m-%d').date())
+        if params.get('end_date'):
+            end_date = datetime.datetime.strptime(params['end_date'], '%Y-%m-%d').date()
+            end = _day_start(end_date + datetime.timedelta(days=1))
+    except ValueError:
+        raise ValidationError({'error': "Date format should be YYYY-MM-DD."})
+    return filters, start, end
+
 class AuditLogListCreateView(generics.ListCreateAPIView):
-    queryset = AuditLog.objects.all()
+    """
+    Audit history, newest first, filtered by parse_audit_log_filters. Each
+    filter has an index on (field, timestamp), and a date range lets
+    PostgreSQL skip the other monthly partitions.
+    """
     serializer_class = AuditLogSerializer
+    pagination_class = TimestampCursorPagination
+
+    def get_queryset(self):
+        filters, start, end = parse_audit_log_filters(self.request.query_params)
+        queryset = AuditLog.objects.filter(**filters)
+        if start:
+            queryset = queryset.filter(timestamp__gte=start)
+        if end:
+            queryset = queryset.filter(timestamp__lt=end)
+        return queryset
+
+class AuditLogArchiveView(APIView):
+    """
+    Read-only access to archived audit history, with the same filters as
+    /audit-logs/. Matching rows are streamed as JSON lines while the archive
+    files of the requested months are scanned, so memory use does not depend
+    on the size of the range.
+    """
+    def get(self, request, format=None):
+        filters, start, end = parse_audit_log_filters(request.query_params)
+        rows = iter_archived_audit_events(start, end, **filters)
+        return StreamingHttpResponse(
+            (json.dumps(row, cls=CustomJsonEncoder) + '\n' for row in rows),
+            content_type='application/x-ndjson',
+        )
 
 class AuditLogRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     queryset = AuditLog.objects.all()
     serializer_class = AuditLogSerializer
 
 class UserListCreateView(generics.ListCreateAPIView):
-    queryset = User.objects.all()
+    queryset = User.objects.order_by('id')
     serializer_class = UserSerializer
 
 class UserRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
+class NotificationListView(generics.ListAPIView):
+    """The current user's notifications, newest first; ?is_read=true|false filters them."""
+    serializer_class = NotificationSerializer
+    pagination_class = CreatedAtCursorPagination
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(user=self.request.user)
+        is_read = self.request.query_params.get('is_read')
+        if is_read in ('true', 'false'):
+            queryset = queryset.filter(is_read=is_read == 'true')
+        elif is_read is not None:
+            raise ValidationError({'error': 'is_read must be true or false.'})
+        return queryset
+
+class NotificationMarkReadView(APIView):
+    """Marks the given notification ids of the current user, or all of them with {"all": true}, as read."""
+    def post(self, request, format=None):
+        queryset = Notification.objects.filter(user=request.user, is_read=False)
+        if request.data.get('all') is not True:
+            ids = request.data.get('ids')
+            if not isinstance(ids, list):
+                return Response({'detail': 'ids must be a list of notification ids.'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                queryset = queryset.filter(pk__in=[int(notification_id) for notification_id in ids])
+            except (TypeError, ValueError):
+                return Response({'detail': 'ids must be a list of notification ids.'}, status=status.HTTP_400_BAD_REQUEST)
+        # A queryset update sends no signals.
+        updated = queryset.update(is_read=True)
+        if updated:
+            invalidate_unread_counts([request.user.pk])
+        return Response({'updated': updated}, status=status.HTTP_200_OK)
+
+class NotificationUnreadCountView(APIView):
+    def get(self, request, format=None):
+        return Response({'unread': get_unread_count(request.user.pk)}, status=status.HTTP_200_OK)
+
 # Dashboard and Reports Views
 class DashboardSummaryView(APIView):
     def get(self, request, format=None):
-        # Total Stock Value
-        total_stock_value = calculate_total_stock_value()
-
-        # Low Stock Items
-        low_stock_items = Reagent.objects.filter(min_stock_level__gt=0).annotate(
-            current_total_stock=Sum('stocklot__current_quantity')
-        ).filter(Q(current_total_stock__lt=F('min_stock_level')) | Q(current_total_stock__isnull=True))
-        low_stock_items_data = [{'name': item.name, 'sku': item.sku, 'current_stock': item.current_total_stock or 0, 'min_stock': item.min_stock_level} for item in low_stock_items]
-
-        # Expiring Soon Items (e.g., next 90 days)
-        ninety_days_from_now = timezone.now().date() + datetime.timedelta(days=90)
-        expiring_soon_items = StockLot.objects.filter(
-            expiry_date__lte=ninety_days_from_now,
-            expiry_date__gte=timezone.now().date(),
-            current_quantity__gt=0
-        ).select_related('reagent')
-        expiring_soon_items_data = [{'reagent': item.reagent.name, 'lot_number': item.lot_number, 'expiry_date': item.expiry_date, 'quantity': item.current_quantity} for item in expiring_soon_items]
-
-        # Consumption Data (last 6 months)
-        today = timezone.now().date()
-        six_months_ago = today - datetime.timedelta(days=180)
-        consumption_data_raw = StockMovement.objects.filter(
-            move_type='Retirada',
-            timestamp__gte=six_months_ago
-        ).annotate(
-            month=TruncMonth('timestamp')
-        ).values('month').annotate(total_quantity=Sum('quantity')).order_by('month')
-
-        consumption_labels = [data['month'].strftime('%Y-%m') for data in consumption_data_raw]
-        consumption_values = [float(data['total_quantity']) for data in consumption_data_raw]
-
-        # Expiry Data (pie chart categories)
-        expired_count = StockLot.objects.filter(expiry_date__lt=timezone.now().date(), current_quantity__gt=0).count()
-        expiring_soon_count = StockLot.objects.filter(
-            expiry_date__gte=timezone.now().date(),
-            expiry_date__lte=ninety_days_from_now,
-            current_quantity__gt=0
-        ).count()
-        valid_count = StockLot.objects.filter(expiry_date__gt=ninety_days_from_now, current_quantity__gt=0).count()
-
-        expiry_labels = ['Vencidos', 'Vencem em 90 dias', 'Válidos']
-        expiry_values = [expired_count, expiring_soon_count, valid_count]
-
-        data = {
-            'total_stock_value': total_stock_value,
-            'low_stock_items': low_stock_items_data,
-            'expiring_soon_items': expiring_soon_items_data,
-            'consumption_data': {'labels': consumption_labels, 'values': consumption_values},
-            'expiry_data': {'labels': expiry_labels, 'values': expiry_values}
-        }
-        return Response(data, status=status.HTTP_200_OK)
+        data, timings, cache_state = get_cached_dashboard_summary()
+        response = Response(data, status=status.HTTP_200_OK)
+        # Section timings are those of the computation that produced `data`.
+        server_timing = [f'{section};dur={duration}' for section, duration in timings.items()]
+        server_timing.append(f'cache;desc={cache_state}')
+        response['Server-Timing'] = ', '.join(server_timing)
+        return response
+
+class ConsumptionAnalyticsView(APIView):
+    """
+    Consumption series per day/week/month/quarter, optionally split by
+    reagent, category, location or user with a top-N ranking.
+    """
+    def get(self, request, format=None):
+        try:
+            params = normalize_consumption_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_cached_consumption_analytics(params), status=status.HTTP_200_OK)
 
 class FinancialReportView(APIView):
     def get(self, request, format=None):
@@ -304,13 +547,13 @@ class StockMovementViewSet(viewsets.ModelViewSet):
         user = request.user  # Assuming user is authenticated
 
         try:
-            with transaction.atomic():
-                total_withdrawn = perform_withdrawal(reagent, quantity, user)
-                # Create a single StockMovement record for the withdrawal
-                # This might need adjustment if you want a movement per lot
-                # For simplicity, we'll assume perform_withdrawal handles individual lot movements
-                # and we just need a summary here if desired.
-                # StockMovement.objects.create(reagent=reagent, user=user, quantity=total_withdrawn, move_type='Retirada', notes=notes)
+            # perform_withdrawal opens (and on lock conflicts retries) its own transaction.
+            total_withdrawn = perform_withdrawal(reagent, quantity, user, notes=notes)
+            # Create a single StockMovement record for the withdrawal
+            # This might need adjustment if you want a movement per lot
+            # For simplicity, we'll assume perform_withdrawal handles individual lot movements
+            # and we just need a summary here if desired.
+            # StockMovement.objects.create(reagent=reagent, user=user, quantity=total_withdrawn, move_type='Retirada', notes=notes)
 
             return Response({'status': 'withdrawal successful', 'total_withdrawn': total_withdrawn}, status=status.HTTP_200_OK)
         except ValueError as e:
@@ -359,14 +602,47 @@ from rest_framework.response import Response
 from rest_framework import status
 import datetime
 import datetime
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
 from .services import (
-    get_consumption_by_user_report,
-    get_waste_loss_report,
+    consumption_by_user_queryset,
+    waste_loss_queryset,
+    stock_value_queryset,
+    expiry_report_queryset,
     get_stock_value_report,
-    get_expiry_report
 )
+from .exports import EXPORT_CHUNK_SIZE, EXPORT_RENDERERS, export_response, queryset_columns
+from .report_jobs import normalize_report_spec, start_report_job, get_report_job, report_file_path
+from celery import states
+from django.http import FileResponse
+from django.urls import reverse
+
+class ReportExportMixin:
+    """
+    Adds ?format=csv|xlsx|jsonl (or the matching Accept header) to a report
+    view. The rows are then streamed from a server-side cursor while they are
+    written, instead of being loaded into a list and rendered as JSON.
+    """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, *EXPORT_RENDERERS]
+    export_filename = 'relatorio'
+
+    def report_response(self, request, queryset):
+        if isinstance(request.accepted_renderer, tuple(EXPORT_RENDERERS)):
+            rows = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+            return export_response(request.accepted_renderer, rows, queryset_columns(queryset), self.export_filename)
+        return Response(list(queryset), status=status.HTTP_200_OK)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if isinstance(response, Response) and isinstance(response.accepted_renderer, tuple(EXPORT_RENDERERS)):
+            # Errors keep their JSON body whatever format was asked for.
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+        return response
+
+class ConsumptionByUserReportView(ReportExportMixin, APIView):
+    export_filename = 'consumo-por-usuario'
 
-class ConsumptionByUserReportView(APIView):
     def get(self, request, *args, **kwargs):
         start_date_str = request.query_params.get('start_date')
         end_date_str = request.query_params.get('end_date')
@@ -382,14 +658,16 @@ class ConsumptionByUserReportView(APIView):
         except ValueError:
             return Response({"error": "Date format should be YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
 
-        report_data = get_consumption_by_user_report(
+        queryset = consumption_by_user_queryset(
             start_date, end_date,
             user_id=user_id,
             reagent_id=reagent_id
         )
-        return Response(report_data, status=status.HTTP_200_OK)
+        return self.report_response(request, queryset)
+
+class WasteLossReportView(ReportExportMixin, APIView):
+    export_filename = 'descartes-e-perdas'
 
-class WasteLossReportView(APIView):
     def get(self, request, *args, **kwargs):
         start_date_str = request.query_params.get('start_date')
         end_date_str = request.query_params.get('end_date')
@@ -404,24 +682,32 @@ class WasteLossReportView(APIView):
         except ValueError:
             return Response({"error": "Date format should be YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
 
-        report_data = get_waste_loss_report(
+        queryset = waste_loss_queryset(
             start_date, end_date,
             reagent_id=reagent_id
         )
-        return Response(report_data, status=status.HTTP_200_OK)
+        return self.report_response(request, queryset)
+
+class StockValueReportView(ReportExportMixin, APIView):
+    export_filename = 'valor-em-estoque'
 
-class StockValueReportView(APIView):
     def get(self, request, *args, **kwargs):
         group_by = request.query_params.get('group_by')
 
         try:
-            report_data = get_stock_value_report(group_by=group_by)
+            if group_by is not None:
+                return self.report_response(request, stock_value_queryset(group_by))
+            report_data = get_stock_value_report()
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-            
+
+        if isinstance(request.accepted_renderer, tuple(EXPORT_RENDERERS)):
+            return export_response(request.accepted_renderer, [report_data], ['total_value'], self.export_filename)
         return Response(report_data, status=status.HTTP_200_OK)
 
-class ExpiryReportView(APIView):
+class ExpiryReportView(ReportExportMixin, APIView):
+    export_filename = 'validade'
+
     def get(self, request, *args, **kwargs):
         days_until_expiry_str = request.query_params.get('days_until_expiry')
         expired_str = request.query_params.get('expired')
@@ -435,8 +721,50 @@ class ExpiryReportView(APIView):
         
         expired = expired_str and expired_str.lower() == 'true'
 
-        report_data = get_expiry_report(
+        queryset = expiry_report_queryset(
             days_until_expiry=days_until_expiry,
             expired=expired
         )
-        return Response(report_data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return self.report_response(request, queryset)
+
+def _report_job_payload(request, job_id, result):
+    payload = {'job_id': job_id, 'status': result.state}
+    if result.state == states.SUCCESS:
+        payload['result'] = {key: value for key, value in result.result.items() if key != 'file'}
+        payload['download_url'] = request.build_absolute_uri(reverse('report-job-download', args=[job_id]))
+    elif result.state in states.PROPAGATE_STATES:
+        payload['error'] = str(result.result)
+    return payload
+
+class ReportJobCreateView(APIView):
+    """
+    Starts a background report job for long ranges, e.g.
+    {"report": "consumption-by-user", "params": {"start_date": ..., "end_date": ...}, "format": "xlsx"},
+    and answers with the job id to poll.
+    """
+    def post(self, request, format=None):
+        try:
+            spec = normalize_report_spec(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        job_id, reused = start_report_job(spec)
+        payload = _report_job_payload(request, job_id, get_report_job(job_id))
+        payload['reused'] = reused
+        return Response(payload, status=status.HTTP_200_OK if reused else status.HTTP_202_ACCEPTED)
+
+class ReportJobDetailView(APIView):
+    def get(self, request, job_id, format=None):
+        result = get_report_job(job_id)
+        if result is None:
+            return Response({'error': 'Report job not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_report_job_payload(request, job_id, result), status=status.HTTP_200_OK)
+
+class ReportJobDownloadView(APIView):
+    def get(self, request, job_id, format=None):
+        result = get_report_job(job_id)
+        if result is None or result.state != states.SUCCESS:
+            return Response({'error': 'Report job not found or not finished.'}, status=status.HTTP_404_NOT_FOUND)
+        path = report_file_path(result.result)
+        if path is None:
+            return Response({'error': 'The report file is no longer available.'}, status=status.HTTP_410_GONE)
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name, content_type=result.result['content_type'])